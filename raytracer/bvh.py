@@ -0,0 +1,430 @@
+import raytracer.shape
+from raytracer.cartesian import *
+
+"""A bounding volume hierarchy (BVH) for finding the shapes a ray may
+intersect. Unlike the octree, each shape is stored in exactly one leaf, and
+the boxes of sibling nodes may overlap. The hierarchy is built top-down,
+splitting each node where the surface area heuristic (SAH) estimates the
+lowest cost of testing a ray against both children.
+
+When shapes move, the hierarchy can be refitted rather than built again:
+the nodes are kept, and their bounds recomputed from the shapes' new
+bounding boxes. Refitting is much quicker than building, but the nodes were
+chosen for where the shapes were, so the tree gets worse as shapes move
+further. The SAH cost of the tree is kept from when it was built, and
+compared with the cost after each refit to judge when to build it again.
+
+Shapes without a bounding box cannot be placed in the hierarchy, and are
+returned for every ray.
+
+A node is a list with the following elements:
+
+* the string 'bvh_node'
+* a tuple of the node's bounds: (min_x, min_y, min_z, max_x, max_y, max_z)
+* the left child node, or None for a leaf
+* the right child node, or None for a leaf
+* a list of the shapes in a leaf, or None for an interior node
+"""
+
+BVH_NODE_BOUNDS = 1
+BVH_NODE_LEFT = 2
+BVH_NODE_RIGHT = 3
+BVH_NODE_SHAPES = 4
+
+# Number of bins used for evaluating split positions on each axis
+BVH_SAH_BINS = 16
+
+# Cost of traversing a node, relative to the cost of testing a shape
+BVH_TRAVERSAL_COST = 0.5
+
+BVH_INFINITY = float('inf')
+
+# Ratio of the SAH cost of a refitted tree to its cost when built, above
+# which the tree should be built again
+BVH_REFIT_MAX_COST_RATIO = 1.5
+
+
+def bvh_ray_inverse_direction(ray):
+    """Returns the reciprocal of each component of a ray's direction, as
+    used by bvh_slab_test.
+
+    :param ray: a ray
+    :return: a tuple of the X, Y and Z reciprocals. A component of 0 gives
+             infinity.
+    """
+    return ray_inverse_direction(ray)[0]
+
+
+def bvh_slab_test(bounds, start, inverse_direction):
+    """Tests a ray against an axis-aligned box, using the slab method.
+
+    :param bounds: the box, as (min_x, min_y, min_z, max_x, max_y, max_z)
+    :param start: the start point of the ray, a cartesian
+    :param inverse_direction: the ray's inverse direction, from
+                              bvh_ray_inverse_direction
+    :return: the distance along the ray at which it enters the box (0 if the
+             ray starts inside the box), or None if the ray misses the box
+    """
+    signs = tuple(1 if inverse < 0 else 0 for inverse in inverse_direction)
+    return ray_box_entry(bounds, 0, start, inverse_direction, signs)
+
+
+def bvh_surface_area(bounds):
+    """Returns the surface area of a box.
+
+    :param bounds: the box, as (min_x, min_y, min_z, max_x, max_y, max_z)
+    :return: the surface area
+    """
+    dx = bounds[3] - bounds[0]
+    dy = bounds[4] - bounds[1]
+    dz = bounds[5] - bounds[2]
+    return 2 * ((dx * dy) + (dy * dz) + (dz * dx))
+
+
+def bvh_union(bounds_list):
+    """Returns the box enclosing a list of boxes.
+
+    :param bounds_list: a list of boxes
+    :return: a box, as (min_x, min_y, min_z, max_x, max_y, max_z)
+    """
+    return (min(bounds[0] for bounds in bounds_list),
+            min(bounds[1] for bounds in bounds_list),
+            min(bounds[2] for bounds in bounds_list),
+            max(bounds[3] for bounds in bounds_list),
+            max(bounds[4] for bounds in bounds_list),
+            max(bounds[5] for bounds in bounds_list))
+
+
+def bvh_shape_bounds(shape):
+    """Returns the bounding box of a shape as a BVH box.
+
+    :param shape: a shape
+    :return: a box, as (min_x, min_y, min_z, max_x, max_y, max_z), or None if
+             the shape has no bounding box
+    """
+    box = raytracer.shape.shape_bounding_box(shape)
+    if box is None:
+        return None
+
+    return (box.min_x, box.min_y, box.min_z, box.max_x, box.max_y, box.max_z)
+
+
+def bvh_node_refit(node, bounds_func=bvh_shape_bounds):
+    """Recomputes the bounds of a node and the nodes below it from the
+    current bounding boxes of their shapes, keeping the hierarchy as it is.
+
+    :param node: a BVH node
+    :param bounds_func: a function returning the box of a shape, or None
+    :return: True if the node was refitted, or False if one of its shapes no
+             longer has a bounding box
+    """
+    if node[BVH_NODE_SHAPES] is not None:
+        bounds_list = []
+        for shape in node[BVH_NODE_SHAPES]:
+            bounds = bounds_func(shape)
+            if bounds is None:
+                return False
+            bounds_list.append(bounds)
+    else:
+        if not bvh_node_refit(node[BVH_NODE_LEFT], bounds_func) or \
+                not bvh_node_refit(node[BVH_NODE_RIGHT], bounds_func):
+            return False
+        bounds_list = (node[BVH_NODE_LEFT][BVH_NODE_BOUNDS],
+                       node[BVH_NODE_RIGHT][BVH_NODE_BOUNDS])
+
+    node[BVH_NODE_BOUNDS] = bvh_union(bounds_list)
+    return True
+
+
+def bvh_node_cost(node):
+    """Returns the SAH cost of testing a ray against a node and the nodes
+    below it, given the ray hits the node. A child is entered in proportion
+    to its surface area relative to the node's.
+
+    :param node: a BVH node
+    :return: the cost, relative to the cost of testing a shape
+    """
+    if node[BVH_NODE_SHAPES] is not None:
+        return len(node[BVH_NODE_SHAPES])
+
+    area = bvh_surface_area(node[BVH_NODE_BOUNDS])
+    left = node[BVH_NODE_LEFT]
+    right = node[BVH_NODE_RIGHT]
+    if area <= 0:
+        return BVH_TRAVERSAL_COST + bvh_node_cost(left) + bvh_node_cost(right)
+
+    return BVH_TRAVERSAL_COST + (
+        (bvh_surface_area(left[BVH_NODE_BOUNDS]) * bvh_node_cost(left)) +
+        (bvh_surface_area(right[BVH_NODE_BOUNDS]) * bvh_node_cost(right))
+    ) / area
+
+
+def bvh_node_create(items, max_leaf_shapes):
+    """Builds a node of a BVH, and the nodes below it.
+
+    :param items: a list of (shape, bounds, centre) tuples
+    :param max_leaf_shapes: the number of shapes below which a node is
+                            never split
+    :return: a BVH node
+    """
+    bounds = bvh_union([item[1] for item in items])
+    leaf = ['bvh_node', bounds, None, None, [item[0] for item in items]]
+
+    if len(items) <= max_leaf_shapes:
+        return leaf
+
+    split = bvh_sah_split(items, bounds)
+    if split is None:
+        return leaf
+
+    axis, position = split
+    left_items = [item for item in items if item[2][axis] < position]
+    right_items = [item for item in items if item[2][axis] >= position]
+    if len(left_items) == 0 or len(right_items) == 0:
+        return leaf
+
+    return ['bvh_node', bounds,
+            bvh_node_create(left_items, max_leaf_shapes),
+            bvh_node_create(right_items, max_leaf_shapes), None]
+
+
+def bvh_sah_split(items, bounds):
+    """Finds the split of a node with the lowest SAH cost. Shape centres are
+    sorted into bins on each axis, and each boundary between bins is
+    evaluated as a split position.
+
+    :param items: a list of (shape, bounds, centre) tuples
+    :param bounds: the bounds of the node
+    :return: a tuple of the axis and position to split at, or None if no
+             split is cheaper than testing every shape in the node
+    """
+    area = bvh_surface_area(bounds)
+    best_cost = len(items)
+    best_split = None
+
+    for axis in range(0, 3):
+        centre_min = min(item[2][axis] for item in items)
+        centre_max = max(item[2][axis] for item in items)
+        if centre_max <= centre_min:
+            continue
+
+        bin_width = (centre_max - centre_min) / BVH_SAH_BINS
+        bins = [[] for i in range(BVH_SAH_BINS)]
+        for item in items:
+            index = int((item[2][axis] - centre_min) / bin_width)
+            bins[min(index, BVH_SAH_BINS - 1)].append(item[1])
+
+        # sweep from the right to get the area and count of each right side
+        right_areas = [0] * BVH_SAH_BINS
+        right_counts = [0] * BVH_SAH_BINS
+        right_bounds = None
+        count = 0
+        for index in range(BVH_SAH_BINS - 1, 0, -1):
+            if len(bins[index]) > 0:
+                bin_bounds = bvh_union(bins[index])
+                right_bounds = bin_bounds if right_bounds is None else \
+                    bvh_union((right_bounds, bin_bounds))
+                count += len(bins[index])
+            if right_bounds is not None:
+                right_areas[index] = bvh_surface_area(right_bounds)
+            right_counts[index] = count
+
+        left_bounds = None
+        count = 0
+        for index in range(0, BVH_SAH_BINS - 1):
+            if len(bins[index]) > 0:
+                bin_bounds = bvh_union(bins[index])
+                left_bounds = bin_bounds if left_bounds is None else \
+                    bvh_union((left_bounds, bin_bounds))
+                count += len(bins[index])
+
+            right_count = right_counts[index + 1]
+            if count == 0 or right_count == 0:
+                continue
+
+            if area > 0:
+                cost = BVH_TRAVERSAL_COST + (
+                    (bvh_surface_area(left_bounds) * count) +
+                    (right_areas[index + 1] * right_count)) / area
+            else:
+                cost = BVH_TRAVERSAL_COST + max(count, right_count)
+
+            if cost < best_cost:
+                best_cost = cost
+                best_split = (axis, centre_min + (bin_width * (index + 1)))
+
+    return best_split
+
+
+class BVH(object):
+    """A bounding volume hierarchy of shapes."""
+
+    def __init__(self, shapes, max_leaf_shapes=4, bounds_func=None):
+        """Class constructor. Builds the hierarchy.
+
+        :param shapes: a list of shapes. The bounding box of each shape, as
+                       returned by shape_bounding_box, must be in the same
+                       space as the rays that will be tested.
+        :param max_leaf_shapes: the number of shapes below which a node is
+                                never split
+        :param bounds_func: a function returning the box of a shape, as
+                            bvh_shape_bounds does, or None to use
+                            bvh_shape_bounds. Allows the hierarchy to hold
+                            primitives that are not shapes, such as the
+                            face numbers of a polygon mesh.
+        """
+        self.unbounded_shapes = []
+        self.bounds_func = bounds_func or bvh_shape_bounds
+        items = []
+
+        for shape in shapes:
+            bounds = self.bounds_func(shape)
+            if bounds is None:
+                self.unbounded_shapes.append(shape)
+                continue
+
+            items.append((shape, bounds, ((bounds[0] + bounds[3]) / 2.0,
+                                          (bounds[1] + bounds[4]) / 2.0,
+                                          (bounds[2] + bounds[5]) / 2.0)))
+
+        if len(items) > 0:
+            self.root = bvh_node_create(items, max_leaf_shapes)
+        else:
+            self.root = None
+
+        self.build_cost = self.get_cost()
+
+    def get_cost(self):
+        """Returns the SAH cost of the hierarchy, an estimate of the number
+        of shapes tested for a ray that hits the root node.
+
+        :return: the cost
+        """
+        if self.root is None:
+            return 0
+
+        return bvh_node_cost(self.root)
+
+    def refit(self):
+        """Recomputes the bounds of every node from the current bounding
+        boxes of the shapes, keeping the hierarchy as it was built. Used
+        when shapes have moved, but none have been added or removed.
+
+        :return: the ratio of the SAH cost of the refitted hierarchy to its
+                 cost when built, or None if a shape has gained or lost its
+                 bounding box and the hierarchy must be built again
+        """
+        for shape in self.unbounded_shapes:
+            if self.bounds_func(shape) is not None:
+                return None
+
+        if self.root is None:
+            return 1.0
+
+        if not bvh_node_refit(self.root, self.bounds_func):
+            return None
+
+        if self.build_cost <= 0:
+            return 1.0
+
+        return self.get_cost() / self.build_cost
+
+    def get_shapes_by_ray(self, ray):
+        """Returns the shapes whose bounding boxes are intersected by a ray,
+        and the shapes without bounding boxes.
+
+        :param ray: the ray
+        :return: a list of shapes
+        """
+        shapes = list(self.unbounded_shapes)
+        if self.root is None:
+            return shapes
+
+        start = ray[RAY_START]
+        inverse_direction, signs = ray_inverse_direction(ray)
+        stack = [self.root]
+
+        while len(stack) > 0:
+            node = stack.pop()
+            if ray_box_entry(node[BVH_NODE_BOUNDS], 0, start,
+                             inverse_direction, signs) is None:
+                continue
+
+            if node[BVH_NODE_SHAPES] is not None:
+                shapes += node[BVH_NODE_SHAPES]
+            else:
+                stack.append(node[BVH_NODE_RIGHT])
+                stack.append(node[BVH_NODE_LEFT])
+
+        return shapes
+
+    def get_nearest_hit(self, ray, intersect_func):
+        """Finds the nearest intersection of a ray with the shapes.
+        Nodes are visited front to back, and nodes that the ray enters
+        beyond the nearest intersection found so far are skipped.
+
+        :param ray: the ray
+        :param intersect_func: a function taking a shape and a ray, and
+                               returning a dictionary of intersection
+                               results or False
+        :return: a tuple of the nearest intersection result and the shape it
+                 is with, or (False, None) if there is no intersection
+        """
+        nearest_result = False
+        nearest_shape = None
+        nearest_t = BVH_INFINITY
+
+        for shape in self.unbounded_shapes:
+            result = intersect_func(shape, ray)
+            if result is not False and 0 < result['t'] < nearest_t:
+                nearest_result = result
+                nearest_shape = shape
+                nearest_t = result['t']
+
+        if self.root is None:
+            return nearest_result, nearest_shape
+
+        start = ray[RAY_START]
+        inverse_direction, signs = ray_inverse_direction(ray)
+        root_t = ray_box_entry(self.root[BVH_NODE_BOUNDS], 0, start,
+                               inverse_direction, signs)
+        if root_t is None:
+            return nearest_result, nearest_shape
+
+        stack = [(root_t, self.root)]
+
+        while len(stack) > 0:
+            entry_t, node = stack.pop()
+            if entry_t > nearest_t:
+                continue
+
+            if node[BVH_NODE_SHAPES] is not None:
+                for shape in node[BVH_NODE_SHAPES]:
+                    result = intersect_func(shape, ray)
+                    if result is not False and 0 < result['t'] < nearest_t:
+                        nearest_result = result
+                        nearest_shape = shape
+                        nearest_t = result['t']
+                continue
+
+            left = node[BVH_NODE_LEFT]
+            right = node[BVH_NODE_RIGHT]
+            left_t = ray_box_entry(left[BVH_NODE_BOUNDS], 0, start,
+                                   inverse_direction, signs)
+            right_t = ray_box_entry(right[BVH_NODE_BOUNDS], 0, start,
+                                    inverse_direction, signs)
+
+            # push the farther child first, so the nearer is visited first
+            if left_t is not None and right_t is not None:
+                if left_t <= right_t:
+                    stack.append((right_t, right))
+                    stack.append((left_t, left))
+                else:
+                    stack.append((left_t, left))
+                    stack.append((right_t, right))
+            elif left_t is not None:
+                stack.append((left_t, left))
+            elif right_t is not None:
+                stack.append((right_t, right))
+
+        return nearest_result, nearest_shape
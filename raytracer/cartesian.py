@@ -1,8 +1,4 @@
-try:
-    from gmpy2 import *
-except ImportError:
-    from math import *
-    from raytracer.mpfr_dummy import *
+from raytracer.precision import *
 
 """Functions for dealing with cartesian values and rays.
 A cartesian is stored as a tuple, with the first element being the
@@ -57,7 +53,7 @@ def cartesian_copy(c):
     :param c: a cartesian to copy
     :return: a copy of empty_shape
     """
-    return ('cartesian', c[1], c[2], c[3], c[4], c[5])
+    return ('cartesian', c[1], c[2], c[3])
 
 
 def cartesian_add(c1, c2):
@@ -119,10 +115,8 @@ def cartesian_normalise(c):
         :param c: a cartesian
         :return: a normalised cartesian
     """
-    return cartesian_scale(c, mpfr(1.0) /
-                           sqrt((c[1] * c[1]) +
-                                (c[2] * c[2]) +
-                                (c[3] * c[3])))
+    scale = 1.0 / sqrt((c[1] * c[1]) + (c[2] * c[2]) + (c[3] * c[3]))
+    return ('cartesian', c[1] * scale, c[2] * scale, c[3] * scale)
 
 
 def cartesian_cross(c1, c2):
@@ -187,7 +181,7 @@ def ray_scale(ray, scale):
                  start point as the given ray, and the vector from the
                  given ray but scaled by the given amount
         """
-    return ('ray', ray[1], vector_scale(ray[2], scale), ray[3])
+    return ('ray', ray[1], cartesian_scale(ray[2], scale), ray[3])
 
 
 def ray_is_shadow(ray):
@@ -211,9 +205,11 @@ def ray_calc_pt(ray, t):
     :return: a cartesian, calculated by the expression
              ray start + (ray vector * t)
     """
-    return ('cartesian', ray[1][1] + (ray[2][1] * t),
-            ray[1][2] + (ray[2][2] * t),
-            ray[1][3] + (ray[2][3] * t), None, None)
+    start = ray[1]
+    direction = ray[2]
+    return ('cartesian', start[1] + (direction[1] * t),
+            start[2] + (direction[2] * t),
+            start[3] + (direction[3] * t))
 
 
 def ray_reflect_vector(incident_ray, normal):
@@ -228,10 +224,70 @@ def ray_reflect_vector(incident_ray, normal):
     
     ri_dot_n = cartesian_dot(ir, normal)
     twoN_expr = cartesian_scale(normal, 2 * ri_dot_n)
-    reflected_ray = cartesian_sub(twoN_expr, ir )            
+    reflected_ray = cartesian_sub(twoN_expr, ir )
 
     return reflected_ray
 
+
+def ray_inverse_direction(ray):
+    """Returns the values needed for testing a ray against axis-aligned
+    boxes with ray_box_entry. They are computed once per ray, and reused for
+    every box tested.
+
+    :param ray: a ray tuple
+    :return: a tuple of the reciprocal of each component of the ray's
+             direction (infinity for a component of 0), and a tuple with a
+             sign bit for each component, 1 where the ray runs in the
+             negative direction
+    """
+    inverse = []
+    for component in ray[RAY_DIR][1:4]:
+        if component == 0:
+            inverse.append(float('inf'))
+        else:
+            inverse.append(1.0 / component)
+
+    return (tuple(inverse),
+            tuple(1 if component < 0 else 0 for component in inverse))
+
+
+def ray_box_entry(bounds, offset, start, inverse_direction, signs):
+    """Tests a ray against an axis-aligned box, using the slab method. The
+    sign bits select the near and far plane on each axis, so no comparison
+    or swap is needed to order them.
+
+    :param bounds: a sequence holding the box as min_x, min_y, min_z, max_x,
+                   max_y, max_z
+    :param offset: the position of the box's min_x in bounds
+    :param start: the start point of the ray, a cartesian
+    :param inverse_direction: the ray's inverse direction, from
+                              ray_inverse_direction
+    :param signs: the ray's sign bits, from ray_inverse_direction
+    :return: the distance along the ray at which it enters the box (0 if the
+             ray starts inside it), or None if the ray misses the box
+    """
+    t_near = 0
+    t_far = float('inf')
+
+    for axis in range(0, 3):
+        near = offset + axis + 3 * signs[axis]
+        far = offset + axis + 3 - 3 * signs[axis]
+        origin = start[axis + 1]
+        inverse = inverse_direction[axis]
+
+        # a ray parallel to the slab and starting on one of its planes gives
+        # nan, which fails both comparisons and so counts as inside
+        t1 = (bounds[near] - origin) * inverse
+        t2 = (bounds[far] - origin) * inverse
+        if t1 > t_near:
+            t_near = t1
+        if t2 < t_far:
+            t_far = t2
+        if t_near > t_far:
+            return None
+
+    return t_near
+
 def lineseg2d_create(start, end):
     """Creates a lineseg2d tuple
     """
@@ -1,8 +1,4 @@
-try:
-    from gmpy2 import *
-except ImportError:
-    from math import *
-    from raytracer.mpfr_dummy import *
+from raytracer.precision import *
 
 """Functions for dealing with colours.
 
@@ -0,0 +1,356 @@
+from array import array
+from raytracer.cartesian import *
+from raytracer.bvh import *
+from raytracer.oct_tree import *
+from raytracer.render_stats import *
+
+"""Flattened acceleration structures. An octree or BVH is compiled, once it
+has been built, into a few contiguous arrays, and traversed with an explicit
+stack of node numbers. Traversal needs no node objects, bounding boxes or
+points, and the arrays are much smaller and quicker to pickle than the tree
+they were compiled from.
+
+A flat tree is a list with the following elements:
+
+* the string 'flat_tree'
+* an array('d') of node bounds, six for each node:
+  min_x, min_y, min_z, max_x, max_y, max_z
+* an array('i') with the position of each node's first child in the child
+  array
+* an array('i') with the number of children of each node
+* an array('i') of child node numbers
+* an array('i') with the position of each node's first primitive in the
+  primitive array
+* an array('i') with the number of primitives of each node
+* an array('i') of primitive numbers, indexing the list of shapes
+* the list of shapes
+* a list of shapes to return for every ray, such as shapes without a
+  bounding box
+* True if a shape may be stored in more than one node, as in an octree
+
+Node 0 is the root. A tree with no nodes has empty arrays.
+"""
+
+FLAT_TREE_BOUNDS = 1
+FLAT_TREE_CHILD_START = 2
+FLAT_TREE_CHILD_COUNT = 3
+FLAT_TREE_CHILDREN = 4
+FLAT_TREE_PRIMITIVE_START = 5
+FLAT_TREE_PRIMITIVE_COUNT = 6
+FLAT_TREE_PRIMITIVES = 7
+FLAT_TREE_SHAPES = 8
+FLAT_TREE_UNBOUNDED_SHAPES = 9
+FLAT_TREE_DUPLICATES = 10
+
+
+def flat_tree_create():
+    """Returns an empty flat tree.
+
+    :return: a flat tree list
+    """
+    return ['flat_tree', array('d'), array('i'), array('i'), array('i'),
+            array('i'), array('i'), array('i'), [], [], False]
+
+
+def flat_tree_add_nodes(tree, nodes, get_bounds, get_children, get_shapes):
+    """Adds the nodes of a tree to a flat tree, breadth first, so the
+    children of each node are stored together.
+
+    :param tree: the flat tree
+    :param nodes: a list with the root node of the tree
+    :param get_bounds: a function returning the bounds of a node
+    :param get_children: a function returning the list of a node's children
+    :param get_shapes: a function returning the list of a node's shapes
+    """
+    shape_numbers = {}
+    queue = list(nodes)
+    position = 0
+
+    while position < len(queue):
+        node = queue[position]
+        position += 1
+
+        tree[FLAT_TREE_BOUNDS].extend(get_bounds(node))
+
+        children = get_children(node)
+        tree[FLAT_TREE_CHILD_START].append(len(tree[FLAT_TREE_CHILDREN]))
+        tree[FLAT_TREE_CHILD_COUNT].append(len(children))
+        for child in children:
+            tree[FLAT_TREE_CHILDREN].append(len(queue))
+            queue.append(child)
+
+        shapes = get_shapes(node)
+        tree[FLAT_TREE_PRIMITIVE_START].append(
+            len(tree[FLAT_TREE_PRIMITIVES]))
+        tree[FLAT_TREE_PRIMITIVE_COUNT].append(len(shapes))
+        for shape in shapes:
+            if id(shape) not in shape_numbers:
+                shape_numbers[id(shape)] = len(tree[FLAT_TREE_SHAPES])
+                tree[FLAT_TREE_SHAPES].append(shape)
+            tree[FLAT_TREE_PRIMITIVES].append(shape_numbers[id(shape)])
+
+
+def flat_tree_from_bvh(bvh):
+    """Compiles a BVH into a flat tree.
+
+    :param bvh: a BVH object
+    :return: a flat tree
+    """
+    tree = flat_tree_create()
+    tree[FLAT_TREE_UNBOUNDED_SHAPES] = list(bvh.unbounded_shapes)
+
+    if bvh.root is not None:
+        flat_tree_add_nodes(
+            tree, [bvh.root],
+            lambda node: node[BVH_NODE_BOUNDS],
+            lambda node: [] if node[BVH_NODE_SHAPES] is not None else
+            [node[BVH_NODE_LEFT], node[BVH_NODE_RIGHT]],
+            lambda node: node[BVH_NODE_SHAPES] or [])
+
+    return tree
+
+
+def flat_tree_octree_children(node):
+    """Returns the children of an octree node, as a list.
+
+    :param node: an OctTreeLeaf or OctTreeBranch
+    :return: a list of nodes
+    """
+    if not isinstance(node, OctTreeBranch):
+        return []
+
+    return [node.children[i][j][k]
+            for i in range(0, 2) for j in range(0, 2) for k in range(0, 2)]
+
+
+def flat_tree_from_octree(octree):
+    """Compiles an octree into a flat tree. The shapes stored at the top
+    node of a branching octree are returned for every ray, as is done by
+    OctTreeBranch.get_shapes_by_ray.
+
+    The bounds of each node are grown by the node's margin, as is done when
+    the octree itself is traversed.
+
+    :param octree: the top node of the octree
+    :return: a flat tree
+    """
+    tree = flat_tree_create()
+    tree[FLAT_TREE_DUPLICATES] = True
+
+    if isinstance(octree, OctTreeBranch):
+        tree[FLAT_TREE_UNBOUNDED_SHAPES] = list(octree.shapes)
+        top_shapes = lambda node: [] if node is octree else node.shapes
+    else:
+        top_shapes = lambda node: node.shapes
+
+    flat_tree_add_nodes(
+        tree, [octree],
+        lambda node: (node.bounding_box.min_x - float(node.margin),
+                      node.bounding_box.min_y - float(node.margin),
+                      node.bounding_box.min_z - float(node.margin),
+                      node.bounding_box.max_x + float(node.margin),
+                      node.bounding_box.max_y + float(node.margin),
+                      node.bounding_box.max_z + float(node.margin)),
+        flat_tree_octree_children, top_shapes)
+
+    return tree
+
+
+def flat_tree_replace_shapes(tree, replace):
+    """Returns a copy of a flat tree holding other shapes in place of its
+    own, such as copies of them. The node arrays are shared with the tree.
+
+    :param tree: a flat tree
+    :param replace: a function returning the shape to hold in place of a
+                    shape of the tree
+    :return: a flat tree
+    """
+    tree = list(tree)
+    tree[FLAT_TREE_SHAPES] = [replace(shape)
+                              for shape in tree[FLAT_TREE_SHAPES]]
+    tree[FLAT_TREE_UNBOUNDED_SHAPES] = [
+        replace(shape) for shape in tree[FLAT_TREE_UNBOUNDED_SHAPES]]
+    return tree
+
+
+def flat_tree_get_shapes_by_ray(tree, ray):
+    """Returns the shapes stored in the nodes intersected by a ray, and the
+    shapes returned for every ray.
+
+    :param tree: the flat tree
+    :param ray: the ray
+    :return: a list of shapes
+    """
+    shapes = list(tree[FLAT_TREE_UNBOUNDED_SHAPES])
+    if len(tree[FLAT_TREE_CHILD_COUNT]) == 0:
+        return shapes
+
+    bounds = tree[FLAT_TREE_BOUNDS]
+    child_start = tree[FLAT_TREE_CHILD_START]
+    child_count = tree[FLAT_TREE_CHILD_COUNT]
+    children = tree[FLAT_TREE_CHILDREN]
+    primitive_start = tree[FLAT_TREE_PRIMITIVE_START]
+    primitive_count = tree[FLAT_TREE_PRIMITIVE_COUNT]
+    primitives = tree[FLAT_TREE_PRIMITIVES]
+
+    start = ray[RAY_START]
+    inverse_direction, signs = ray_inverse_direction(ray)
+    numbers = []
+    stack = [0]
+    visited = 0
+
+    while len(stack) > 0:
+        node = stack.pop()
+        visited += 1
+        if ray_box_entry(bounds, node * 6, start, inverse_direction,
+                         signs) is None:
+            continue
+
+        first = primitive_start[node]
+        numbers.extend(primitives[first:first + primitive_count[node]])
+
+        first = child_start[node]
+        stack.extend(children[first:first + child_count[node]])
+
+    render_stats_add_nodes(visited)
+    if tree[FLAT_TREE_DUPLICATES]:
+        numbers = dict.fromkeys(numbers)
+
+    tree_shapes = tree[FLAT_TREE_SHAPES]
+    shapes += [tree_shapes[number] for number in numbers]
+    return shapes
+
+
+def flat_tree_get_nearest_hit(tree, ray, intersect_func, stop_t=None,
+                              max_t=None):
+    """Finds the nearest intersection of a ray with the shapes of a flat
+    tree. Children are visited in order of the distance at which the ray
+    enters them, and traversal stops at any node the ray enters beyond the
+    nearest intersection found so far. A shape stored in several nodes is
+    only tested once.
+
+    :param tree: the flat tree
+    :param ray: the ray
+    :param intersect_func: a function taking a shape and a ray, and returning
+                           a dictionary of intersection results or False
+    :param stop_t: if given, the first intersection found with t no greater
+                   than stop_t is returned, even if it is not the nearest
+                   and even if it is at max_t. Used for shadow rays, which
+                   only need to know whether anything lies between their
+                   start and end, both included.
+    :param max_t: if given, only intersections nearer than max_t are
+                  returned, and no node entered beyond max_t is visited.
+                  Used when a hit at max_t has already been found by other
+                  means.
+    :return: a tuple of the nearest intersection result and the shape it is
+             with, or (False, None) if there is no intersection
+    """
+    nearest_result = False
+    nearest_shape = None
+    nearest_t = BVH_INFINITY if max_t is None else max_t
+    # intersections are never at t <= 0, so no search stops early without one
+    if stop_t is None:
+        stop_t = 0
+
+    for shape in tree[FLAT_TREE_UNBOUNDED_SHAPES]:
+        result = intersect_func(shape, ray)
+        if result is False or result['t'] <= 0:
+            continue
+        if result['t'] <= stop_t:
+            return result, shape
+        if result['t'] < nearest_t:
+            nearest_result = result
+            nearest_shape = shape
+            nearest_t = result['t']
+
+    if len(tree[FLAT_TREE_CHILD_COUNT]) == 0:
+        return nearest_result, nearest_shape
+
+    bounds = tree[FLAT_TREE_BOUNDS]
+    child_start = tree[FLAT_TREE_CHILD_START]
+    child_count = tree[FLAT_TREE_CHILD_COUNT]
+    children = tree[FLAT_TREE_CHILDREN]
+    primitive_start = tree[FLAT_TREE_PRIMITIVE_START]
+    primitive_count = tree[FLAT_TREE_PRIMITIVE_COUNT]
+    primitives = tree[FLAT_TREE_PRIMITIVES]
+    shapes = tree[FLAT_TREE_SHAPES]
+
+    start = ray[RAY_START]
+    inverse_direction, signs = ray_inverse_direction(ray)
+
+    root_t = ray_box_entry(bounds, 0, start, inverse_direction, signs)
+    if root_t is None:
+        return nearest_result, nearest_shape
+
+    # parallel stacks of node numbers and the distances to enter them
+    stack = [0]
+    stack_t = [root_t]
+    tested = set() if tree[FLAT_TREE_DUPLICATES] else None
+    visited = 0
+
+    while len(stack) > 0:
+        node = stack.pop()
+        if stack_t.pop() > nearest_t:
+            continue
+        visited += 1
+
+        first = primitive_start[node]
+        for position in range(first, first + primitive_count[node]):
+            number = primitives[position]
+            if tested is not None:
+                if number in tested:
+                    continue
+                tested.add(number)
+
+            shape = shapes[number]
+            result = intersect_func(shape, ray)
+            if result is False or result['t'] <= 0:
+                continue
+            if result['t'] <= stop_t:
+                render_stats_add_nodes(visited)
+                return result, shape
+            if result['t'] < nearest_t:
+                nearest_result = result
+                nearest_shape = shape
+                nearest_t = result['t']
+
+        count = child_count[node]
+        if count == 0:
+            continue
+
+        first = child_start[node]
+        if count == 2:
+            # the common case of a BVH node, without building a list
+            left = children[first]
+            right = children[first + 1]
+            left_t = ray_box_entry(bounds, left * 6, start,
+                                   inverse_direction, signs)
+            right_t = ray_box_entry(bounds, right * 6, start,
+                                    inverse_direction, signs)
+            if left_t is not None and right_t is not None and \
+                    right_t < left_t:
+                left, right = right, left
+                left_t, right_t = right_t, left_t
+            if right_t is not None:
+                stack.append(right)
+                stack_t.append(right_t)
+            if left_t is not None:
+                stack.append(left)
+                stack_t.append(left_t)
+            continue
+
+        entries = []
+        for child in children[first:first + count]:
+            child_t = ray_box_entry(bounds, child * 6, start,
+                                    inverse_direction, signs)
+            if child_t is not None and child_t <= nearest_t:
+                entries.append((child_t, child))
+
+        # push the farthest child first, so the nearest is visited first
+        entries.sort(reverse=True)
+        for child_t, child in entries:
+            stack.append(child)
+            stack_t.append(child_t)
+
+    render_stats_add_nodes(visited)
+    return nearest_result, nearest_shape
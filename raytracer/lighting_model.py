@@ -34,7 +34,9 @@ LIGHTINGMODEL_MAXREFLECT = 4
 LIGHTINGMODEL_OPTIONS = 5
 
 
-def lightingmodel_set_options(lighting_model, options={}):
+def lightingmodel_set_options(lighting_model, options=None):
+    if options is None:
+        options = {}
     if 'NormalOffset' not in options:
         options['NormalOffset'] = mpfr(".0001")
     
@@ -68,7 +70,7 @@ def lightingmodel_basic_calculate(lighting_model, scene_obj, result):
         # result['normal'] = cartesian_sub(('c',0,0,0), result['normal'])
     else:
 
-        shift = mpfr(0) - lighting_model[LIGHTINGMODEL_OPTIONS]['NormalOffset']
+        shift = 0 - lighting_model[LIGHTINGMODEL_OPTIONS]['NormalOffset']
     
     if not 'point' in result:
         result['point'] = ray_calc_pt(result['ray'], result['t'] )
@@ -84,71 +86,42 @@ def lightingmodel_basic_calculate(lighting_model, scene_obj, result):
 
 
 
-    lights = scene_obj.get_lights()
+    lights = scene_obj.get_light_list()
 
 
     diffuse_colour = shape_get_colour(result, SHAPE_DIFFUSECOLOUR)
     diffuse_colour_total = ('colour', 0, 0, 0)
 
-    for l in lights:
-        light = lights[l]
+    for light in lights:
         
         
             
         #shadow calculation
-        
-        if ('NoShadows' in lighting_model[LIGHTINGMODEL_OPTIONS] and
-                lighting_model[LIGHTINGMODEL_OPTIONS]['NoShadows'] is True):
-            r = False
-        else:
-            #import pdb; pdb.set_trace();
-            shadow_ray = ray_create(rs, cartesian_sub(
-                light[LIGHT_POINT_POINT], rs), True)            
-            shadow_result = scene_obj.test_intersect(shadow_ray)
-
-        has_shadow = (type(shadow_result) is dict and
-            't' in shadow_result and
-            shadow_result['t'] <= 1)
-    
+        has_shadow = False
         in_complete_shadow = False
         shadow_factor = ('colour', 1,1,1)
-        if has_shadow:    
-            all_shadow_results = {shadow_result['t']: shadow_result}
-
-            if 'all_results' in shadow_result:
-                all_shadow_results.update(shadow_result['all_results'])
-                del (shadow_result['all_results'])
 
-            for result_key in sorted(all_shadow_results.keys()):
-                shadow_result_item = \
-                        all_shadow_results[result_key]
-
-                if shadow_result_item['t'] <= 1:
-
-                    shadow_result_item_transparency_colour = \
-                        shape_get_colour(shadow_result_item, 'transparency')
-
-                    shadow_factor = \
-                        colour_mul(
-                            shadow_factor,
-                            shadow_result_item_transparency_colour
-                        )
+        if not ('NoShadows' in lighting_model[LIGHTINGMODEL_OPTIONS] and
+                lighting_model[LIGHTINGMODEL_OPTIONS]['NoShadows'] is True):
+            shadow_ray = ray_create(rs, cartesian_sub(
+                light[LIGHT_POINT_POINT], rs), True)
+            render_stats_add_rays('shadow')
+            occlusion = scene_obj.test_occlusion(shadow_ray)
 
-                    if (shadow_factor[1] <=0 and \
-                        shadow_factor[2] <=0 and \
-                        shadow_factor[3] <=0):
-                        in_complete_shadow = True
-                        
-            
-                
-            if (shadow_factor[1] >=1 and \
-                shadow_factor[2] >=1 and \
-                shadow_factor[3] >=1):
-                has_shadow = False
+            if occlusion is not None:
+                has_shadow = True
+                shadow_factor = occlusion
 
-        if not has_shadow:
-            in_complete_shadow = False
+                if (shadow_factor[1] <=0 and \
+                    shadow_factor[2] <=0 and \
+                    shadow_factor[3] <=0):
+                    in_complete_shadow = True
 
+                if (shadow_factor[1] >=1 and \
+                    shadow_factor[2] >=1 and \
+                    shadow_factor[3] >=1):
+                    has_shadow = False
+                    in_complete_shadow = False
 
         #diffuse calucation
         if not in_complete_shadow:
@@ -225,6 +198,7 @@ def lightingmodel_basic_transparency_diffuse(lighting_model, scene_obj, result):
         next_result = result['all_results'][next_result_t]
         del (result['all_results'][next_result_t])
         next_result['all_results'] = result['all_results']
+        render_stats_add_rays('transparency')
         next_result_colour = lightingmodel_basic_calculate(
             lighting_model, scene_obj, next_result)
         transparency_colour_inv = ('colour',
@@ -304,6 +278,7 @@ def lightingmodel_basic_reflections(lighting_model, scene_obj, result, rs):
     if (doReflections):
         reflected_dir = ray_reflect_vector(result['ray'], result['normal'])
         reflected_ray = ('ray', rs, reflected_dir, False)     
+        render_stats_add_rays('reflection')
         reflect_result = scene_obj.test_intersect (reflected_ray, [])
            
         
@@ -322,7 +297,7 @@ def lightingmodel_basic_reflections(lighting_model, scene_obj, result, rs):
 
 
 def lightingmodel_basic_create(
-        ambient_light=None, max_reflect=5, lighting_model_options={}):
+        ambient_light=None, max_reflect=5, lighting_model_options=None):
     """Creates a tuple with data for basic lighting model.
 
     :param ambient_light: The colour of the ambient light to apply
@@ -1,8 +1,5 @@
 import math
-try:
-    from gmpy2 import *
-except ImportError:
-    from raytracer.mpfr_dummy import *
+from raytracer.precision import *
 from raytracer.cartesian import *
 from raytracer.colour import *
 from PIL import Image
@@ -1,14 +1,23 @@
-try:
-    from gmpy2 import mpdf
-except ImportError:
-    from math import *
-    from raytracer.mpfr_dummy import *
+from raytracer.precision import *
 
 from raytracer.cartesian import *
 
 """Support for matrix maths"""
 
 
+def matrix_mul_rows(a, b):
+    """Multiplies two 4x4 matrices, held as lists of rows.
+
+    :param a: the matrix on the left
+    :param b: the matrix on the right
+    :return: the product, as a list of rows
+    """
+    columns = list(zip(*b))
+    return [[(row[0] * column[0]) + (row[1] * column[1]) +
+             (row[2] * column[2]) + (row[3] * column[3])
+             for column in columns] for row in a]
+
+
 class Matrix:
     """A generic 4x4 maths matrix for transformation purposes"""
 
@@ -40,24 +49,15 @@ class Matrix:
         if isinstance(matrix, Matrix):
 
             new_matrix = Matrix()
-
-            for i in range(0, 4):
-                for j in range(0, 4):
-                    new_matrix.matrix[i][j] = mpfr(0)
-                    for k in range(0, 4):
-                        new_matrix.matrix[i][j] = new_matrix.matrix[i][
-                            j] + (self.matrix[i][k] * matrix.matrix[k][j])
-
-            for i in range(0, 4):
-                for j in range(0, 4):
-                    new_matrix.inverse[i][j] = mpfr(0)
-                    for k in range(0, 4):
-                        new_matrix.inverse[i][j] = new_matrix.inverse[i][
-                            j] + (matrix.inverse[i][k] * self.inverse[k][j])
+            new_matrix.matrix = matrix_mul_rows(self.matrix, matrix.matrix)
+            # the inverse of a product is the product of the inverses, in
+            # the opposite order
+            new_matrix.inverse = matrix_mul_rows(matrix.inverse,
+                                                 self.inverse)
 
             return new_matrix
 
-        elif 'cartesian' in matrix:
+        elif matrix[0] == 'cartesian':
             m = self.matrix
 
             new_vector_x = (m[0][0] * matrix[1]) + \
@@ -0,0 +1,267 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from raytracer.planarshapes import *
+from raytracer.flat_tree import *
+
+"""A binary file format for polygon meshes, which can be loaded by mapping
+the file into memory instead of parsing it. Loading takes about as long as
+opening the file, however large the mesh, and the processes rendering a
+scene share the file's pages.
+
+A mesh file is little-endian, and starts with a header of:
+
+* the 8 bytes MESH_FILE_MAGIC
+* the format version, MESH_FILE_VERSION
+* flags, MESH_FILE_FACE_DATA and MESH_FILE_BVH, for the optional blocks
+  present
+* the number of vertices
+* the number of triangular faces
+* the number of nodes, child node numbers, and primitive numbers in the
+  BVH, or 0 if there is no BVH
+* a reserved value of 0
+
+each a 32 bit unsigned integer. Then follow these blocks, each starting at
+a multiple of 8 bytes from the start of the file:
+
+* float32 x, y and z of each vertex
+* int32 vertex indices, three for each face
+* if MESH_FILE_FACE_DATA is set, the polygon mesh's packed face data,
+  POLYMESH_FACE_DATA_SIZE float64 values for each face
+* if MESH_FILE_BVH is set, a BVH of the faces as the arrays of a flat tree:
+  the float64 node bounds, and the int32 child starts, child counts,
+  children, primitive starts, primitive counts and primitives. The
+  primitives are face numbers.
+
+The optional blocks are built by mesh_file_save so that loading needs no
+computation, but a loader computes them from the vertices and faces if they
+are missing. Colours are not stored, and are given when the file is loaded.
+"""
+
+MESH_FILE_MAGIC = b'RTMESH\r\n'
+MESH_FILE_VERSION = 1
+
+MESH_FILE_FACE_DATA = 1
+MESH_FILE_BVH = 2
+
+MESH_FILE_HEADER = struct.Struct('<8s8I')
+
+# the flat tree arrays stored in a BVH block, in order, with their types
+MESH_FILE_BVH_ARRAYS = (
+    (FLAT_TREE_BOUNDS, 'd'),
+    (FLAT_TREE_CHILD_START, 'i'),
+    (FLAT_TREE_CHILD_COUNT, 'i'),
+    (FLAT_TREE_CHILDREN, 'i'),
+    (FLAT_TREE_PRIMITIVE_START, 'i'),
+    (FLAT_TREE_PRIMITIVE_COUNT, 'i'),
+    (FLAT_TREE_PRIMITIVES, 'i'))
+
+
+class MeshFileData(dict):
+    """The shape data of a polygon mesh loaded from a mesh file. The arrays
+    read from the file are memoryviews of it. When pickled, as when a scene
+    is sent to worker processes, the file name is stored in place of them,
+    and the file is mapped again when the data is unpickled.
+    """
+
+    def __init__(self, filename, mapped):
+        """Class constructor.
+
+        :param filename: the absolute path of the mesh file
+        :param mapped: a dictionary of the shape data read from the file
+        """
+        super(MeshFileData, self).__init__(mapped)
+        self.__filename__ = filename
+        self.__mapped_names__ = tuple(mapped)
+
+    def get_filename(self):
+        """Returns the path of the mesh file.
+
+        :return: a string"""
+        return self.__filename__
+
+    def __reduce__(self):
+        others = [(name, value) for name, value in self.items()
+                  if name not in self.__mapped_names__]
+        return (mesh_file_map, (self.__filename__,), None, None,
+                iter(others))
+
+
+def mesh_file_block_offset(offset):
+    """Returns the position of the next block in a mesh file.
+
+    :param offset: the position of the end of the previous block
+    :return: offset rounded up to a multiple of 8
+    """
+    return (offset + 7) & ~7
+
+
+def mesh_file_write_block(mesh_file, values, typecode):
+    """Writes a block of numbers to a mesh file.
+
+    :param mesh_file: a file open for binary writing
+    :param values: a sequence of numbers
+    :param typecode: the array typecode of the block, 'f', 'd' or 'i'
+    """
+    mesh_file.write(b'\0' * (mesh_file_block_offset(mesh_file.tell()) -
+                             mesh_file.tell()))
+    block = array(typecode, values)
+    if sys.byteorder != 'little':
+        block.byteswap()
+    mesh_file.write(block.tobytes())
+
+
+def mesh_file_read_block(view, offset, typecode, count):
+    """Returns a block of numbers from a mapped mesh file.
+
+    :param view: a memoryview of the mesh file
+    :param offset: the position of the end of the previous block
+    :param typecode: the array typecode of the block, 'f', 'd' or 'i'
+    :param count: the number of values in the block
+    :return: a tuple of the values, as a memoryview of the file or, on
+             big-endian machines, an array, and the position of the end of
+             the block
+    """
+    offset = mesh_file_block_offset(offset)
+    end = offset + count * array(typecode).itemsize
+    if end > len(view):
+        raise ValueError('mesh file is truncated')
+
+    block = view[offset:end].cast(typecode)
+    if sys.byteorder != 'little':
+        block = array(typecode, block)
+        block.byteswap()
+
+    return block, end
+
+
+def mesh_file_save(filename, data, prebuilt=True):
+    """Saves a polygon mesh to a mesh file. Polygons with more than three
+    points are split into triangles, as by shape_polymesh_create. Vertices
+    are rounded to float32 before the face data and BVH are built, so the
+    prebuilt blocks match the stored vertices.
+
+    :param filename: the path of the file to write
+    :param data: a dictionary of mesh data, as taken by
+                 shape_polymesh_create. Only 'points' and
+                 'polygon_point_indices' are stored.
+    :param prebuilt: if True, the face data and a BVH of the faces are
+                     stored, so they need not be built when the file is
+                     loaded
+    """
+    vertices = array('f')
+    for point in data['points']:
+        vertices.extend((float(point[1]), float(point[2]), float(point[3])))
+
+    mesh = shape_polymesh_create(
+        {'points': [cartesian_create(vertices[index], vertices[index + 1],
+                                     vertices[index + 2])
+                    for index in range(0, len(vertices), 3)],
+         'polygon_point_indices': data['polygon_point_indices']},
+        prebuilt, 'bvh')
+    mesh_data = mesh[SHAPE_DATA]
+
+    flags = 0
+    tree = None
+    if prebuilt:
+        flags |= MESH_FILE_FACE_DATA
+        if 'bvh' in mesh_data:
+            flags |= MESH_FILE_BVH
+            tree = mesh_data['bvh']
+
+    with open(filename, 'wb') as mesh_file:
+        mesh_file.write(MESH_FILE_HEADER.pack(
+            MESH_FILE_MAGIC, MESH_FILE_VERSION, flags, len(vertices) // 3,
+            mesh_data['face_count'],
+            len(tree[FLAT_TREE_CHILD_COUNT]) if tree else 0,
+            len(tree[FLAT_TREE_CHILDREN]) if tree else 0,
+            len(tree[FLAT_TREE_PRIMITIVES]) if tree else 0, 0))
+        mesh_file_write_block(mesh_file, vertices, 'f')
+        mesh_file_write_block(mesh_file, mesh_data['faces'], 'i')
+
+        if flags & MESH_FILE_FACE_DATA:
+            mesh_file_write_block(mesh_file, mesh_data['face_data'], 'd')
+
+        if tree is not None:
+            # store face numbers, so the file needs no list of shapes
+            faces = tree[FLAT_TREE_SHAPES]
+            for element, typecode in MESH_FILE_BVH_ARRAYS:
+                values = tree[element]
+                if element == FLAT_TREE_PRIMITIVES:
+                    values = [faces[number] for number in values]
+                mesh_file_write_block(mesh_file, values, typecode)
+
+
+def mesh_file_map(filename):
+    """Maps a mesh file into memory, and returns its arrays as the shape
+    data of a polygon mesh.
+
+    :param filename: the path of the mesh file
+    :return: a MeshFileData
+    """
+    filename = os.path.abspath(filename)
+    with open(filename, 'rb') as mesh_file:
+        # the mapping stays open after the file is closed, for as long as
+        # the views of it are in use
+        view = memoryview(mmap.mmap(mesh_file.fileno(), 0,
+                                    access=mmap.ACCESS_READ))
+
+    if len(view) < MESH_FILE_HEADER.size:
+        raise ValueError('%s is not a mesh file' % filename)
+    (magic, version, flags, vertex_count, face_count, node_count,
+     child_count, primitive_count, reserved) = \
+        MESH_FILE_HEADER.unpack_from(view)
+    if magic != MESH_FILE_MAGIC:
+        raise ValueError('%s is not a mesh file' % filename)
+    if version != MESH_FILE_VERSION:
+        raise ValueError('%s has unsupported mesh file version %d' %
+                         (filename, version))
+
+    mapped = {}
+    offset = MESH_FILE_HEADER.size
+    mapped['vertices'], offset = mesh_file_read_block(
+        view, offset, 'f', vertex_count * 3)
+    mapped['faces'], offset = mesh_file_read_block(
+        view, offset, 'i', face_count * 3)
+
+    if flags & MESH_FILE_FACE_DATA:
+        mapped['face_data'], offset = mesh_file_read_block(
+            view, offset, 'd', face_count * POLYMESH_FACE_DATA_SIZE)
+
+    if flags & MESH_FILE_BVH:
+        tree = flat_tree_create()
+        counts = {FLAT_TREE_BOUNDS: node_count * 6,
+                  FLAT_TREE_CHILDREN: child_count,
+                  FLAT_TREE_PRIMITIVES: primitive_count}
+        for element, typecode in MESH_FILE_BVH_ARRAYS:
+            tree[element], offset = mesh_file_read_block(
+                view, offset, typecode, counts.get(element, node_count))
+        tree[FLAT_TREE_SHAPES] = range(face_count)
+        mapped['bvh'] = tree
+
+    return MeshFileData(filename, mapped)
+
+
+def mesh_file_load(filename, colour=None, reflection=None, use_octtree=True,
+                   accelerator='bvh'):
+    """Loads a polygon mesh from a mesh file.
+
+    :param filename: the path of the mesh file
+    :param colour: the diffuse colour of the mesh, or None
+    :param reflection: the reflection colour of the mesh, or None
+    :param use_octtree: if False, no acceleration structure is used, and
+                        every face is tested against each ray
+    :param accelerator: the acceleration structure to build for the mesh's
+                        faces, 'octree' or 'bvh', if the file does not hold
+                        a BVH
+    :return: the polygon mesh
+    """
+    data = mesh_file_map(filename)
+    data['colour'] = colour
+    data['reflection'] = reflection
+    if not use_octtree:
+        data.pop('bvh', None)
+
+    return shape_polymesh_create_indexed(data, use_octtree, accelerator)
@@ -0,0 +1,417 @@
+import os
+from array import array
+from raytracer.planarshapes import *
+
+"""Readers for meshes stored in Wavefront OBJ and binary PLY files. A file is
+parsed a chunk at a time into NumPy arrays of vertices and triangles, so
+meshes with millions of faces can be read without building a tuple for
+each vertex or a list for each polygon. Only the positions of the vertices
+and the faces are read; normals, texture co-ordinates and materials are
+skipped.
+
+Polygons with more than three points are split into triangles as they are
+read, fanning out from their first point. Concave quads are split along
+their other diagonal, but larger polygons must be convex. Meshes with larger
+concave polygons can be built with shape_polymesh_create, which splits any
+polygon by ear clipping.
+
+NumPy is needed to read files.
+"""
+
+# The number of bytes read from a file at a time
+MESH_READER_CHUNK_SIZE = 1 << 20
+
+# The types of PLY properties, as NumPy type codes
+MESH_READER_PLY_TYPES = {
+    b'char': 'i1', b'int8': 'i1',
+    b'uchar': 'u1', b'uint8': 'u1',
+    b'short': 'i2', b'int16': 'i2',
+    b'ushort': 'u2', b'uint16': 'u2',
+    b'int': 'i4', b'int32': 'i4',
+    b'uint': 'u4', b'uint32': 'u4',
+    b'float': 'f4', b'float32': 'f4',
+    b'double': 'f8', b'float64': 'f8'}
+
+
+class MeshReaderArray(object):
+    """An array of rows that grows as rows are appended to it, doubling its
+    capacity when it is full."""
+
+    def __init__(self, capacity, columns, dtype):
+        """Class constructor.
+
+        :param capacity: the number of rows to allocate at first
+        :param columns: the number of values in each row
+        :param dtype: the NumPy type of the values
+        """
+        self.__rows__ = numpy.empty((max(capacity, 16), columns), dtype=dtype)
+        self.__count__ = 0
+
+    def __len__(self):
+        return self.__count__
+
+    def append(self, rows):
+        """Appends rows to the array.
+
+        :param rows: a NumPy array of rows
+        """
+        count = self.__count__ + len(rows)
+        if count > len(self.__rows__):
+            grown = numpy.empty((max(count, 2 * len(self.__rows__)),
+                                 self.__rows__.shape[1]),
+                                dtype=self.__rows__.dtype)
+            grown[:self.__count__] = self.__rows__[:self.__count__]
+            self.__rows__ = grown
+
+        self.__rows__[self.__count__:count] = rows
+        self.__count__ = count
+
+    def get_rows(self):
+        """Returns the rows appended so far.
+
+        :return: a NumPy array, sharing the array's memory
+        """
+        return self.__rows__[:self.__count__]
+
+
+def mesh_reader_check_numpy():
+    """Raises an ImportError if NumPy is not installed."""
+    if not has_numpy:
+        raise ImportError('reading mesh files needs numpy')
+
+
+def mesh_reader_fan(polygons):
+    """Splits polygons with the same number of points into triangles,
+    fanning out from the first point of each.
+
+    :param polygons: a P x N NumPy array of vertex indices
+    :return: a P(N - 2) x 3 NumPy array of vertex indices, with the triangles
+             of each polygon together and in order
+    """
+    if polygons.shape[1] < 3:
+        return polygons[:0, :0].reshape(0, 3)
+
+    triangles = numpy.empty((len(polygons), polygons.shape[1] - 2, 3),
+                            dtype=polygons.dtype)
+    triangles[:, :, 0] = polygons[:, :1]
+    triangles[:, :, 1] = polygons[:, 1:-1]
+    triangles[:, :, 2] = polygons[:, 2:]
+    return triangles.reshape(-1, 3)
+
+
+def mesh_reader_split_quads(vertices, triangles, rows):
+    """Splits concave quads along the diagonal through their reflex point.
+    mesh_reader_fan splits quads along the diagonal from their first point,
+    which is only right for a concave quad if its first or third point is
+    the reflex one.
+
+    :param vertices: an N x 3 NumPy array of vertices
+    :param triangles: an M x 3 NumPy array of triangles, changed in place
+    :param rows: a NumPy array of the rows of triangles holding the first of
+                 the two triangles of a quad fanned by mesh_reader_fan
+    """
+    quads = numpy.empty((len(rows), 4), dtype=triangles.dtype)
+    quads[:, 0:3] = triangles[rows]
+    quads[:, 3] = triangles[rows + 1, 2]
+    known = numpy.flatnonzero((quads >= 0).all(axis=1) &
+                              (quads < len(vertices)).all(axis=1))
+    rows = rows[known]
+    quads = quads[known]
+
+    a, b, c, d = (vertices[quads[:, corner]] for corner in range(4))
+    # the diagonals' cross product is normal to the quad, and points the
+    # way its points run anticlockwise around
+    normals = numpy.cross(c - a, d - b)
+    reflex = ((numpy.cross(b - a, c - b) * normals).sum(axis=1) < 0) | \
+        ((numpy.cross(d - c, a - d) * normals).sum(axis=1) < 0)
+
+    rows = rows[reflex]
+    quads = quads[reflex]
+    triangles[rows] = quads[:, [1, 2, 3]]
+    triangles[rows + 1] = quads[:, [1, 3, 0]]
+
+
+def mesh_reader_check_faces(vertices, faces, filename):
+    """Checks that the faces of a mesh only refer to its vertices.
+
+    :param vertices: the vertices of the mesh
+    :param faces: the faces of the mesh
+    :param filename: the name of the file the mesh was read from, for the
+                     error message
+    """
+    if len(faces) > 0 and (faces.min() < 0 or faces.max() >= len(vertices)):
+        raise ValueError('%s has a face with a vertex index out of range' %
+                         filename)
+
+
+def mesh_reader_read_obj(filename):
+    """Reads the vertices and faces of a Wavefront OBJ file. Negative vertex
+    indices, relative to the last vertex read, are supported.
+
+    :param filename: the path of the file
+    :return: a tuple of an N x 3 NumPy array of vertices, and an M x 3 NumPy
+             array of the vertex indices of each triangle
+    """
+    mesh_reader_check_numpy()
+
+    # a guess at the sizes, so that the arrays are rarely grown
+    capacity = os.path.getsize(filename) // 100
+    vertices = MeshReaderArray(capacity, 3, numpy.float64)
+    faces = MeshReaderArray(capacity, 3, numpy.intc)
+    vertex_count = 0
+
+    with open(filename, 'rb') as obj_file:
+        while True:
+            lines = obj_file.readlines(MESH_READER_CHUNK_SIZE)
+            if len(lines) == 0:
+                break
+
+            vertex_lines = []
+            triangles = []
+            quad_rows = []
+            for line in lines:
+                if line.startswith(b'v '):
+                    vertex_lines.append(line[2:])
+                    vertex_count += 1
+                    continue
+
+                if not line.startswith(b'f '):
+                    continue
+
+                indices = []
+                for token in line.split()[1:]:
+                    index = int(token.split(b'/', 1)[0])
+                    indices.append(index - 1 if index > 0 else
+                                   vertex_count + index)
+                if len(indices) == 4:
+                    quad_rows.append(len(triangles) // 3)
+                for corner in range(1, len(indices) - 1):
+                    triangles.extend((indices[0], indices[corner],
+                                      indices[corner + 1]))
+
+            if len(vertex_lines) > 0:
+                values = b' '.join(vertex_lines).split()
+                if len(values) == 3 * len(vertex_lines):
+                    vertices.append(numpy.array(
+                        values, dtype=numpy.float64).reshape(-1, 3))
+                else:
+                    # some vertices have a w, or a colour
+                    vertices.append(numpy.array(
+                        [line.split()[:3] for line in vertex_lines],
+                        dtype=numpy.float64))
+
+            if len(triangles) > 0:
+                triangles = numpy.array(triangles,
+                                        dtype=numpy.intc).reshape(-1, 3)
+                if len(quad_rows) > 0:
+                    mesh_reader_split_quads(vertices.get_rows(), triangles,
+                                            numpy.array(quad_rows))
+                faces.append(triangles)
+
+    mesh_reader_check_faces(vertices.get_rows(), faces.get_rows(), filename)
+    return vertices.get_rows(), faces.get_rows()
+
+
+def mesh_reader_read_ply_header(ply_file, filename):
+    """Reads the header of a binary PLY file.
+
+    :param ply_file: the file, open for binary reading
+    :param filename: the name of the file, for error messages
+    :return: a tuple of the byte order, '<' or '>', and a list of the
+             elements of the file, each a tuple of its name, its count and a
+             list of its properties. A property is a tuple of its name, its
+             type, and the type of its count if it is a list, else None.
+    """
+    if ply_file.readline().strip() != b'ply':
+        raise ValueError('%s is not a PLY file' % filename)
+
+    byte_order = None
+    elements = []
+    while True:
+        line = ply_file.readline()
+        if len(line) == 0:
+            raise ValueError('%s has no end_header' % filename)
+
+        words = line.split()
+        if len(words) == 0 or words[0] in (b'comment', b'obj_info'):
+            continue
+        if words[0] == b'end_header':
+            break
+
+        if words[0] == b'format':
+            if words[1] == b'binary_little_endian':
+                byte_order = '<'
+            elif words[1] == b'binary_big_endian':
+                byte_order = '>'
+            else:
+                raise ValueError('%s is not a binary PLY file' % filename)
+        elif words[0] == b'element':
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == b'property':
+            if words[1] == b'list':
+                elements[-1][2].append((words[4],
+                                        MESH_READER_PLY_TYPES[words[3]],
+                                        MESH_READER_PLY_TYPES[words[2]]))
+            else:
+                elements[-1][2].append((words[2],
+                                        MESH_READER_PLY_TYPES[words[1]],
+                                        None))
+
+    if byte_order is None:
+        raise ValueError('%s has no format' % filename)
+
+    return byte_order, elements
+
+
+def mesh_reader_read_ply_faces(ply_file, count, count_type, index_type,
+                               vertices, faces, filename):
+    """Reads the faces of a binary PLY file. Runs of faces with the same
+    number of points are read at once.
+
+    :param ply_file: the file, positioned at the first face
+    :param count: the number of faces
+    :param count_type: the NumPy type of the number of points of a face,
+                       with its byte order
+    :param index_type: the NumPy type of the vertex indices, with its byte
+                       order
+    :param vertices: an N x 3 NumPy array of the vertices, used to split
+                     concave quads, or None if they have not been read
+    :param faces: a MeshReaderArray to append the triangles to
+    :param filename: the name of the file, for error messages
+    """
+    count_type = numpy.dtype(count_type)
+    index_type = numpy.dtype(index_type)
+    buffer = b''
+    position = 0
+
+    while count > 0:
+        points = None
+        if len(buffer) - position >= count_type.itemsize:
+            points = int(numpy.frombuffer(buffer, count_type, 1,
+                                          position)[0])
+            record_type = numpy.dtype([('points', count_type),
+                                       ('indices', index_type, (points,))])
+            records = min(count,
+                          (len(buffer) - position) // record_type.itemsize)
+
+        if points is None or records == 0:
+            data = ply_file.read(MESH_READER_CHUNK_SIZE)
+            if len(data) == 0:
+                raise ValueError('%s is truncated' % filename)
+            buffer = buffer[position:] + data
+            position = 0
+            continue
+
+        polygons = numpy.frombuffer(buffer, record_type, records, position)
+        changes = numpy.flatnonzero(polygons['points'] != points)
+        if len(changes) > 0:
+            records = int(changes[0])
+            polygons = polygons[:records]
+
+        triangles = mesh_reader_fan(polygons['indices'].reshape(
+            records, points))
+        if points == 4 and vertices is not None:
+            mesh_reader_split_quads(vertices, triangles,
+                                    numpy.arange(0, len(triangles), 2))
+        faces.append(triangles)
+        position += records * record_type.itemsize
+        count -= records
+
+
+def mesh_reader_read_ply(filename):
+    """Reads the vertices and faces of a binary PLY file.
+
+    :param filename: the path of the file
+    :return: a tuple of an N x 3 NumPy array of vertices, and an M x 3 NumPy
+             array of the vertex indices of each triangle
+    """
+    mesh_reader_check_numpy()
+
+    with open(filename, 'rb') as ply_file:
+        byte_order, elements = mesh_reader_read_ply_header(ply_file,
+                                                           filename)
+        vertices = None
+        faces = None
+
+        for name, count, properties in elements:
+            if name == b'face' and len(properties) == 1 and \
+                    properties[0][2] is not None:
+                faces = MeshReaderArray(count, 3, numpy.intc)
+                mesh_reader_read_ply_faces(
+                    ply_file, count, byte_order + properties[0][2],
+                    byte_order + properties[0][1], vertices, faces,
+                    filename)
+                continue
+
+            if any(property[2] is not None for property in properties):
+                if vertices is not None and faces is not None:
+                    break
+                raise ValueError('%s has an unsupported element %s' %
+                                 (filename, name.decode()))
+
+            record_type = numpy.dtype([(property[0].decode(),
+                                        byte_order + property[1])
+                                       for property in properties])
+            if name != b'vertex':
+                ply_file.seek(count * record_type.itemsize, os.SEEK_CUR)
+                continue
+
+            vertices = numpy.empty((count, 3), dtype=numpy.float64)
+            chunk = max(1, MESH_READER_CHUNK_SIZE // record_type.itemsize)
+            for first in range(0, count, chunk):
+                records = min(chunk, count - first)
+                data = ply_file.read(records * record_type.itemsize)
+                if len(data) < records * record_type.itemsize:
+                    raise ValueError('%s is truncated' % filename)
+                values = numpy.frombuffer(data, record_type)
+                for axis, axis_name in enumerate(('x', 'y', 'z')):
+                    vertices[first:first + records, axis] = values[axis_name]
+
+    if vertices is None or faces is None:
+        raise ValueError('%s has no vertices or no faces' % filename)
+
+    mesh_reader_check_faces(vertices, faces.get_rows(), filename)
+    return vertices, faces.get_rows()
+
+
+def mesh_reader_read(filename):
+    """Reads the vertices and faces of an OBJ or binary PLY file, chosen by
+    the file's extension.
+
+    :param filename: the path of the file
+    :return: a tuple of an N x 3 NumPy array of vertices, and an M x 3 NumPy
+             array of the vertex indices of each triangle
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.obj':
+        return mesh_reader_read_obj(filename)
+    if extension == '.ply':
+        return mesh_reader_read_ply(filename)
+
+    raise ValueError('%s is not an OBJ or PLY file' % filename)
+
+
+def mesh_reader_load(filename, colour=None, reflection=None,
+                     use_octtree=True, accelerator='bvh'):
+    """Loads a polygon mesh from an OBJ or binary PLY file.
+
+    :param filename: the path of the file
+    :param colour: the diffuse colour of the mesh, or None
+    :param reflection: the reflection colour of the mesh, or None
+    :param use_octtree: if False, no acceleration structure is used, and
+                        every face is tested against each ray
+    :param accelerator: the acceleration structure for the mesh's faces,
+                        'octree' or 'bvh'
+    :return: the polygon mesh
+    """
+    points, triangles = mesh_reader_read(filename)
+
+    vertices = array('d')
+    vertices.frombytes(numpy.ascontiguousarray(points).tobytes())
+    faces = array('i')
+    faces.frombytes(numpy.ascontiguousarray(
+        triangles, dtype=numpy.intc).tobytes())
+
+    return shape_polymesh_create_indexed(
+        {'colour': colour, 'reflection': reflection, 'vertices': vertices,
+         'faces': faces}, use_octtree, accelerator)
@@ -0,0 +1,100 @@
+import sys
+import time
+from raytracer.cartesian import *
+from raytracer.colour import *
+from raytracer.output import *
+from raytracer.shape import *
+from raytracer.view import *
+from raytracer.scene import *
+from raytracer.quadraticshapes import *
+from raytracer.lighting_model import *
+from raytracer.light import *
+
+"""Compares render times for each precision backend. A scene of spheres is
+built and rendered in a single process once per backend, and the times are
+reported relative to the 'mpfr' backend.
+
+Usage: python -m raytracer.misc.benchmark_precision [width] [height]
+"""
+
+
+def benchmark_precision_scene(width, height):
+    """Builds the benchmark scene using the current precision backend.
+
+    :param width: width of the rendered image, in pixels
+    :param height: height of the rendered image, in pixels
+    :return: a Scene with a single view named 'view'
+    """
+    scene = Scene(True, 8)
+    view = view_create_look_at(
+        scene, {'left': 0, 'right': width, 'top': 0, 'bottom': height},
+        10, 20, cartesian_create(0, 0, -22.5), cartesian_create(0, 0, -4),
+        .6, 0)
+    view_set_antialias(view, False)
+    view_set_output(view, PIL_Output())
+    view_set_multiprocessing(view, False)
+    scene.add_view(view, 'view')
+
+    scene.add_light(light_point_light_create(
+        cartesian_create(-20, 0, -5), colour_create(.3, .3, 0)), 'light1')
+    scene.add_light(light_point_light_create(
+        cartesian_create(20, 0, 0), colour_create(1.2, 1.2, .8)), 'light2')
+
+    i = 0
+    for x in range(2):
+        for y in range(2):
+            for z in range(1, 7):
+                i += 1
+                if i % 2:
+                    sphere = shape_sphere_create(colour_create(.5, 0, .5),
+                                                 colour_create(0, 0, 0))
+                else:
+                    sphere = shape_sphere_create(colour_create(0, 0, 0),
+                                                 colour_create(1, 1, 1))
+                shape_set_transform(sphere, Transform({
+                    'translate': {'x': x * 2 + (z - 1) * .75,
+                                  'y': y * 2 + (z - 1) * .75,
+                                  'z': z - 1}}))
+                scene.add_shape(sphere, 'sphere_%i' % i)
+
+    return scene
+
+
+def benchmark_precision(width=64, height=48):
+    """Renders the benchmark scene with each available precision backend.
+
+    :param width: width of the rendered image, in pixels
+    :param height: height of the rendered image, in pixels
+    :return: a dictionary of render times in seconds, keyed by backend
+    """
+    times = {}
+    original_backend = precision_get_backend()
+
+    for backend in PRECISION_BACKENDS:
+        try:
+            precision_set_backend(backend)
+        except ImportError:
+            continue
+
+        scene = benchmark_precision_scene(width, height)
+        start = time.perf_counter()
+        scene.render('view')
+        times[backend] = time.perf_counter() - start
+
+    precision_set_backend(original_backend)
+    return times
+
+
+if __name__ == '__main__':
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 48
+
+    times = benchmark_precision(width, height)
+    for backend in PRECISION_BACKENDS:
+        if backend not in times:
+            print('%-6s not available' % backend)
+            continue
+        line = '%-6s %8.3fs' % (backend, times[backend])
+        if 'mpfr' in times:
+            line += '  %5.2fx' % (times['mpfr'] / times[backend])
+        print(line)
@@ -1,22 +1,133 @@
-from colour import *
-from cartesian import *
-from timeit import *
+import sys
+import timeit
+from collections import namedtuple
+from raytracer.colour import *
+from raytracer.cartesian import *
 
+"""Microbenchmarks for the cartesian, colour and ray functions, and for
+other ways of storing a cartesian. The tagged tuple used by cartesian.py is
+compared with an untagged 3-tuple, a class with __slots__ and a namedtuple,
+each doing the same additions, dot products, normalisations and cross
+products written inline, so only the cost of the representation differs.
+Times are per loop iteration, in microseconds.
 
-def test_colour():
-    b = colour_create(0, 0, 0, 0)
-    for i in range(1, 100000):
-        c = colour_create(.5, .5, .5, 0)
-        b = colour_add(b, c)
+Usage: python -m raytracer.misc.speed [iterations]
+"""
 
 
-def test_cartesian():
-    b = cartesian_create(0, 0, 0)
-    for i in range(1, 50000):
+class SlotsCartesian(object):
+    """A cartesian stored as a class with __slots__, for comparison."""
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x, y, z):
+        self.x = x
+        self.y = y
+        self.z = z
+
+
+NamedCartesian = namedtuple('NamedCartesian', 'x y z')
+
+
+def test_colour(iterations=50000):
+    b = colour_create(0, 0, 0)
+    for i in range(1, iterations):
+        c = colour_create(.5, .5, .5)
+        b = colour_scale(colour_add(b, c), .5)
+        b = colour_mul(b, c)
+
+
+def test_cartesian(iterations=50000):
+    b = cartesian_create(0, 0, 1)
+    for i in range(1, iterations):
         c = cartesian_create(.5, .5, .5)
         b = cartesian_normalise(cartesian_add(b, c))
         d = cartesian_dot(c, b)
         e = cartesian_cross(c, b)
-# if __name__ == '__main__':
-#     print(repeat("test_colour()",
-#                  setup="from __main__ import test_colour", number=50))
+
+
+def test_ray(iterations=50000):
+    ray = ray_create(cartesian_create(0, 0, -5), cartesian_create(0, 0, 1))
+    for i in range(1, iterations):
+        p = ray_calc_pt(ray, 2.5)
+        inverse_direction, signs = ray_inverse_direction(ray)
+
+
+def test_tagged_tuple(iterations=50000):
+    b = ('cartesian', 0.0, 0.0, 1.0)
+    for i in range(1, iterations):
+        c = ('cartesian', .5, .5, .5)
+        s = ('cartesian', b[1] + c[1], b[2] + c[2], b[3] + c[3])
+        scale = 1.0 / sqrt((s[1] * s[1]) + (s[2] * s[2]) + (s[3] * s[3]))
+        b = ('cartesian', s[1] * scale, s[2] * scale, s[3] * scale)
+        d = (c[1] * b[1]) + (c[2] * b[2]) + (c[3] * b[3])
+        e = ('cartesian',
+             (c[2] * b[3]) - (c[3] * b[2]),
+             (c[3] * b[1]) - (c[1] * b[3]),
+             (c[1] * b[2]) - (c[2] * b[1]))
+
+
+def test_tuple(iterations=50000):
+    b = (0.0, 0.0, 1.0)
+    for i in range(1, iterations):
+        c = (.5, .5, .5)
+        s = (b[0] + c[0], b[1] + c[1], b[2] + c[2])
+        scale = 1.0 / sqrt((s[0] * s[0]) + (s[1] * s[1]) + (s[2] * s[2]))
+        b = (s[0] * scale, s[1] * scale, s[2] * scale)
+        d = (c[0] * b[0]) + (c[1] * b[1]) + (c[2] * b[2])
+        e = ((c[1] * b[2]) - (c[2] * b[1]),
+             (c[2] * b[0]) - (c[0] * b[2]),
+             (c[0] * b[1]) - (c[1] * b[0]))
+
+
+def test_record(create, iterations=50000):
+    b = create(0.0, 0.0, 1.0)
+    for i in range(1, iterations):
+        c = create(.5, .5, .5)
+        s = create(b.x + c.x, b.y + c.y, b.z + c.z)
+        scale = 1.0 / sqrt((s.x * s.x) + (s.y * s.y) + (s.z * s.z))
+        b = create(s.x * scale, s.y * scale, s.z * scale)
+        d = (c.x * b.x) + (c.y * b.y) + (c.z * b.z)
+        e = create((c.y * b.z) - (c.z * b.y),
+                   (c.z * b.x) - (c.x * b.z),
+                   (c.x * b.y) - (c.y * b.x))
+
+
+def test_slots(iterations=50000):
+    test_record(SlotsCartesian, iterations)
+
+
+def test_namedtuple(iterations=50000):
+    test_record(NamedCartesian, iterations)
+
+
+SPEED_TESTS = (
+    ('cartesian_*', test_cartesian),
+    ('tagged tuple', test_tagged_tuple),
+    ('untagged 3-tuple', test_tuple),
+    ('__slots__ class', test_slots),
+    ('namedtuple', test_namedtuple),
+    ('colour_*', test_colour),
+    ('ray_*', test_ray))
+
+
+def speed(iterations=50000, repeat=5):
+    """Runs each microbenchmark, keeping the best of several runs.
+
+    :param iterations: the number of loop iterations in each run
+    :param repeat: the number of runs of each benchmark
+    :return: a list of (name, microseconds per iteration) tuples
+    """
+    times = []
+    for name, test in SPEED_TESTS:
+        best = min(timeit.repeat(lambda: test(iterations),
+                                 number=1, repeat=repeat))
+        times.append((name, best * 1000000 / iterations))
+
+    return times
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    for name, time in speed(iterations):
+        print('%-28s %7.3fus' % (name, time))
@@ -61,6 +61,20 @@ class BoundingBox:
             if self.is_inside(point):
                 return True
         return False
+
+    def contains_box(self, bounding_box):
+        """Returns True if another bounding box lies entirely inside this
+        one.
+
+        :param bounding_box: a BoundingBox
+        :return: a boolean
+        """
+        return (bounding_box.min_x >= self.min_x and
+                bounding_box.max_x <= self.max_x and
+                bounding_box.min_y >= self.min_y and
+                bounding_box.max_y <= self.max_y and
+                bounding_box.min_z >= self.min_z and
+                bounding_box.max_z <= self.max_z)
     
     def __str__(self):
         return ("min_x: %f, mid_x %f, max_x %f, min_y %f, mid_y %f " + 
@@ -72,8 +86,18 @@ class BoundingBox:
 class OctTreeNode(object):
     def __init__(
             self, parent_branch, split_threshold,
-            min_x, max_x, min_y, max_y, min_z, max_z):
+            min_x, max_x, min_y, max_y, min_z, max_z,
+            bounding_box_func=None):
+        """Class constructor.
+
+        :param bounding_box_func: a function returning the BoundingBox of a
+                                  shape stored in the tree, or None to use
+                                  shape_bounding_box. Allows the tree to
+                                  hold primitives that are not shapes, such
+                                  as the face numbers of a polygon mesh.
+        """
         self.margin = mpfr (".0001")
+        self.bounding_box_func = bounding_box_func
         self.parent_branch = parent_branch
         self.shapes = []
         self.split_threshold =  split_threshold
@@ -81,7 +105,29 @@ class OctTreeNode(object):
             min_x, max_x, min_y, max_y, min_z, max_z)
         self.shape_count = 0
         self.__added_shapes__ = {}
-          
+        self.__slab_bounds__ = None
+
+    def get_ray_entry(self, start, inverse_direction, signs):
+        """Tests a ray against the node's bounding box, grown by the
+        node's margin.
+
+        :param start: the start point of the ray
+        :param inverse_direction: the ray's inverse direction, from
+                                  ray_inverse_direction
+        :param signs: the ray's sign bits, from ray_inverse_direction
+        :return: the distance along the ray at which it enters the node, or
+                 None if the ray misses the node
+        """
+        if self.__slab_bounds__ is None:
+            margin = float(self.margin)
+            box = self.bounding_box
+            self.__slab_bounds__ = (
+                box.min_x - margin, box.min_y - margin, box.min_z - margin,
+                box.max_x + margin, box.max_y + margin, box.max_z + margin)
+
+        return ray_box_entry(self.__slab_bounds__, 0, start,
+                             inverse_direction, signs)
+
     def can_split (self):   
         
         if hasattr(self.parent_branch, "shape_count"):
@@ -111,6 +157,7 @@ class OctTreeNode(object):
 
     def set_margin(self, margin):
         self.margin = mpfr (margin)
+        self.__slab_bounds__ = None
 
 class OctTreeLeaf(OctTreeNode):
  
@@ -128,7 +175,8 @@ class OctTreeLeaf(OctTreeNode):
                 self.parent_branch, self.split_threshold,
                 self.bounding_box.min_x, self.bounding_box.max_x,
                 self.bounding_box.min_y, self.bounding_box.max_y,
-                self.bounding_box.min_z, self.bounding_box.max_z)   
+                self.bounding_box.min_z, self.bounding_box.max_z,
+                self.bounding_box_func)
             
             new_branch.set_margin(self.margin)
                       
@@ -148,6 +196,21 @@ class OctTreeLeaf(OctTreeNode):
 
             return True
 
+    def remove_shape(self, shape):
+        """Removes a shape from the leaf.
+
+        :param shape: the shape to remove
+        :return: True if the shape was in the leaf, otherwise False
+        """
+        if id(shape) not in self.__added_shapes__:
+            return False
+
+        del self.__added_shapes__[id(shape)]
+        self.shape_count -= 1
+        self.shapes = [sh for sh in self.shapes if sh is not shape]
+
+        return True
+
     def get_shape_dict_by_ray(self, ray):
         
         shapes = self.get_shapes_by_ray(ray)
@@ -185,10 +248,10 @@ class OctTreeBranch(OctTreeNode):
     
     def __init__(
         self, parent_branch, split_threshold,
-        min_x, max_x, min_y, max_y, min_z, max_z):
+        min_x, max_x, min_y, max_y, min_z, max_z, bounding_box_func=None):
         super(OctTreeBranch, self).__init__(
             parent_branch, split_threshold,
-            min_x, max_x, min_y, max_y, min_z, max_z)
+            min_x, max_x, min_y, max_y, min_z, max_z, bounding_box_func)
         self.children = [
             [[None,None], [None, None]],
             [[None, None], [None, None]] ]
@@ -205,7 +268,7 @@ class OctTreeBranch(OctTreeNode):
                             self, split_threshold,
                             x[i], x[i + 1], 
                             y[j], y[j + 1],
-                            z[k], z[k + 1])
+                            z[k], z[k + 1], bounding_box_func)
         self.shape_count = 0 
 
     
@@ -237,6 +300,7 @@ class OctTreeBranch(OctTreeNode):
 
     def set_margin (self, margin):
         self.margin = mpfr(margin)
+        self.__slab_bounds__ = None
         for i in range(0,2):
             for j in range(0,2):
                 for k in range(0,2):
@@ -249,7 +313,10 @@ class OctTreeBranch(OctTreeNode):
 
         self.shape_count += 1        
         
-        shape_box = raytracer.shape.shape_bounding_box(shape)
+        if self.bounding_box_func is None:
+            shape_box = raytracer.shape.shape_bounding_box(shape)
+        else:
+            shape_box = self.bounding_box_func(shape)
 
         if shape_box is None or not self.can_split():
             self.shapes.append(shape)
@@ -299,8 +366,29 @@ class OctTreeBranch(OctTreeNode):
                         self.children[i][j][k].add_shape(shape)
                  
             return True
-                 
-            
+
+    def remove_shape(self, shape):
+        """Removes a shape from the branch and the nodes below it. Nodes
+        that become empty are kept, to be reused by shapes added later.
+
+        :param shape: the shape to remove
+        :return: True if the shape was in the branch, otherwise False
+        """
+        if id(shape) not in self.__added_shapes__:
+            return False
+
+        # children are looked up by position, as a child leaf may have been
+        # replaced by a branch since the shape was added
+        added = self.__added_shapes__.pop(id(shape))
+        self.shape_count -= 1
+        if len(added) == 0:
+            self.shapes = [sh for sh in self.shapes if sh is not shape]
+
+        for child, i, j, k in added:
+            self.children[i][j][k].remove_shape(shape)
+
+        return True
+
     def replace_node(self, old_node, new_node):
         for i in range(0,2):
             for j in range(0,2):
@@ -352,102 +440,55 @@ class OctTreeBranch(OctTreeNode):
             shapes += leaf.shapes
 
         shapes += self.shapes
-        
-        shapes = list_purge_duplicates(shapes)
-                    
-        return shapes
+
+        # shapes are lists, so compare them by identity rather than value
+        unique_shapes = {}
+        for shape in shapes:
+            unique_shapes[id(shape)] = shape
+
+        return list(unique_shapes.values())
 
     def get_leaves_by_ray(self, ray):
-        
-        if ((ray[RAY_START][1]<self.bounding_box.min_x and ray[RAY_DIR][1]<0)
-            or (ray[RAY_START][2]<self.bounding_box.min_y and ray[RAY_DIR][2]<0)
-            or (ray[RAY_START][3]<self.bounding_box.min_z and ray[RAY_DIR][3]<0)            
-            or (ray[RAY_START][1]>self.bounding_box.max_x and ray[RAY_DIR][1]>0)
-            or (ray[RAY_START][2]>self.bounding_box.max_y and ray[RAY_DIR][2]>0)
-            or (ray[RAY_START][3]>self.bounding_box.max_z and ray[RAY_DIR][3]>0)):
-            
-            return []
-        
-        t=[{}, {}, {}, {}]
-        nodes = []
-        if ray[RAY_DIR][1] !=0: # if not paralell to X-axis
-            t[1]['min'] = (self.bounding_box.min_x - ray[RAY_START][1]) / ray[RAY_DIR][1]
-            t[1]['mid'] = (self.bounding_box.mid_x - ray[RAY_START][1]) / ray[RAY_DIR][1]
-            t[1]['max'] = (self.bounding_box.max_x - ray[RAY_START][1]) / ray[RAY_DIR][1]
-
-        if ray[RAY_DIR][2] !=0: # if not paralell to Y-axis
-
-            t[2]['min'] = (self.bounding_box.min_y - ray[RAY_START][2]) / ray[RAY_DIR][2]
-            t[2]['mid'] = (self.bounding_box.mid_y - ray[RAY_START][2]) / ray[RAY_DIR][2]
-            t[2]['max'] = (self.bounding_box.max_y - ray[RAY_START][2]) / ray[RAY_DIR][2]
-
-        if ray[RAY_DIR][3] !=0: # if not paralell to Z-axis
-            t[3]['min'] = (self.bounding_box.min_z - ray[RAY_START][3]) / ray[RAY_DIR][3]
-            t[3]['mid'] = (self.bounding_box.mid_z - ray[RAY_START][3]) / ray[RAY_DIR][3]
-            t[3]['max'] = (self.bounding_box.max_z - ray[RAY_START][3]) / ray[RAY_DIR][3]
-        
-        for dim in range (1, 4):
-                
-            for aspect in t[dim]:
-                if (t[dim][aspect] < 0):
-                    continue
-                
-                margin = self.margin
-                    
-                point = ray_calc_pt(ray, t[dim][aspect])
-                
-                if (point[1] - margin > self.bounding_box.max_x or
-                    point[1] + margin < self.bounding_box.min_x or
-                    point[2] - margin > self.bounding_box.max_y or
-                    point[2] + margin < self.bounding_box.min_y or
-                    point[3] - margin > self.bounding_box.max_z or
-                    point[3] + margin < self.bounding_box.min_z):
-                    continue
-                
-                
-                if abs (point[1] - self.bounding_box.mid_x) < margin:
-                    x = [0, 1]
-                else:
-                    if point[1] < self.bounding_box.mid_x:
-                        x = [0]
-                    else:
-                        x = [1]
-                        
-                if abs (point[2] - self.bounding_box.mid_y) < margin:
-                    y = [0, 1]
-                else:
-                    if point[2]<self.bounding_box.mid_y:
-                        y = [0]
-                    else:
-                        y = [1]
-                        
-                if abs (point[3] - self.bounding_box.mid_z) < margin:
-                    z = [0, 1]
-                else:
-                    if point[3]<self.bounding_box.mid_z:
-                        z = [0]
-                    else:
-                        z = [1]                        
-                
-                for i in x:
-                    for j in y:
-                        for k in z:
-                            
-                            node = self.children[i][j][k]
-                
-                            if not node in nodes:
-                                nodes.append(node)
-    
-        if len(nodes) == 0:
-            return []
-        
+        """Returns the leaves below the branch whose bounding boxes are
+        intersected by a ray. The ray's inverse direction and sign bits are
+        computed once, and each branch's children are visited in order of
+        the distance at which the ray enters them.
+
+        :param ray: the ray
+        :return: a list of OctTreeLeaf objects, nearest first
+        """
+        start = ray[RAY_START]
+        inverse_direction, signs = ray_inverse_direction(ray)
         leaves = []
-        
-        for node in nodes:
-            if isinstance(node, OctTreeBranch):
-                leaves += (node.get_leaves_by_ray(ray))
-            else:
-                leaves.append(node)
-        
+
+        if self.get_ray_entry(start, inverse_direction, signs) is not None:
+            self.add_leaves_by_ray(start, inverse_direction, signs, leaves)
+
         return leaves
-    
\ No newline at end of file
+
+    def add_leaves_by_ray(self, start, inverse_direction, signs, leaves):
+        """Adds the leaves below the branch that are intersected by a ray to
+        a list, nearest first. Used by get_leaves_by_ray.
+
+        :param start: the start point of the ray
+        :param inverse_direction: the ray's inverse direction
+        :param signs: the ray's sign bits
+        :param leaves: the list to add leaves to
+        """
+        entries = []
+        for i in range(0, 2):
+            for j in range(0, 2):
+                for k in range(0, 2):
+                    child = self.children[i][j][k]
+                    t = child.get_ray_entry(start, inverse_direction, signs)
+                    if t is not None:
+                        entries.append((t, child))
+
+        entries.sort(key=lambda entry: entry[0])
+
+        for t, child in entries:
+            if isinstance(child, OctTreeBranch):
+                child.add_leaves_by_ray(start, inverse_direction, signs,
+                                        leaves)
+            else:
+                leaves.append(child)
@@ -6,6 +6,13 @@ try:
 except ImportError:
     has_PIL = False
 
+try:
+    import numpy
+    from multiprocessing import shared_memory
+    has_shared_memory = True
+except ImportError:
+    has_shared_memory = False
+
 from raytracer.colour import *
 
 """ Classes for managing output from the raytracer"""
@@ -42,12 +49,36 @@ class Output:
 
         return False
 
+    def set_tile(self, tile, buffer):
+        """Sets the colours for a rendered tile. This calls set_pixel for
+        each pixel in the tile; subclasses can override it to copy the whole
+        tile at once.
+
+        :param tile: a tile tuple, as created by view_create_tiles
+        :param buffer: the tile buffer, holding red, green and blue values
+                       for each pixel in the tile, row by row"""
+
+        i = 0
+        for y in range(tile[2], tile[4]):
+            for x in range(tile[1], tile[3]):
+                self.set_pixel(x, y, ('colour', buffer[i], buffer[i + 1],
+                                      buffer[i + 2]))
+                i += 3
+
     def get_output(self):
         """Placeholder method for getting a generated image
 
         :return: None"""
         return None
 
+    def get_worker_handle(self):
+        """Returns a handle that worker processes can use to write rendered
+        tiles into the output directly, or None if tiles must be sent back to
+        the parent process. See output_write_tile.
+
+        :return: None"""
+        return None
+
 if has_PIL:
     class PIL_Output(Output):
         __image__ = None
@@ -86,6 +117,139 @@ if has_PIL:
                 int(colour[3] * 255))
 
 
+        def set_tile(self, tile, buffer):
+            """Copies a rendered tile into the image in one operation.
+
+            :param tile: a tile tuple, as created by view_create_tiles
+            :param buffer: the tile buffer, holding red, green and blue
+                           values for each pixel in the tile, row by row"""
+
+            tile_image = Image.frombytes(
+                'RGB', (tile[3] - tile[1], tile[4] - tile[2]),
+                bytes([min(255, max(0, int(value * 255)))
+                       for value in buffer]))
+            self.__image__.paste(tile_image, (tile[1], tile[2]))
+
         def get_output(self):
             """Returns the PIL image created"""
             return self.__image__
+
+
+if has_shared_memory:
+    class SharedMemoryOutput(Output):
+        """An output holding the rendered image as a float32 array of
+        height x width x 3 colour values, in shared memory. Worker processes
+        write their tiles into the array directly, so no colours are sent
+        back to the parent process. The array is converted into an image
+        only when get_output is called."""
+
+        __shared_memory__ = None
+        __pixels__ = None
+
+        def set_rectangle(self, rectangle):
+            """Allocates the shared memory for the specified rectangle.
+
+            :param rectangle: a dictionary with 'top', 'left', 'bottom',
+                              and 'right' value"""
+            super().set_rectangle(rectangle)
+            shape = (self.__rectangle__['bottom'],
+                     self.__rectangle__['right'], 3)
+
+            if self.__pixels__ is None or self.__pixels__.shape != shape:
+                self.close()
+                self.__shared_memory__ = shared_memory.SharedMemory(
+                    create=True, size=max(1, shape[0] * shape[1] * 3 * 4))
+                self.__pixels__ = numpy.ndarray(
+                    shape, dtype=numpy.float32,
+                    buffer=self.__shared_memory__.buf)
+
+            self.__pixels__.fill(0)
+
+        def set_pixel(self, x, y, colour):
+            """ Sets a colour at a specified co-ordinate
+
+                    :param x: the x co-ordinate of the colour to set.
+                    :param y: the y co-ordinate of the colour to set.
+                    :param colour: the colour to set"""
+            self.__pixels__[y, x] = (colour[1], colour[2], colour[3])
+
+        def set_tile(self, tile, buffer):
+            """Copies a rendered tile into the shared array.
+
+            :param tile: a tile tuple, as created by view_create_tiles
+            :param buffer: the tile buffer, holding red, green and blue
+                           values for each pixel in the tile, row by row"""
+            output_tile_into_array(self.__pixels__, tile, buffer)
+
+        def get_worker_handle(self):
+            """Returns a handle for worker processes to write tiles into the
+            shared array with output_write_tile.
+
+            :return: a tuple of the string 'shared_output', the name of the
+                     shared memory block, and the height and width of the
+                     image"""
+            return ('shared_output', self.__shared_memory__.name,
+                    self.__pixels__.shape[0], self.__pixels__.shape[1])
+
+        def get_array(self):
+            """Returns a copy of the rendered colours.
+
+            :return: a float32 NumPy array of height x width x 3 values"""
+            return self.__pixels__.copy()
+
+        def get_output(self):
+            """Returns the rendered image. This is a PIL image if PIL is
+            available, otherwise the same as get_array."""
+            if not has_PIL:
+                return self.get_array()
+
+            return Image.fromarray(
+                (numpy.clip(self.__pixels__, 0, 1) * 255).astype(
+                    numpy.uint8), 'RGB')
+
+        def close(self):
+            """Releases the shared memory."""
+            if self.__shared_memory__ is not None:
+                self.__pixels__ = None
+                self.__shared_memory__.close()
+                self.__shared_memory__.unlink()
+                self.__shared_memory__ = None
+
+        def __del__(self):
+            self.close()
+
+
+# Shared memory blocks opened by this process for output_write_tile, keyed
+# by name
+__attached_outputs__ = {}
+
+
+def output_tile_into_array(pixels, tile, buffer):
+    """Copies a tile buffer into a height x width x 3 NumPy array.
+
+    :param pixels: the array to copy into
+    :param tile: a tile tuple, as created by view_create_tiles
+    :param buffer: the tile buffer"""
+    pixels[tile[2]:tile[4], tile[1]:tile[3]] = numpy.frombuffer(
+        buffer, dtype=numpy.float32).reshape(
+            tile[4] - tile[2], tile[3] - tile[1], 3)
+
+
+def output_write_tile(handle, tile, buffer):
+    """Writes a rendered tile into an output from a worker process.
+
+    :param handle: a handle returned by the output's get_worker_handle
+                   method
+    :param tile: a tile tuple, as created by view_create_tiles
+    :param buffer: the tile buffer"""
+    name = handle[1]
+    if name not in __attached_outputs__:
+        for attached_name in list(__attached_outputs__):
+            __attached_outputs__.pop(attached_name)[0].close()
+
+        block = shared_memory.SharedMemory(name=name)
+        __attached_outputs__[name] = (block, numpy.ndarray(
+            (handle[2], handle[3], 3), dtype=numpy.float32,
+            buffer=block.buf))
+
+    output_tile_into_array(__attached_outputs__[name][1], tile, buffer)
@@ -1,14 +1,37 @@
+from array import array
 from raytracer.cartesian import *
 from raytracer.colour import *
 from raytracer.matrix import *
 from raytracer.transformation import *
 from raytracer.shape import *
+from raytracer.bvh import *
+from raytracer.flat_tree import *
 
 """Functions for planar shapes: discs, rectangles, polygons, triangles,
 and polygon meshes.
 
 ..to do: complete docstrings, retest all functions."""
 
+# Polygon meshes without an acceleration structure test a single ray
+# against all their triangles in one vectorized pass when they have at least
+# this many, and batches of rays with shape_polymesh_intersect_batch. Meshes
+# with an acceleration structure traverse it instead, for single rays and
+# batches alike, which tests far fewer triangles: on the 3751-face teapot, a
+# BVH takes about a quarter and an octree about half the time per ray of the
+# vectorized pass.
+POLYMESH_VECTORIZE_THRESHOLD = 64
+
+# The maximum number of ray and triangle pairs tested in one pass
+POLYMESH_BATCH_SIZE = 65536
+
+# The number of values in a polygon mesh's packed face data for each face:
+# the first vertex, the edges from it to the other two, and the normal
+POLYMESH_FACE_DATA_SIZE = 12
+
+# The number of values in a polygon mesh's packed face colours for each
+# face: the red, green and blue of each of its vertices
+POLYMESH_FACE_COLOUR_SIZE = 9
+
 
 def shape_disc_intersect(shape, ray):
     """Intersection test function for a disc. An untranslated disc is
@@ -27,7 +50,7 @@ def shape_disc_intersect(shape, ray):
     if t <=0:
         return False
     point = ray_calc_pt(ray, t)
-    if not(point[1] * point[1]) + (point[2] * point[2]) <= mpfr(1):
+    if not(point[1] * point[1]) + (point[2] * point[2]) <= 1:
         return False
 
     return {'t': t,
@@ -98,6 +121,7 @@ def shape_rectangle_create(colour, specular, bounds, transform=None):
         :returns: a tuple containg data to render a rectangle
         """
     shape = shape_empty_shape()
+    shape[SHAPE_SHAPE] = 'rectangle'
     shape[SHAPE_DIFFUSECOLOUR] = colour
     shape[SHAPE_SPECULARCOLOUR] = specular
     shape[SHAPE_INTERSECT_FUNC] = shape_rectangle_intersect
@@ -148,199 +172,252 @@ def shape_polygon_convert2d(shape, point):
     return(u, v)
 
 
+def shape_polygon_normal(points):
+    """Calculates the normal of a polygon with Newell's method, which uses
+    every point, so it is reliable for concave polygons and polygons with
+    collinear points.
+
+    :param points: the points of the polygon, cartesians, in order around
+                   it
+    :return: a tuple of the x, y and z of the normal, not normalised. Its
+             length is twice the polygon's area. The polygon's points run
+             anticlockwise around it.
+    """
+    nx = 0.0
+    ny = 0.0
+    nz = 0.0
+    previous = points[-1]
+    for point in points:
+        nx += (previous[2] - point[2]) * (previous[3] + point[3])
+        ny += (previous[3] - point[3]) * (previous[1] + point[1])
+        nz += (previous[1] - point[1]) * (previous[2] + point[2])
+        previous = point
+
+    return (nx, ny, nz)
+
+
+def shape_polygon_project(points):
+    """Flattens a polygon onto the two axes it is least flat along, for
+    triangulation.
+
+    :param points: the points of the polygon, cartesians, in order around
+                   it
+    :return: a tuple of a list of the u and a list of the v of each point,
+             arranged so that the points run anticlockwise
+    """
+    normal = shape_polygon_normal(points)
+    axis = max(range(3), key=lambda axis: abs(normal[axis]))
+    u_axis = (axis + 1) % 3 + 1
+    v_axis = (axis + 2) % 3 + 1
+    sign = 1.0 if normal[axis] >= 0 else -1.0
+
+    return ([float(point[u_axis]) for point in points],
+            [sign * float(point[v_axis]) for point in points])
+
+
+def shape_polygon_turn(us, vs, a, b, c):
+    """Returns the direction of the turn at b, going from a to b to c.
+
+    :param us: the u of each point, from shape_polygon_project
+    :param vs: the v of each point, from shape_polygon_project
+    :param a: the index of the first point
+    :param b: the index of the second point
+    :param c: the index of the third point
+    :return: a number, greater than 0 for an anticlockwise turn, less than
+             0 for a clockwise turn, and 0 if the points are collinear
+    """
+    return ((us[b] - us[a]) * (vs[c] - vs[a])) - \
+        ((vs[b] - vs[a]) * (us[c] - us[a]))
+
+
+def shape_polygon_is_convex(points):
+    """Determines if a polygon is convex. Collinear points are allowed.
+
+    :param points: the points of the polygon, cartesians, in order around
+                   it
+    :return: True if the polygon is convex
+    """
+    us, vs = shape_polygon_project(points)
+    return all(shape_polygon_turn(us, vs, index - 2, index - 1, index) >= 0
+               for index in range(len(points)))
+
+
+def shape_polygon_triangulate(points):
+    """Splits a polygon into triangles. A convex polygon is split by fanning
+    out from its first point, and a concave polygon by ear clipping. The
+    triangles keep the polygon's winding.
+
+    :param points: the points of the polygon, cartesians, in order around
+                   it
+    :return: a list of tuples of three indices into points
+    """
+    count = len(points)
+    if count < 3:
+        return []
+
+    if count == 3 or shape_polygon_is_convex(points):
+        return [(0, corner, corner + 1) for corner in range(1, count - 1)]
+
+    us, vs = shape_polygon_project(points)
+    remaining = list(range(count))
+    triangles = []
+    while len(remaining) > 3:
+        size = len(remaining)
+        for position in range(size):
+            a = remaining[position - 1]
+            b = remaining[position]
+            c = remaining[(position + 1) % size]
+            if shape_polygon_turn(us, vs, a, b, c) <= 0:
+                continue
+
+            # an ear may not contain any other point of the polygon
+            if any(shape_polygon_turn(us, vs, a, b, point) >= 0 and
+                   shape_polygon_turn(us, vs, b, c, point) >= 0 and
+                   shape_polygon_turn(us, vs, c, a, point) >= 0
+                   for point in remaining if point not in (a, b, c)):
+                continue
+
+            triangles.append((a, b, c))
+            del remaining[position]
+            break
+        else:
+            # no ear, so the polygon crosses itself; fan out what is left
+            break
+
+    for corner in range(1, len(remaining) - 1):
+        triangles.append((remaining[0], remaining[corner],
+                          remaining[corner + 1]))
+
+    return triangles
+
+
 def shape_polygon_intersect(shape, ray):
-    """Intersection test function for a polygon.
+    """Intersection test function for a polygon. A convex polygon is
+    tested against the planes through each of its edges, and a concave
+    polygon against each of the triangles it was split into.
 
-    :param shape: the shape tuple for the rectangle
+    :param shape: the shape tuple for the polygon
     :param ray: the ray to perform the intersection test with
 
     :return: False if no intersection, or a dictionary of results when
             there is an intersection
     """
+    data = shape[SHAPE_DATA]
+    start = ray[RAY_START]
+    direction = ray[RAY_DIR]
+    normal = data['normal']
+
+    if data['face_data'] is not None:
+        face_data = data['face_data']
+        for face in range(len(face_data) // POLYMESH_FACE_DATA_SIZE):
+            result = shape_polymesh_face_intersect(face_data, face, start,
+                                                   direction)
+            # the triangles do not overlap, so at most one is hit
+            if result is not False:
+                t = result['t']
+                return {'t': t,
+                        'raw_point': ('cartesian',
+                                      start[1] + (direction[1] * t),
+                                      start[2] + (direction[2] * t),
+                                      start[3] + (direction[3] * t)),
+                        'raw_normal': normal}
+        return False
 
-    denom = cartesian_dot(ray[2], shape[SHAPE_DATA]['normal'])
+    denom = (direction[1] * normal[1]) + (direction[2] * normal[2]) + \
+        (direction[3] * normal[3])
     if denom == 0:
         return False
-    elif(denom > 0):
-        normal = cartesian_create(0 - shape[SHAPE_DATA]['normal'][1],
-                                  0 - shape[SHAPE_DATA]['normal'][2],
-                                  0 - shape[SHAPE_DATA]['normal'][3])
 
-    t = cartesian_dot(cartesian_sub(shape[SHAPE_DATA]['centre'], ray[
-                      1]), shape[SHAPE_DATA]['normal']) / denom
+    t = (data['plane_distance'] - ((start[1] * normal[1]) +
+                                   (start[2] * normal[2]) +
+                                   (start[3] * normal[3]))) / denom
     if t < 0:
         return False
-    result = {'t': t,
-              'raw_point': ray_calc_pt(ray, t)
-              }
 
-    result['point2d'] = shape_polygon_convert2d(shape, result['raw_point'])
+    x = start[1] + (direction[1] * t)
+    y = start[2] + (direction[2] * t)
+    z = start[3] + (direction[3] * t)
+    planes = data['edge_planes']
+    for offset in range(0, len(planes), 4):
+        if (planes[offset] * x) + (planes[offset + 1] * y) + \
+                (planes[offset + 2] * z) < planes[offset + 3]:
+            return False
 
-    count = 0
-    testSeg = ('lineseg2d', result['point2d'],
-               shape[SHAPE_DATA]['outside_point'])
-
-    for outerLineSeg in shape[SHAPE_DATA]['polygon_line_segs']:
-        if lineseg2d_intersect(testSeg, outerLineSeg):
-            count = count + 1
-
-    if count > 0 and(count % 2) == 1:
-        result['raw_normal'] = shape[SHAPE_DATA]['normal']
-        return result
-    else:
-        return False
+    return {'t': t,
+            'raw_point': ('cartesian', x, y, z),
+            'raw_normal': normal}
 
 
 def shape_polygon_create(data={}):
-    """Creates a tuple with the data necessary to render a polygon.
-
-    :param colour: the colour of the polygon.
-    :param specular: the reflective colour of the polygon.
-    :transform: the transformation to apply to the polygon.
-
-    :return: a tuple containg data to render a polygon
+    """Creates a tuple with the data necessary to render a polygon. The
+    polygon is prepared for intersection tests when it is created: a convex
+    polygon gets a plane through each edge, facing inwards, and a concave
+    polygon is split into triangles by ear clipping.
+
+    :param data: a dictionary with 'points' (the cartesian points of the
+                 polygon, in order around it), 'colour', and the optional
+                 'reflections' (the reflective colour of the polygon) and
+                 'transform' (the transformation to apply to the polygon)
+
+    :return: a tuple containg data to render a polygon, or None if there
+             are fewer than three points
     """
-    shape = shape_empty_shape()
-    shape[SHAPE_INTERSECT_FUNC] = shape_polygon_intersect
-
-    colours = data['colour']
-    points = data['points']
+    points = [cartesian_create(float(point[1]), float(point[2]),
+                               float(point[3])) for point in data['points']]
     if len(points) < 3:
         return None
-    if 'reflections' in data:
-        reflections = data['reflections']
-    else:
-        reflections = None
 
-    shape[SHAPE_DIFFUSECOLOUR] = colours
-
-    if 'transform' in data and isinstance(transform,  Transform):
-        shape_setTransform(shape, data['transform'])
-
-    shape[SHAPE_SPECULARCOLOUR] = reflections
-
-    shape[SHAPE_DATA]['centre'] = cartesian_create(
-        mpfr(points[0][1]), mpfr(points[0][3]), mpfr(points[0][3]))
-    # Normal is calculated as per triangle
-
-    shape[SHAPE_DATA]['normal'] = cartesian_normalise(cartesian_cross(
-        cartesian_sub(points[1], points[0]),
-        cartesian_sub(points[2], points[0])))
-    # print("self.normal %s"%self.normal.normalise())
-    ex = shape[SHAPE_DATA]['normal'][1]
-    if ex < 0:
-        ex = zero() - ex
-    ey = shape[SHAPE_DATA]['normal'][2]
-    if ey < 0:
-        ey = zero() - ey
-    ez = shape[SHAPE_DATA]['normal'][3]
-    if ez < 0:
-        ez = zero() - ez
-    norml = cartesian_create(ex, ey, ez)
-    # figure which axis to discard for in/out test
-    if norml[1] > norml[2] and norml[1] > norml[3]:
-        discard_axis = 'X'
-        kept_axes = {'u': 'Y', 'v': 'Z'}
-    elif norml[2] > norml[1] and norml[2] > norml[3]:
-        discard_axis = 'Y'
-        kept_axes = {'u': 'X', 'v': 'Z'}
-    elif norml[3] > norml[1] and norml[3] > norml[2]:
-        discard_axis = 'Z'
-        kept_axes = {'u': 'X', 'v': 'Y'}
+    shape = shape_empty_shape()
+    shape[SHAPE_SHAPE] = 'polygon'
+    shape[SHAPE_INTERSECT_FUNC] = shape_polygon_intersect
+    shape[SHAPE_DIFFUSECOLOUR] = data['colour']
+    shape[SHAPE_SPECULARCOLOUR] = data.get('reflections')
+
+    polygon_data = shape[SHAPE_DATA]
+    normal = cartesian_normalise(('cartesian',) +
+                                 shape_polygon_normal(points))
+    polygon_data['normal'] = normal
+    polygon_data['plane_distance'] = cartesian_dot(normal, points[0])
+
+    # the axes kept by shape_polygon_convert2d
+    magnitudes = [abs(component) for component in normal[1:4]]
+    if magnitudes[0] >= magnitudes[1] and magnitudes[0] >= magnitudes[2]:
+        polygon_data['kept_axes'] = {'u': 'Y', 'v': 'Z'}
+    elif magnitudes[1] >= magnitudes[2]:
+        polygon_data['kept_axes'] = {'u': 'X', 'v': 'Z'}
     else:
-        discard_axis = 'X'
-        kept_axes = {'u': 'Y', 'v': 'Z'}
-    shape[SHAPE_DATA]['kept_axes'] = kept_axes
-    # print("self.kept_axes %s"%self.kept_axes)
-    # create a set of point with one axis discarded
-    shape[SHAPE_DATA]['points2d'] = []
-    # print("points2d:  ")
-
-    for i in range(len(points)):
-        p2d = shape_polygon_convert2d(shape, points[i])
-        # print(p2d)
-        shape[SHAPE_DATA]['points2d'].append(p2d)
-
-    # print("polygon line segments")
-    shape[SHAPE_DATA]['polygon_line_segs'] = []
-    min_u = None
-    min_v = None
-    for i in range(len(shape[SHAPE_DATA]['points2d'])):
-        p0 = shape[SHAPE_DATA]['points2d'][i]
-        if i > 0:
-            p1 = shape[SHAPE_DATA]['points2d'][i - 1]
-        else:
-            p1 = shape[SHAPE_DATA]['points2d'][
-                len(shape[SHAPE_DATA]['points2d']) - 1]
-        ls = lineseg2d_create(p0, p1)
-        shape[SHAPE_DATA]['polygon_line_segs'].append(ls)
-        # print(ls)
-        if min_u is None or p0[0] < min_u:
-            min_u = p0[0]
-
-        if min_v is None or p0[1] < min_v:
-            min_v = p0[1]
-
-    shape[SHAPE_DATA]['outside_point'] = (min_u - 1.0, min_v - 1.0)
-
-    shape[SHAPE_DATA]['points2d'] = \
-        {'left': None,
-        'right': None,
-        'top': None,
-        'bottom': None,
-        'width': None,
-        'height': None}
-
-    for p2d in shape[SHAPE_DATA]['points2d']:
-        if (shape[SHAPE_DATA]['points2d']['left'] is None or
-            shape[SHAPE_DATA]['points2d']['left'] > p2d[0]):
-            shape[SHAPE_DATA]['points2d']['left'] = p2d[0]
-        
-        if (shape[SHAPE_DATA]['points2d']['right'] is None or
-            shape[SHAPE_DATA]['points2d']['right'] < p2d[0]):
-            shape[SHAPE_DATA]['points2d']['right'] = p2d[0]
+        polygon_data['kept_axes'] = {'u': 'X', 'v': 'Y'}
+
+    edge_planes = array('d')
+    face_data = None
+    if shape_polygon_is_convex(points):
+        previous = points[-1]
+        for point in points:
+            edge_normal = cartesian_cross(normal,
+                                          cartesian_sub(point, previous))
+            edge_planes.extend(edge_normal[1:4])
+            edge_planes.append(cartesian_dot(edge_normal, previous))
+            previous = point
+    else:
+        vertices = array('d')
+        for point in points:
+            vertices.extend(point[1:4])
+        faces = array('i')
+        for triangle in shape_polygon_triangulate(points):
+            faces.extend(triangle)
+        face_data = shape_polymesh_face_data(vertices, faces)
 
-        if (shape[SHAPE_DATA]['points2d']['top'] is None or
-            shape[SHAPE_DATA]['points2d']['top'] > p2d[1]):
-            shape[SHAPE_DATA]['points2d']['top'] = p2d[1]
-        
-        if (shape[SHAPE_DATA]['points2d']['bottom'] is None or
-            shape[SHAPE_DATA]['points2d']['bottom'] < p2d[1]):
-            shape[SHAPE_DATA]['points2d']['bottom'] = p2d[1]
-            
-    shape[SHAPE_DATA]['points2d']['width'] =  \
-        shape[SHAPE_DATA]['points2d']['right'] - \
-        shape[SHAPE_DATA]['points2d']['left']
-        
-    shape[SHAPE_DATA]['points2d']['height'] =  \
-        shape[SHAPE_DATA]['points2d']['bottom'] - \
-        shape[SHAPE_DATA]['points2d']['height']
+    polygon_data['edge_planes'] = edge_planes
+    polygon_data['face_data'] = face_data
 
-    min_x = None
-    max_x = None
-    min_y = None
-    max_y = None
-    min_z = None
-    max_z = None
-    
-    for point in points:
-        if min_x is None or point[1] < min_x:
-            min_x = point[1]
-        if min_y is None or point[2] < min_y:
-            min_y = point[2]
-        if min_z is None or point[3] < min_z:
-            min_z = point[3]              
+    shape[SHAPE_BOUNDING_BOX_SHAPESPACE] = BoundingBox(
+        min(point[1] for point in points), max(point[1] for point in points),
+        min(point[2] for point in points), max(point[2] for point in points),
+        min(point[3] for point in points), max(point[3] for point in points))
+
+    if data.get('transform') is not None:
+        shape_set_transform(shape, data['transform'])
 
-        if max_x is None or point[1] > max_x:
-            max_x = point[1]
-        if max_y is None or point[2] > max_y:
-            max_y = point[2]
-        if max_z is None or point[3] > max_z:
-            max_z = point[3]  
-        
-    shape[SHAPE_BOUNDING_BOX_SHAPESPACE] = BoundingBox (
-        min_x, max_x, min_y, max_y, min_z, max_z)
-        
     return shape
 
 
@@ -655,6 +732,73 @@ def shape_traingle_area(points, known_length = None):
     return area
 
 
+def shape_polymesh_face_uv(data, face, point):
+    """Returns the barycentric co-ordinates of a point on a face of a
+    polygon mesh.
+
+    :param data: the shape data of the polygon mesh
+    :param face: the face number
+    :param point: a point on the face, in shape space
+    :return: a tuple of the weights (u, v) of the face's second and third
+             vertices. The weight of the first vertex is 1 - u - v.
+    """
+    face_data = data['face_data']
+    offset = face * POLYMESH_FACE_DATA_SIZE
+    wx = point[1] - face_data[offset]
+    wy = point[2] - face_data[offset + 1]
+    wz = point[3] - face_data[offset + 2]
+    e1x, e1y, e1z = face_data[offset + 3:offset + 6]
+    e2x, e2y, e2z = face_data[offset + 6:offset + 9]
+
+    d00 = (e1x * e1x) + (e1y * e1y) + (e1z * e1z)
+    d01 = (e1x * e2x) + (e1y * e2y) + (e1z * e2z)
+    d11 = (e2x * e2x) + (e2y * e2y) + (e2z * e2z)
+    d20 = (wx * e1x) + (wy * e1y) + (wz * e1z)
+    d21 = (wx * e2x) + (wy * e2y) + (wz * e2z)
+    denominator = (d00 * d11) - (d01 * d01)
+    if denominator == 0:
+        return 0, 0
+
+    return (((d11 * d20) - (d01 * d21)) / denominator,
+            ((d00 * d21) - (d01 * d20)) / denominator)
+
+
+def shape_polymesh_face_colour(shape, intersect_result, colours_name,
+                               colour_name):
+    """Returns the colour of a polygon mesh at an intersection, blending the
+    colours of the vertices of the face that was hit.
+
+    :param shape: the polygon mesh
+    :param intersect_result: a dictionary of intersection results
+    :param colours_name: the name of the packed face colours in the shape
+                         data, 'face_colours' or 'face_specular_colours'
+    :param colour_name: the name of the colour of the whole mesh in the
+                        shape data, used if there are no face colours
+    :return: a colour tuple
+    """
+    data = shape[SHAPE_DATA]
+    colours = data[colours_name]
+    if colours is None:
+        return data[colour_name]
+
+    face = intersect_result['hit_face']
+    if 'face_uv' in intersect_result:
+        u, v = intersect_result['face_uv']
+    else:
+        u, v = shape_polymesh_face_uv(data, face,
+                                      intersect_result['raw_point'])
+    w = 1.0 - u - v
+
+    offset = face * POLYMESH_FACE_COLOUR_SIZE
+    return ('colour',
+            (colours[offset] * w) + (colours[offset + 3] * u) +
+            (colours[offset + 6] * v),
+            (colours[offset + 1] * w) + (colours[offset + 4] * u) +
+            (colours[offset + 7] * v),
+            (colours[offset + 2] * w) + (colours[offset + 5] * u) +
+            (colours[offset + 8] * v))
+
+
 def shape_polymesh_diffuse_colour(shape, intersect_result):
     """Returns the diffuse colour for an intersection resilt with a
     polygon mesh.
@@ -663,9 +807,12 @@ def shape_polymesh_diffuse_colour(shape, intersect_result):
     :param: intersection_result: A dictionary of intersection results
     :return: a colour tuple
     """
+    # an instance with its own material overrides the mesh's colours
+    if shape[SHAPE_DIFFUSECOLOUR] is not None:
+        return shape[SHAPE_DIFFUSECOLOUR]
 
-    return intersect_result['hit_polygon'][SHAPE_DIFFUSECOLOUR_FUNC](
-        intersect_result['hit_polygon'], intersect_result)
+    return shape_polymesh_face_colour(shape, intersect_result,
+                                      'face_colours', 'colour')
 
 
 def shape_polymesh_specular_colour(shape, intersect_result):
@@ -676,157 +823,636 @@ def shape_polymesh_specular_colour(shape, intersect_result):
     :param: intersection_result: A dictionary of intersection results
     :return: a colour tuple
     """
+    if shape[SHAPE_SPECULARCOLOUR] is not None:
+        return shape[SHAPE_SPECULARCOLOUR]
+
+    return shape_polymesh_face_colour(shape, intersect_result,
+                                      'face_specular_colours', 'reflection')
+
+
+def shape_polymesh_face_bounds(data, face):
+    """Returns the box of a face of a polygon mesh, as a BVH box.
+
+    :param data: the shape data of the polygon mesh
+    :param face: the face number
+    :return: a box, as (min_x, min_y, min_z, max_x, max_y, max_z)
+    """
+    vertices = data['vertices']
+    faces = data['faces']
+    offset = face * 3
+    a = faces[offset] * 3
+    b = faces[offset + 1] * 3
+    c = faces[offset + 2] * 3
+
+    return (min(vertices[a], vertices[b], vertices[c]),
+            min(vertices[a + 1], vertices[b + 1], vertices[c + 1]),
+            min(vertices[a + 2], vertices[b + 2], vertices[c + 2]),
+            max(vertices[a], vertices[b], vertices[c]),
+            max(vertices[a + 1], vertices[b + 1], vertices[c + 1]),
+            max(vertices[a + 2], vertices[b + 2], vertices[c + 2]))
 
-    return intersect_result['hit_polygon'][SHAPE_SPECULARCOLOUR_FUNC](
-        intersect_result['hit_polygon'], intersect_result)
 
 def shape_polymesh_octtree_setup(shape, split_threshold = 20):
-    # shape[SHAPE_BOUNDING_BOX_SHAPESPACE]
-    shape[SHAPE_DATA]['octtree'] = \
+    """Builds an octree of the faces of a polygon mesh, and compiles it into
+    a flat tree.
+
+    :param shape: the polygon mesh
+    :param split_threshold: the number of faces in a node of the octree
+                            above which it is split
+    """
+    data = shape[SHAPE_DATA]
+
+    # the octree asks for a face's box at every level it is added to
+    face_boxes = []
+    for face in range(data['face_count']):
+        bounds = shape_polymesh_face_bounds(data, face)
+        face_boxes.append(BoundingBox(bounds[0], bounds[3], bounds[1],
+                                      bounds[4], bounds[2], bounds[5]))
+
+    data['octtree'] = \
             OctTreeLeaf (shape, split_threshold,
             shape[SHAPE_BOUNDING_BOX_SHAPESPACE].min_x,
             shape[SHAPE_BOUNDING_BOX_SHAPESPACE].max_x,
             shape[SHAPE_BOUNDING_BOX_SHAPESPACE].min_y,
             shape[SHAPE_BOUNDING_BOX_SHAPESPACE].max_y,
             shape[SHAPE_BOUNDING_BOX_SHAPESPACE].min_z,
-            shape[SHAPE_BOUNDING_BOX_SHAPESPACE].max_z)
+            shape[SHAPE_BOUNDING_BOX_SHAPESPACE].max_z,
+            face_boxes.__getitem__)
+
+    # the top node is replaced in the shape data when it splits
+    for face in range(data['face_count']):
+        data['octtree'].add_shape(face)
+
+    data['octtree'] = flat_tree_from_octree(data['octtree'])
+
+
+def shape_polymesh_bvh_setup(shape, max_leaf_shapes = 4):
+    """Builds a bounding volume hierarchy of the faces of a polygon mesh,
+    and compiles it into a flat tree.
+
+    :param shape: the polygon mesh
+    :param max_leaf_shapes: the number of faces below which a node of the
+                            hierarchy is never split
+    """
+    data = shape[SHAPE_DATA]
+    data['bvh'] = flat_tree_from_bvh(BVH(
+        range(data['face_count']), max_leaf_shapes,
+        lambda face: shape_polymesh_face_bounds(data, face)))
+
+
+def shape_polymesh_face_intersect(face_data, face, start, direction):
+    """Tests a ray against one face of a polygon mesh, using the same
+    Moller-Trumbore test as shape_triangle_intersect. The ray must be in the
+    mesh's shape space.
+
+    :param face_data: the packed face data of the mesh
+    :param face: the face number
+    :param start: the start point of the ray
+    :param direction: the direction of the ray
+    :return: a dictionary of intersection results, with only t and the
+             face number as 'hit_face', or False. The other results are
+             added by shape_polymesh_finalize, for the face that is used.
+    """
+    offset = face * POLYMESH_FACE_DATA_SIZE
+    e1x, e1y, e1z = face_data[offset + 3:offset + 6]
+    e2x, e2y, e2z = face_data[offset + 6:offset + 9]
+    dx = direction[1]
+    dy = direction[2]
+    dz = direction[3]
+
+    px = (dy * e2z) - (dz * e2y)
+    py = (dz * e2x) - (dx * e2z)
+    pz = (dx * e2y) - (dy * e2x)
+    det = (e1x * px) + (e1y * py) + (e1z * pz)
+
+    # ray and triangle are parallel if det is 0
+    if det == 0:
+        return False
+
+    inv_det = 1.0 / det
+    sx = start[1] - face_data[offset]
+    sy = start[2] - face_data[offset + 1]
+    sz = start[3] - face_data[offset + 2]
+    u = inv_det * ((sx * px) + (sy * py) + (sz * pz))
+    if u < 0 or u > 1.0:
+        return False
+
+    qx = (sy * e1z) - (sz * e1y)
+    qy = (sz * e1x) - (sx * e1z)
+    qz = (sx * e1y) - (sy * e1x)
+    v = inv_det * ((dx * qx) + (dy * qy) + (dz * qz))
+    if v < 0 or v > 1.0 or (u + v) > 1.0:
+        return False
+
+    t = inv_det * ((e2x * qx) + (e2y * qy) + (e2z * qz))
+    if t < 0:
+        return False
+
+    return {'t': t, 'hit_face': face}
+
+
+def shape_polymesh_finalize(shape, intersect_result, ray):
+    """Adds the point, the face's normal and the barycentric co-ordinates of
+    the point on the face, as 'face_uv', to the results of an intersection
+    with a polygon mesh.
+
+    :param shape: the shape tuple for the polygon mesh
+    :param intersect_result: a dictionary of intersection results, from
+                             shape_polymesh_intersect
+    :param ray: the ray the intersection was found with, in shape space
+    """
+    data = shape[SHAPE_DATA]
+    face = intersect_result['hit_face']
+    offset = face * POLYMESH_FACE_DATA_SIZE
+    point = ray_calc_pt(ray, intersect_result['t'])
+
+    intersect_result['raw_point'] = point
+    intersect_result['raw_normal'] = ('cartesian',) + tuple(
+        data['face_data'][offset + 9:offset + 12])
+    intersect_result['face_uv'] = shape_polymesh_face_uv(data, face, point)
+
+
+def shape_triangle_intersect_batch(p0, e1, e2, starts, directions):
+    """Intersection test for a batch of rays against a set of triangles, using
+    the same Moller-Trumbore test as shape_triangle_intersect.
+
+    :param p0: a T x 3 array with the first vertex of each triangle
+    :param e1: a T x 3 array with the edge from p0 to the second vertex
+    :param e2: a T x 3 array with the edge from p0 to the third vertex
+    :param starts: an N x 3 array of ray start points
+    :param directions: an N x 3 array of ray directions
+
+    :return: an N x T array of t for each ray and triangle, with numpy.inf
+             where a ray does not intersect a triangle
+    """
+    # the cross and dot products are written out by component, giving
+    # N x T arrays without any N x T x 3 intermediates
+    dx = directions[:, 0:1]
+    dy = directions[:, 1:2]
+    dz = directions[:, 2:3]
+
+    px = (dy * e2[:, 2]) - (dz * e2[:, 1])
+    py = (dz * e2[:, 0]) - (dx * e2[:, 2])
+    pz = (dx * e2[:, 1]) - (dy * e2[:, 0])
+    det = (e1[:, 0] * px) + (e1[:, 1] * py) + (e1[:, 2] * pz)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        inv_det = 1.0 / det
+
+        sx = starts[:, 0:1] - p0[:, 0]
+        sy = starts[:, 1:2] - p0[:, 1]
+        sz = starts[:, 2:3] - p0[:, 2]
+        u = inv_det * ((sx * px) + (sy * py) + (sz * pz))
+
+        qx = (sy * e1[:, 2]) - (sz * e1[:, 1])
+        qy = (sz * e1[:, 0]) - (sx * e1[:, 2])
+        qz = (sx * e1[:, 1]) - (sy * e1[:, 0])
+        v = inv_det * ((dx * qx) + (dy * qy) + (dz * qz))
+        t = inv_det * ((e2[:, 0] * qx) + (e2[:, 1] * qy) + (e2[:, 2] * qz))
+
+        hit = ((det != 0) & (u >= 0) & (u <= 1.0) & (v >= 0) & (v <= 1.0) &
+               ((u + v) <= 1.0) & (t >= 0))
+
+    return numpy.where(hit, t, numpy.inf)
+
+
+def shape_polymesh_face_arrays(shape):
+    """Returns the packed face data of a polygon mesh as a NumPy array, for
+    the batch intersection functions. The array shares the face data's
+    memory.
+
+    :param shape: the polygon mesh
+    :return: an F x 12 array, holding the first vertex, the two edges from
+             it, and the normal of each face
+    """
+    return numpy.frombuffer(shape[SHAPE_DATA]['face_data'],
+                            dtype=numpy.float64).reshape(
+                                -1, POLYMESH_FACE_DATA_SIZE)
+
+
+def shape_polymesh_intersect_triangles(shape, starts, directions,
+                                       indexes=None):
+    """Finds the nearest face of a polygon mesh hit by each of a batch of
+    rays. The rays must be in the mesh's shape space.
+
+    :param shape: the polygon mesh
+    :param starts: an N x 3 array of ray start points
+    :param directions: an N x 3 array of ray directions
+    :param indexes: an array of the numbers of the faces to test, or None to
+                    test all the faces
+
+    :return: a tuple of arrays: t for each ray (numpy.inf if no face is
+             hit), and the number of the nearest face hit by each ray
+    """
+    faces = shape_polymesh_face_arrays(shape)
+    if indexes is None:
+        indexes = numpy.arange(len(faces))
+    else:
+        faces = faces[indexes]
+    p0 = faces[:, 0:3]
+    e1 = faces[:, 3:6]
+    e2 = faces[:, 6:9]
+
+    t = numpy.full(len(starts), numpy.inf)
+    nearest = numpy.zeros(len(starts), dtype=numpy.intp)
+    if len(indexes) == 0:
+        return t, nearest
+
+    # limit the size of the N x T arrays used by the test
+    chunk_size = max(1, POLYMESH_BATCH_SIZE // len(indexes))
+
+    for chunk in range(0, len(starts), chunk_size):
+        chunk_t = shape_triangle_intersect_batch(
+            p0, e1, e2, starts[chunk:chunk + chunk_size],
+            directions[chunk:chunk + chunk_size])
+        chunk_nearest = numpy.argmin(chunk_t, axis=1)
+        t[chunk:chunk + chunk_size] = chunk_t[
+            numpy.arange(len(chunk_t)), chunk_nearest]
+        nearest[chunk:chunk + chunk_size] = indexes[chunk_nearest]
+
+    return t, nearest
+
+
+def shape_polymesh_intersect_batch(shape, starts, directions):
+    """Intersection test function for a polygon mesh with a batch of rays.
+    Rays that miss the mesh's bounding box are skipped, and the other rays are
+    tested against all the faces of the mesh at once. Only used for meshes
+    without an acceleration structure, see shape_polymesh_setup_faces.
+
+    :param shape: the shape tuple for the polygon mesh
+    :param starts: an N x 3 array of ray start points
+    :param directions: an N x 3 array of ray directions
+
+    :return: a tuple of arrays: t for each ray, a mask of the rays that
+             intersect, the intersection points in shape space, the
+             normals at the intersection points in world space, and a
+             dictionary with the number of the face hit by each ray as
+             'hit_face'.
+    """
+    if shape[SHAPE_TRANSFORM] is not None:
+        starts, directions = shape[SHAPE_TRANSFORM].transform_batch(
+            starts, directions)
+
+    box = shape[SHAPE_BOUNDING_BOX_SHAPESPACE]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        inv_directions = 1.0 / directions
+        t_min = (numpy.array([box.min_x, box.min_y, box.min_z],
+                             dtype=numpy.float64) - starts) * inv_directions
+        t_max = (numpy.array([box.max_x, box.max_y, box.max_z],
+                             dtype=numpy.float64) - starts) * inv_directions
+    t_near = numpy.nanmax(numpy.minimum(t_min, t_max), axis=1)
+    t_far = numpy.nanmin(numpy.maximum(t_min, t_max), axis=1)
+    rays = numpy.flatnonzero((t_near <= t_far) & (t_far >= 0))
+
+    t = numpy.full(len(starts), numpy.inf)
+    nearest = numpy.zeros(len(starts), dtype=numpy.intp)
+    t[rays], nearest[rays] = shape_polymesh_intersect_triangles(
+        shape, starts[rays], directions[rays])
+    hit = numpy.isfinite(t)
+
+    points = starts + (directions * numpy.where(hit, t, 0)[:, numpy.newaxis])
+    normals = shape_polymesh_face_arrays(shape)[nearest, 9:12]
+    if shape[SHAPE_TRANSFORM] is not None:
+        normals = shape[SHAPE_TRANSFORM].transform_normals_batch(normals)
+
+    return t, hit, points, normals, {'hit_face': nearest.tolist()}
 
-    for sh in shape[SHAPE_DATA]['polygons']:
-        shape[SHAPE_DATA]['octtree'].add_shape(sh)
-    
-    #import pdb; pdb.set_trace();
-    
 
 def shape_polymesh_intersect(shape, ray, use_octtree = True):
-    """Intersection test function for a polygon mesh.
+    """Intersection test function for a polygon mesh. If the mesh has an
+    acceleration structure, it is traversed front to back, stopping at the
+    nearest hit. Otherwise, the ray is tested against all the faces, in one
+    vectorized pass for meshes with at least POLYMESH_VECTORIZE_THRESHOLD
+    faces.
 
     :param shape: the shape tuple for the polygon mesh
     :param ray: the ray to perform the intersection test with
+    :param use_octtree: if False, the mesh's acceleration structure is not
+                        used
 
     :return: False if no intersection, or a dictionary of results when
             there is an intersection
     """
+    data = shape[SHAPE_DATA]
+    face_data = data['face_data']
+    start = ray[RAY_START]
+    direction = ray[RAY_DIR]
+
+    def intersect_face(face, ray):
+        return shape_polymesh_face_intersect(face_data, face, start,
+                                             direction)
+
+    for accelerator in ('bvh', 'octtree'):
+        if use_octtree and accelerator in data:
+            # a shadow ray is blocked by any face before its end
+            result, face = flat_tree_get_nearest_hit(
+                data[accelerator], ray, intersect_face,
+                1 if ray[RAY_ISSHADOW] else None)
+            return result
+
+    if has_numpy and data['face_count'] >= POLYMESH_VECTORIZE_THRESHOLD:
+        t, nearest = shape_polymesh_intersect_triangles(
+            shape, numpy.array([start[1:4]], dtype=numpy.float64),
+            numpy.array([direction[1:4]], dtype=numpy.float64))
+        if t[0] == numpy.inf:
+            return False
+
+        return {'t': float(t[0]), 'hit_face': int(nearest[0])}
 
-    # import pdb; pdb.set_trace();
-
-    if use_octtree:
-        shapes =  shape[SHAPE_DATA]['octtree'].get_shapes_by_ray(ray)  
-    else:
-        shapes = shape[SHAPE_DATA]['polygons']
-    
     final_result = False
-
-    for polygon in shapes:
-        result = polygon[SHAPE_INTERSECT_FUNC](polygon, ray)
-        if result is not False:
-            if final_result is False or result['t'] < final_result['t']:
-                final_result = result
-                final_result['hit_polygon'] = polygon
-            # if ray[3]: return final_result
+    for face in range(data['face_count']):
+        result = intersect_face(face, ray)
+        if result is not False and \
+                (final_result is False or result['t'] < final_result['t']):
+            final_result = result
 
     return final_result
 
 def shape_polymesh_replace_octtree_node(shape, octree_node):        
         shape[SHAPE_DATA]['octtree']  = octree_node
 
-def shape_polymesh_create(data, use_octtree = True):
+
+def shape_polymesh_pack_colours(colours, mesh_colour, polygon, triangle):
+    """Returns the colours of the vertices of a triangle of a polygon mesh,
+    for the packed face colours.
+
+    :param colours: the colour of the polygon the triangle is part of: a
+                    colour tuple, a list of colours for each of the
+                    polygon's points, or None to use mesh_colour
+    :param mesh_colour: the colour of the whole mesh, or None
+    :param polygon: the point indices of the polygon
+    :param triangle: the point indices of the triangle
+    :return: a list of nine values, the red, green and blue of each vertex
+    """
+    if colours is None:
+        colours = mesh_colour
+    if colours is None or 'colour_mapping' in colours:
+        return [0.0] * POLYMESH_FACE_COLOUR_SIZE
+
+    if 'colour' in colours:
+        return list(colours[1:4]) * 3
+
+    packed = []
+    for index in triangle:
+        packed.extend(colours[polygon.index(index)][1:4])
+    return packed
+
+
+def shape_polymesh_create(data, use_octtree = True, accelerator = 'octree'):
+    """Creates a polygon mesh. The mesh is stored as arrays: the vertices,
+    three vertex indices for each triangular face, and packed face data
+    used for intersection tests. Polygons with more than three points are
+    split into triangles by shape_polygon_triangulate, once, when the mesh
+    is created.
+
+    :param data: a dictionary of mesh data, with 'points' (a list of
+                 cartesians), 'polygon_point_indices' (a list of lists of
+                 indices into points, one for each polygon), and the
+                 optional elements 'colour', 'reflection',
+                 'face_diffuse_colours' and 'face_specular_colours'. Face
+                 colours are given for each polygon, as a colour tuple, a
+                 list of colours for each of the polygon's points, or None
+                 to use the colour of the whole mesh.
+    :param use_octtree: if False, no acceleration structure is used, and
+                        every face is tested against each ray
+    :param accelerator: the acceleration structure for the mesh's faces,
+                        'octree' or 'bvh'
+    :return: the polygon mesh
+    """
+    mesh_data = {'colour': data.get('colour'),
+                 'reflection': data.get('reflection')}
+
+    vertices = array('d')
+    for point in data['points']:
+        vertices.extend((point[1], point[2], point[3]))
+
+    faces = array('i')
+    face_colours = None
+    face_specular_colours = None
+    if data.get('face_diffuse_colours') is not None:
+        face_colours = array('d')
+    if data.get('face_specular_colours') is not None:
+        face_specular_colours = array('d')
+
+    points = data['points']
+    for polygon_number, polygon in enumerate(data['polygon_point_indices']):
+        if len(polygon) == 3:
+            triangles = ((0, 1, 2),)
+        else:
+            triangles = shape_polygon_triangulate(
+                [points[index] for index in polygon])
+
+        for corners in triangles:
+            triangle = (polygon[corners[0]], polygon[corners[1]],
+                        polygon[corners[2]])
+            faces.extend(triangle)
+
+            if face_colours is not None:
+                face_colours.extend(shape_polymesh_pack_colours(
+                    data['face_diffuse_colours'][polygon_number],
+                    mesh_data['colour'], polygon, triangle))
+            if face_specular_colours is not None:
+                face_specular_colours.extend(shape_polymesh_pack_colours(
+                    data['face_specular_colours'][polygon_number],
+                    mesh_data['reflection'], polygon, triangle))
+
+    mesh_data['vertices'] = vertices
+    mesh_data['faces'] = faces
+    mesh_data['face_colours'] = face_colours
+    mesh_data['face_specular_colours'] = face_specular_colours
+
+    return shape_polymesh_create_indexed(mesh_data, use_octtree, accelerator)
+
+
+def shape_polymesh_create_indexed(mesh_data, use_octtree = True,
+                                  accelerator = 'octree'):
+    """Creates a polygon mesh from shape data that already holds its vertex
+    and face arrays, as built by shape_polymesh_create or loaded from a
+    file. Any packed face data or acceleration structure already in the
+    shape data is kept, and only what is missing is computed.
+
+    :param mesh_data: a dictionary with 'vertices' (x, y and z for each
+                      vertex) and 'faces' (three vertex indices for each
+                      triangle), which may be arrays or memoryviews, and the
+                      optional elements 'colour', 'reflection',
+                      'face_colours', 'face_specular_colours', 'face_data'
+                      and 'bvh'. It becomes the shape data of the mesh.
+    :param use_octtree: if False, no acceleration structure is built
+    :param accelerator: the acceleration structure to build for the mesh's
+                        faces, 'octree' or 'bvh'
+    :return: the polygon mesh
+    """
     shape = shape_empty_shape()
     shape[SHAPE_SHAPE] = 'polymesh'
-    
+
     shape[SHAPE_INTERSECT_FUNC] = shape_polymesh_intersect
+    shape[SHAPE_FINALIZE_FUNC] = shape_polymesh_finalize
     shape[SHAPE_DIFFUSECOLOUR_FUNC] = shape_polymesh_diffuse_colour
     shape[SHAPE_SPECULARCOLOUR_FUNC] = shape_polymesh_specular_colour
-    if 'colour' in data:
-        colour = data['colour']
-    else:
-        colour = None
 
-    if 'reflection' in data:
-        reflection = data['reflection']
-    else:
-        reflection = None
+    for name in ('colour', 'reflection', 'face_colours',
+                 'face_specular_colours'):
+        mesh_data.setdefault(name, None)
+    shape[SHAPE_DATA] = mesh_data
+    shape_polymesh_setup_faces(shape, use_octtree, accelerator)
 
-    if 'transform' in data:
-        transform = data['transform']
-    else:
-        transform = None
-    polygons = []
-    points = data['points']
-    polygon_point_indices = data['polygon_point_indices']
+    return shape
 
-    if 'face_diffuse_colours' in data:
-        face_diffuse_colours = data['face_diffuse_colours']
-    else:
-        face_diffuse_colours = []
 
-    if 'face_specular_colours' in data:
-        face_specular_colours = data['face_reflect_colours']
-    else:
-        face_reflect_colours = None
+def shape_polymesh_face_data(vertices, faces):
+    """Computes the packed face data of a polygon mesh: the first vertex of
+    each face, the edges from it to the other two, and the face's normal.
 
-    do_refl = face_reflect_colours is not None
-    if not do_refl:
-        tri_refl = None
-    face = -1
-    
-    min_x = None
-    max_x = None
-    min_y = None
-    max_y = None
-    min_z = None
-    max_z = None
-    
-    for polygon_points in polygon_point_indices:
-        face = face + 1
+    :param vertices: the x, y and z of each vertex
+    :param faces: three vertex indices for each face
+    :return: an array('d') of POLYMESH_FACE_DATA_SIZE values for each face
+    """
+    face_data = array('d')
+
+    if has_numpy:
+        # the same arithmetic as the loop below, for every face at once
+        points = numpy.asarray(vertices, dtype=numpy.float64).reshape(-1, 3)
+        indices = numpy.asarray(faces, dtype=numpy.intp).reshape(-1, 3)
+        p0 = points[indices[:, 0]]
+        e1 = points[indices[:, 1]] - p0
+        e2 = points[indices[:, 2]] - p0
+
+        normals = numpy.empty_like(p0)
+        normals[:, 0] = (e1[:, 1] * e2[:, 2]) - (e1[:, 2] * e2[:, 1])
+        normals[:, 1] = (e1[:, 2] * e2[:, 0]) - (e1[:, 0] * e2[:, 2])
+        normals[:, 2] = (e1[:, 0] * e2[:, 1]) - (e1[:, 1] * e2[:, 0])
+        lengths = numpy.sqrt((normals[:, 0] * normals[:, 0]) +
+                             (normals[:, 1] * normals[:, 1]) +
+                             (normals[:, 2] * normals[:, 2]))
+        nonzero = lengths > 0
+        normals[nonzero] /= lengths[nonzero, numpy.newaxis]
+
+        face_data.frombytes(
+            numpy.hstack((p0, e1, e2, normals)).tobytes())
+        return face_data
+
+    for offset in range(0, len(faces), 3):
+        a = faces[offset] * 3
+        b = faces[offset + 1] * 3
+        c = faces[offset + 2] * 3
+
+        e1x = vertices[b] - vertices[a]
+        e1y = vertices[b + 1] - vertices[a + 1]
+        e1z = vertices[b + 2] - vertices[a + 2]
+        e2x = vertices[c] - vertices[a]
+        e2y = vertices[c + 1] - vertices[a + 1]
+        e2z = vertices[c + 2] - vertices[a + 2]
+
+        nx = (e1y * e2z) - (e1z * e2y)
+        ny = (e1z * e2x) - (e1x * e2z)
+        nz = (e1x * e2y) - (e1y * e2x)
+        length = sqrt((nx * nx) + (ny * ny) + (nz * nz))
+        if length > 0:
+            nx = nx / length
+            ny = ny / length
+            nz = nz / length
+
+        face_data.extend((vertices[a], vertices[a + 1], vertices[a + 2],
+                          e1x, e1y, e1z, e2x, e2y, e2z, nx, ny, nz))
+
+    return face_data
+
+
+def shape_polymesh_vertex_bounds(vertices, faces):
+    """Returns the bounding box of the vertices used by the faces of a
+    polygon mesh.
 
-        tri_points = []
-        for polygon_point in polygon_points:
-            tri_points.append(points[polygon_point])
-            
-            if min_x is None or points[polygon_point][1] < min_x:
-                min_x = points[polygon_point][1]
-            if min_y is None or points[polygon_point][2] < min_y:
-                min_y = points[polygon_point][2]
-            if min_z is None or points[polygon_point][3] < min_z:
-                min_z = points[polygon_point][3]              
-
-            if max_x is None or points[polygon_point][1] > max_x:
-                max_x = points[polygon_point][1]
-            if max_y is None or points[polygon_point][2] > max_y:
-                max_y = points[polygon_point][2]
-            if max_z is None or points[polygon_point][3] > max_z:
-                max_z = points[polygon_point][3]  
+    :param vertices: the x, y and z of each vertex
+    :param faces: three vertex indices for each face
+    :return: a BoundingBox
+    """
+    if has_numpy:
+        points = numpy.asarray(vertices, dtype=numpy.float64).reshape(-1, 3)
+        used = numpy.zeros(len(points), dtype=bool)
+        used[numpy.asarray(faces, dtype=numpy.intp)] = True
+        lower = points[used].min(axis=0)
+        upper = points[used].max(axis=0)
+        return BoundingBox(float(lower[0]), float(upper[0]),
+                           float(lower[1]), float(upper[1]),
+                           float(lower[2]), float(upper[2]))
+
+    used = sorted(set(faces))
+    xs = [vertices[index * 3] for index in used]
+    ys = [vertices[index * 3 + 1] for index in used]
+    zs = [vertices[index * 3 + 2] for index in used]
+    return BoundingBox(min(xs), max(xs), min(ys), max(ys), min(zs), max(zs))
+
+
+def shape_polymesh_setup_faces(shape, use_octtree = True,
+                               accelerator = 'octree'):
+    """Computes the packed face data and bounding box of a polygon mesh
+    from its vertex and face arrays, and builds its acceleration structure,
+    unless the shape data already holds them.
+
+    :param shape: the polygon mesh
+    :param use_octtree: if False, no acceleration structure is built
+    :param accelerator: the acceleration structure for the mesh's faces,
+                        'octree' or 'bvh'
+    """
+    data = shape[SHAPE_DATA]
+    data['face_count'] = len(data['faces']) // 3
 
-        
+    if 'face_data' not in data:
+        data['face_data'] = shape_polymesh_face_data(data['vertices'],
+                                                     data['faces'])
 
-        tri_colours = None
-        if('face_diffuse_colours' in data and
-                face_diffuse_colours[face] is not None):
-            tri_colours = face_diffuse_colours[face]
-        elif colour is not None:
-            tri_colours = colour
+    if data['face_count'] == 0:
+        return
 
-        if do_refl:
-            tri_refl = None
-            if('face_specular_colours' in data and
-                    face_diffuse_colours[face] is not None):
-                tri_colours = face_specular_colours[face]
-            elif reflection is not None:
-                tri_refl = reflection
+    shape[SHAPE_BOUNDING_BOX_SHAPESPACE] = shape_polymesh_vertex_bounds(
+        data['vertices'], data['faces'])
+
+    if use_octtree and 'bvh' not in data and 'octtree' not in data:
+        if accelerator == 'bvh':
+            shape_polymesh_bvh_setup(shape)
+        else:
+            shape_polymesh_octtree_setup(shape)
+
+    # batches of rays are tested against every face, so meshes with an
+    # acceleration structure leave their rays to traverse it one by one
+    if has_numpy and 'bvh' not in data and 'octtree' not in data:
+        shape[SHAPE_INTERSECT_BATCH_FUNC] = shape_polymesh_intersect_batch
+
+
+def shape_polymesh_instance_create(mesh, transform=None, colour=None,
+                                   reflection=None):
+    """Creates an instance of a polygon mesh: a shape that shares the mesh's
+    vertex and face arrays and acceleration structure, and has only its
+    own transformation and material. Placing many copies of a model this
+    way costs the memory and build time of one model. In a scene using the
+    'bvh' accelerator, the scene's hierarchy over the instances' bounding
+    boxes sits above the hierarchy of each mesh, built by
+    shape_polymesh_create with the 'bvh' accelerator.
+
+    :param mesh: a polygon mesh, from shape_polymesh_create
+    :param transform: a Transform or a dictionary of transformation options
+                      for the instance, or None
+    :param colour: a colour for every polygon of the instance, or None to
+                   use the colours of the mesh's polygons
+    :param reflection: a reflection colour for every polygon of the
+                       instance, or None to use the mesh's
+    :return: the polygon mesh instance
+    """
+    shape = shape_empty_shape()
+    shape[SHAPE_SHAPE] = 'polymesh'
+    shape[SHAPE_INTERSECT_FUNC] = mesh[SHAPE_INTERSECT_FUNC]
+    shape[SHAPE_INTERSECT_BATCH_FUNC] = mesh[SHAPE_INTERSECT_BATCH_FUNC]
+    shape[SHAPE_FINALIZE_FUNC] = mesh[SHAPE_FINALIZE_FUNC]
+    shape[SHAPE_DIFFUSECOLOUR_FUNC] = shape_polymesh_diffuse_colour
+    shape[SHAPE_SPECULARCOLOUR_FUNC] = shape_polymesh_specular_colour
+    shape[SHAPE_DIFFUSECOLOUR] = colour
+    shape[SHAPE_SPECULARCOLOUR] = reflection
+
+    # the shape space data and bounding box are shared, not copied
+    shape[SHAPE_DATA] = mesh[SHAPE_DATA]
+    shape[SHAPE_BOUNDING_BOX_SHAPESPACE] = mesh[SHAPE_BOUNDING_BOX_SHAPESPACE]
+    shape_set_transform(shape, transform)
 
-        if len(tri_points) == 3:
-            polygons.append(shape_triangle_create(tri_points, tri_colours))
-        elif len(tri_points) > 3:
-            polygons.append(shape_polygon_create(
-                {'points': tri_points, 'colour': tri_colours}))
-                
-    shape[SHAPE_BOUNDING_BOX_SHAPESPACE] = BoundingBox (
-        min_x, max_x, min_y, max_y, min_z, max_z)
-        
-    shape[SHAPE_DATA]['polygons'] = polygons
-    
-    if use_octtree:
-        shape_polymesh_octtree_setup(shape)    
     return shape
 
 
@@ -0,0 +1,131 @@
+import math
+import os
+import sys
+import raytracer.mpfr_dummy
+
+"""Selects the number type used for the raytracer's calculations. Modules
+import the maths functions they need from this module rather than from
+gmpy2 or math directly. The available precision backends are:
+
+* 'mpfr': gmpy2 mpfr values, whose precision is set through get_context().
+  If gmpy2 is not installed, 'float' is used instead.
+* 'float': native Python floats (IEEE 754 double precision, as float64).
+* 'numpy': NumPy float64 scalars.
+
+'float' is the default, being much faster than mpfr and more than precise
+enough for 8-bit image output. The backend can be chosen by setting the
+RAYTRACER_PRECISION environment variable before the raytracer is imported,
+or by calling precision_set_backend before a scene is built.
+"""
+
+PRECISION_BACKENDS = ('mpfr', 'float', 'numpy')
+PRECISION_DEFAULT_BACKEND = 'float'
+
+__all__ = ['mpfr', 'sqrt', 'sin', 'cos', 'tan', 'asin', 'acos', 'atan',
+           'atan2', 'radians', 'degrees', 'pi', 'get_context',
+           'precision_set_backend', 'precision_get_backend',
+           'PRECISION_BACKENDS']
+
+# The names in __all__ that are provided by the backend
+__backend_names__ = __all__[:13]
+
+
+def precision_backend_functions(backend):
+    """Returns the number type and maths functions for a precision backend.
+
+    :param backend: 'mpfr', 'float' or 'numpy'
+    :return: a dictionary of functions, keyed by name
+    """
+    functions = {
+        'mpfr': float,
+        'sqrt': math.sqrt,
+        'sin': math.sin,
+        'cos': math.cos,
+        'tan': math.tan,
+        'asin': math.asin,
+        'acos': math.acos,
+        'atan': math.atan,
+        'atan2': math.atan2,
+        'radians': math.radians,
+        'degrees': math.degrees,
+        'pi': math.pi,
+        'get_context': raytracer.mpfr_dummy.get_context}
+
+    if backend == 'mpfr':
+        try:
+            import gmpy2
+        except ImportError:
+            return functions
+
+        for name in __backend_names__:
+            if name == 'pi':
+                functions[name] = gmpy2.const_pi()
+            else:
+                functions[name] = getattr(gmpy2, name)
+
+    elif backend == 'numpy':
+        import numpy
+
+        functions['mpfr'] = numpy.float64
+        functions['sqrt'] = numpy.sqrt
+        functions['sin'] = numpy.sin
+        functions['cos'] = numpy.cos
+        functions['tan'] = numpy.tan
+        functions['asin'] = numpy.arcsin
+        functions['acos'] = numpy.arccos
+        functions['atan'] = numpy.arctan
+        functions['atan2'] = numpy.arctan2
+        functions['radians'] = numpy.radians
+        functions['degrees'] = numpy.degrees
+        functions['pi'] = numpy.float64(numpy.pi)
+
+    elif backend != 'float':
+        raise ValueError("unknown precision backend '%s', expected one of %s"
+                         % (backend, ', '.join(PRECISION_BACKENDS)))
+
+    return functions
+
+
+def precision_get_backend():
+    """Returns the name of the precision backend in use.
+
+    :return: 'mpfr', 'float' or 'numpy'
+    """
+    return __backend__
+
+
+def precision_set_backend(backend):
+    """Changes the precision backend. The maths functions are replaced in
+    every raytracer module already imported. Values created before the
+    change, such as shape and view data, keep their previous type, so the
+    backend should be set before a scene is built.
+
+    :param backend: 'mpfr', 'float' or 'numpy'
+    """
+    global __backend__
+
+    old_functions = dict((name, globals()[name])
+                         for name in __backend_names__)
+    new_functions = precision_backend_functions(backend)
+
+    for module_name in list(sys.modules):
+        if module_name != 'raytracer' and \
+                not module_name.startswith('raytracer.'):
+            continue
+        if module_name in (__name__, 'raytracer.mpfr_dummy'):
+            continue
+
+        module = sys.modules[module_name]
+        if module is None:
+            continue
+
+        for name in __backend_names__:
+            if getattr(module, name, None) is old_functions[name]:
+                setattr(module, name, new_functions[name])
+
+    globals().update(new_functions)
+    __backend__ = backend
+
+
+__backend__ = os.environ.get('RAYTRACER_PRECISION', PRECISION_DEFAULT_BACKEND)
+globals().update(precision_backend_functions(__backend__))
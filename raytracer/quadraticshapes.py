@@ -19,19 +19,20 @@ def shape_sphere_intersect(shape, ray):
     :param ray: the ray to perform the intersection test with
 
     :return: False if no intersection, or a dictionary of results when
-             there is an intersection.
+             there is an intersection. The results only hold t, and the
+             rest are added by shape_sphere_finalize.
     """
 
     a = cartesian_dot(ray[2], ray[2])
-    b = mpfr(2) * cartesian_dot(ray[2], ray[1])
-    c = cartesian_dot(ray[1], ray[1]) - mpfr(1)
+    b = 2 * cartesian_dot(ray[2], ray[1])
+    c = cartesian_dot(ray[1], ray[1]) - 1
 
-    discriminant = ((b * b) - (mpfr(4) * a * c))
+    discriminant = ((b * b) - (4 * a * c))
     if(discriminant < 0):
         return False
     sqroot = sqrt(discriminant)
 
-    two_a = mpfr(2) * a
+    two_a = 2 * a
     t1 = ((0 - b) + sqroot) / (two_a)
     t2 = ((0 - b) - sqroot) / (two_a)
 
@@ -47,11 +48,66 @@ def shape_sphere_intersect(shape, ray):
         else:
             t = t2
 
-    result = {'t': t,
-        'raw_point': ray_calc_pt(ray, t)}
+    return {'t': t}
 
-    result['raw_normal'] = result['raw_point']
-    return result
+
+def shape_sphere_finalize(shape, intersect_result, ray):
+    """Adds the point and normal to the results of an intersection with a
+    sphere.
+
+    :param shape: the shape tuple for the sphere
+    :param intersect_result: a dictionary of intersection results, from
+                             shape_sphere_intersect
+    :param ray: the ray the intersection was found with, in shape space
+    """
+    point = ray_calc_pt(ray, intersect_result['t'])
+    intersect_result['raw_point'] = point
+    intersect_result['raw_normal'] = point
+
+
+def shape_sphere_intersect_batch(shape, starts, directions):
+    """Intersection test function for a sphere with a batch of rays. Each
+    ray gives the same intersection as shape_sphere_intersect. The rays are
+    in world space, and are transformed into shape space here.
+
+    :param shape: the shape tuple for the sphere
+    :param starts: an N x 3 array of ray start points
+    :param directions: an N x 3 array of ray directions
+
+    :return: a tuple of arrays: t for each ray, a mask of the rays that
+             intersect, the intersection points in shape space, and the
+             normals at the intersection points in world space. The last
+             element is None, as spheres add no other intersection results.
+    """
+    if shape[SHAPE_TRANSFORM] is not None:
+        starts, directions = shape[SHAPE_TRANSFORM].transform_batch(
+            starts, directions)
+
+    a = numpy.einsum('ij,ij->i', directions, directions)
+    b = 2 * numpy.einsum('ij,ij->i', directions, starts)
+    c = numpy.einsum('ij,ij->i', starts, starts) - 1
+
+    discriminant = (b * b) - (4 * a * c)
+    hit = discriminant >= 0
+    sqroot = numpy.sqrt(numpy.where(hit, discriminant, 0))
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        two_a = 2 * a
+        t1 = ((0 - b) + sqroot) / two_a
+        t2 = ((0 - b) - sqroot) / two_a
+
+    t_near = numpy.minimum(t1, t2)
+    t = numpy.where(t_near >= 0, t_near, numpy.maximum(t1, t2))
+    hit &= t >= 0
+
+    points = starts + (directions * t[:, numpy.newaxis])
+
+    if shape[SHAPE_TRANSFORM] is not None:
+        normals = shape[SHAPE_TRANSFORM].transform_normals_batch(points)
+    else:
+        normals = points
+
+    return t, hit, points, normals, None
 
 
 def shape_sphere_create(colour, specular, transform=None):
@@ -69,6 +125,9 @@ def shape_sphere_create(colour, specular, transform=None):
     shape[SHAPE_DIFFUSECOLOUR] = colour
     shape[SHAPE_SPECULARCOLOUR] = specular
     shape[SHAPE_INTERSECT_FUNC] = shape_sphere_intersect
+    shape[SHAPE_FINALIZE_FUNC] = shape_sphere_finalize
+    if has_numpy:
+        shape[SHAPE_INTERSECT_BATCH_FUNC] = shape_sphere_intersect_batch
     shape_set_transform(shape, transform)
     
     shape[SHAPE_BOUNDING_BOX_SHAPESPACE] = BoundingBox (
@@ -87,9 +146,9 @@ def shape_cylinder_intersect(shape, ray):
              there is an intersection.
     """
 
-    four = mpfr(4)
-    two = mpfr(2)
-    zero = mpfr(0)
+    four = 4
+    two = 2
+    zero = 0
 
     # if the ray is parallel to the cylinder, no intersection
 
@@ -103,7 +162,7 @@ def shape_cylinder_intersect(shape, ray):
 
     a = cartesian_dot(l, l)
     b = two * cartesian_dot(l, o_c)
-    c = cartesian_dot(o_c, o_c) - mpfr(1)
+    c = cartesian_dot(o_c, o_c) - 1
 
     discriminant = ((b * b) - (four * a * c))
 
@@ -123,8 +182,8 @@ def shape_cylinder_intersect(shape, ray):
         
         raw_point = ray_calc_pt(ray, t)
 
-        if (raw_point[2] > mpfr(0.5) or
-            raw_point[2] < mpfr(-0.5)):    
+        if (raw_point[2] > 0.5 or
+            raw_point[2] < -0.5):    
             continue
         
         results[t] = \
@@ -238,7 +297,7 @@ def shape_capped_cylinder_intersect(shape, ray):
 
         # Test for an intersection with the 'top' cap of the cylinder
         d = ray[RAY_VECTOR]
-        topcap_t = (mpfr(-0.5) + (0 - ray[RAY_START][2])) / d[2]
+        topcap_t = (-0.5 + (0 - ray[RAY_START][2])) / d[2]
         if topcap_t > 0:
             topcap_result = {'raw_normal': cartesian_create(
                 0, -1, 0), 'shape': shape, 't': topcap_t}
@@ -246,14 +305,14 @@ def shape_capped_cylinder_intersect(shape, ray):
             topcap_result['point'] = ray_calc_pt(ray, topcap_t)
             d = ((topcap_result['point'][1] * topcap_result['point'][1]) +
                  (topcap_result['point'][3] * topcap_result['point'][3]))
-            if d > mpfr(1):
+            if d > 1:
                 topcap_result = False
         else:
             topcap_result = False
 
         # Test for an intersection with the 'bottom' cap of the cylinder
         d = ray[RAY_VECTOR]
-        bottomcap_t = (mpfr(0.5) + (0 - ray[RAY_START][2])) / d[2]
+        bottomcap_t = (0.5 + (0 - ray[RAY_START][2])) / d[2]
         if bottomcap_t > 0:
             bottomcap_result = {'raw_normal': cartesian_create(0, 1, 0),
                                 'shape': shape, 't': bottomcap_t}
@@ -263,7 +322,7 @@ def shape_capped_cylinder_intersect(shape, ray):
                   bottomcap_result['point'][1]) +
                  (bottomcap_result['point'][3] *
                   bottomcap_result['point'][3]))
-            if d > mpfr(1):
+            if d > 1:
                 bottomcap_result = False
         else:
             bottomcap_result = False
@@ -350,7 +409,7 @@ def shape_cone_intersect(shape, ray):
     .. todo: Needs thourough checking for all cases.
     """
 
-    zero = mpfr(0)
+    zero = 0
 
     # if the ray is parallel to the cone and y_top is more than 0, no
     # intersection
@@ -359,9 +418,9 @@ def shape_cone_intersect(shape, ray):
         return False
 
     # print(ray)
-    one = mpfr(1)
-    four = mpfr(4)
-    two = mpfr(2)
+    one = 1
+    four = 4
+    two = 2
 
     o = ray[RAY_START]
     d = ray[RAY_VECTOR]
@@ -413,10 +472,14 @@ def shape_cone_intersect(shape, ray):
     if final_t is None:
         return False
 
+    raw_normal = cartesian_create(final_raw_point[1], 0, final_raw_point[3])
+    # of unit length, except at the apex, where there is no normal
+    if raw_normal[1] != 0 or raw_normal[3] != 0:
+        raw_normal = cartesian_normalise(raw_normal)
+
     result = {'t': final_t,
         'raw_point': final_raw_point,
-        'raw_normal': 
-            cartesian_create(final_raw_point[1], 0, final_raw_point[3])
+        'raw_normal': raw_normal
         }
 
     return result
@@ -547,7 +610,7 @@ def shape_capped_cone_intersect(shape, ray):
            for all instances needed.
     """
 
-    zero = mpfr(0)
+    zero = 0
     ytop = shape[SHAPE_DATA]['y_top']
     do_top_cap = (ytop > zero)
     if ray[RAY_VECTOR][2] == zero:
@@ -0,0 +1,143 @@
+import multiprocessing as mp
+import raytracer.view
+import raytracer.output
+import raytracer.precision
+
+"""A render pool is a long-lived pool of worker processes for rendering
+scenes. The scene is loaded into each worker once, when the worker starts,
+after which only view names and tiles are sent to the workers. A pool can be
+attached to a Scene with Scene.set_render_pool, and is reused by every later
+render of that scene, including renders of other views. If the scene changes,
+the workers are restarted with the new scene the next time it is rendered.
+"""
+
+# The scene loaded into a worker process, and the names of the views in it
+# that have been set up for rendering.
+__worker_scene__ = None
+__worker_views_ready__ = set()
+
+
+def render_pool_worker_init(scene, precision_backend):
+    """Initialiser for worker processes. Stores the scene for later tiles.
+
+    :param scene: the Scene to render in this worker
+    :param precision_backend: the precision backend used by the parent
+                              process
+    """
+    global __worker_scene__
+
+    if raytracer.precision.precision_get_backend() != precision_backend:
+        raytracer.precision.precision_set_backend(precision_backend)
+    __worker_scene__ = scene
+    __worker_views_ready__.clear()
+
+
+def render_pool_worker_render_tile(task):
+    """Renders a tile of a view of the scene loaded into the worker.
+
+    :param task: a tuple of the view name, the tile to render, the output's
+                 worker handle or None, and whether to collect render
+                 statistics
+    :return: a tuple of the tile, its tile buffer or None if the tile was
+             written to the output by the worker, and the render statistics
+             of the tile or None
+    """
+    view_name, tile, output_handle, collect_stats = task
+    view = __worker_scene__.get_view(view_name)
+
+    if view_name not in __worker_views_ready__:
+        raytracer.view.view_render_setup(view)
+        __worker_views_ready__.add(view_name)
+
+    buffer, stats = raytracer.view.view_render_tile_with_stats(
+        view, tile, collect_stats)
+    if output_handle is not None:
+        raytracer.output.output_write_tile(output_handle, tile, buffer)
+        return (tile, None, stats)
+
+    return (tile, buffer, stats)
+
+
+class RenderPool(object):
+    """A pool of worker processes that keeps a scene loaded between
+    renders."""
+
+    def __init__(self, max_processes=0):
+        """Class constructor. Worker processes are not started until a scene
+        is loaded.
+
+        :param max_processes: the number of worker processes, or 0 for one
+                              per CPU
+        """
+        if max_processes <= 0:
+            max_processes = mp.cpu_count()
+
+        self.__max_processes__ = max_processes
+        self.__pool__ = None
+        self.__scene_key__ = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_max_processes(self):
+        """Returns the number of worker processes in the pool.
+
+        :return: an integer"""
+        return self.__max_processes__
+
+    def load_scene(self, scene):
+        """Loads a scene into the worker processes. If the same scene is
+        already loaded and has not changed since, the running workers are
+        kept.
+
+        :param scene: the Scene to load
+        """
+        scene_key = (id(scene), scene.get_version())
+
+        if self.__pool__ is not None and self.__scene_key__ == scene_key:
+            return
+
+        self.close()
+        self.__pool__ = mp.Pool(
+            self.__max_processes__, render_pool_worker_init,
+            (scene, raytracer.precision.precision_get_backend()))
+        self.__scene_key__ = scene_key
+
+    def render_tiles(self, view_name, tiles, output_handle=None,
+                     collect_stats=False):
+        """Renders tiles of a view of the loaded scene. Tiles are yielded in
+        the order they are completed.
+
+        :param view_name: the handle of the view in the loaded scene
+        :param tiles: a list of tiles to render
+        :param output_handle: a worker handle from the output being rendered
+                              to, for the workers to write tiles into it
+                              directly. See Output.get_worker_handle.
+        :param collect_stats: if True, the workers collect render statistics
+                              for each tile
+        :return: an iterator of (tile, tile buffer, render statistics)
+                 tuples. The tile buffer is None for tiles written by the
+                 workers, and the render statistics are None unless
+                 collected.
+        """
+        if self.__pool__ is None:
+            raise RuntimeError('no scene is loaded into the render pool')
+
+        return self.__pool__.imap_unordered(
+            render_pool_worker_render_tile,
+            [(view_name, tile, output_handle, collect_stats)
+             for tile in tiles])
+
+    def close(self):
+        """Stops the worker processes. The pool can still be used
+        afterwards; the workers are restarted when a scene is next loaded.
+        """
+        if self.__pool__ is not None:
+            self.__pool__.close()
+            self.__pool__.join()
+
+        self.__pool__ = None
+        self.__scene_key__ = None
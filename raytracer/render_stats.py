@@ -0,0 +1,235 @@
+import json
+
+try:
+    import numpy
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
+"""Render statistics count the work done while rendering: the rays cast of
+each kind, the intersection tests made against each type of shape and the
+hits found, and the acceleration structure nodes visited. They are used to
+size render jobs and to find scenes that are unusually costly to render.
+
+Statistics are only collected while they are switched on, with
+render_stats_start, in the process doing the rendering. Worker processes
+collect their own statistics for each tile they render, which are merged
+into the totals for the render with render_stats_merge. Statistics are
+switched on for a view with view_set_render_stats; Scene.render then keeps
+the totals of the last render, see Scene.get_render_stats.
+
+Render statistics are stored in a dictionary:
+
+* 'rays': a dictionary of the number of rays cast, by kind: 'primary' rays
+  from the eye, 'shadow' rays towards lights, 'reflection' rays, and
+  'transparency' rays, counted each time the lighting model continues along
+  a ray through a transparent surface
+* 'intersection_tests': a dictionary of the number of rays tested for
+  intersection, by shape type
+* 'hits': a dictionary of the number of those tests that hit the shape, by
+  shape type
+* 'nodes_visited': the number of acceleration structure nodes visited
+* 'tiles': the number of tiles rendered
+* 'time': the wall time in seconds spent rendering tiles. Tiles rendered at
+  the same time by several worker processes are all counted, so this can be
+  more than the time the render took.
+* 'tile_stats': a list with a dictionary for each tile rendered, in the
+  order the tiles were completed:
+  'tile': the left, top, right and bottom edges of the tile
+  'time': the wall time in seconds spent rendering the tile
+  'rays': the number of rays of all kinds cast for the tile
+
+The per-tile statistics can be made into a tile map, with
+render_stats_tile_map, showing where in the image render time is spent. A
+tile map is aligned with the rendered image, holding for each pixel the time
+or rays per pixel of the tile it is in. A false-colour image of it can be
+drawn to an Output by a view, see view_set_render_stats.
+"""
+
+RENDER_STATS_RAY_TYPES = ('primary', 'shadow', 'reflection', 'transparency')
+
+# the per-tile statistics that a tile map can show
+RENDER_STATS_TILE_VALUES = ('time', 'rays')
+
+# The statistics being collected in this process, or None when statistics
+# are not being collected.
+__render_stats__ = None
+
+
+def render_stats_create():
+    """Creates a set of render statistics with all counts at zero.
+
+    :return: a render statistics dictionary
+    """
+    return {'rays': dict.fromkeys(RENDER_STATS_RAY_TYPES, 0),
+            'intersection_tests': {},
+            'hits': {},
+            'nodes_visited': 0,
+            'tiles': 0,
+            'time': 0.0,
+            'tile_stats': []}
+
+
+def render_stats_start():
+    """Starts collecting render statistics in this process, from zero.
+
+    :return: the render statistics dictionary being collected into
+    """
+    global __render_stats__
+
+    __render_stats__ = render_stats_create()
+    return __render_stats__
+
+
+def render_stats_stop():
+    """Stops collecting render statistics in this process.
+
+    :return: the render statistics collected since render_stats_start, or
+             None if statistics were not being collected
+    """
+    global __render_stats__
+
+    stats = __render_stats__
+    __render_stats__ = None
+    return stats
+
+
+def render_stats_add_rays(ray_type, count=1):
+    """Counts rays cast, if render statistics are being collected.
+
+    :param ray_type: the kind of ray, one of RENDER_STATS_RAY_TYPES
+    :param count: the number of rays
+    """
+    if __render_stats__ is not None:
+        __render_stats__['rays'][ray_type] += count
+
+
+def render_stats_add_tests(shape_type, count=1, hits=0):
+    """Counts intersection tests against a type of shape, if render
+    statistics are being collected.
+
+    :param shape_type: the type of shape tested, e.g., 'sphere'
+    :param count: the number of rays tested
+    :param hits: the number of those rays that hit the shape
+    """
+    if __render_stats__ is not None:
+        tests = __render_stats__['intersection_tests']
+        tests[shape_type] = tests.get(shape_type, 0) + count
+        if hits > 0:
+            shape_hits = __render_stats__['hits']
+            shape_hits[shape_type] = shape_hits.get(shape_type, 0) + hits
+
+
+def render_stats_add_nodes(count):
+    """Counts acceleration structure nodes visited, if render statistics are
+    being collected.
+
+    :param count: the number of nodes visited
+    """
+    if __render_stats__ is not None:
+        __render_stats__['nodes_visited'] += count
+
+
+def render_stats_merge(total, stats):
+    """Adds one set of render statistics to another, such as those of a tile
+    rendered by a worker process to the totals of a render.
+
+    :param total: the render statistics to add to
+    :param stats: the render statistics to add, or None
+    :return: the total render statistics
+    """
+    if stats is None:
+        return total
+
+    for key in ('rays', 'intersection_tests', 'hits'):
+        counts = total[key]
+        for name, count in stats[key].items():
+            counts[name] = counts.get(name, 0) + count
+
+    total['nodes_visited'] += stats['nodes_visited']
+    total['tiles'] += stats['tiles']
+    total['time'] += stats['time']
+    total['tile_stats'].extend(stats['tile_stats'])
+    return total
+
+
+def render_stats_add_tile(stats, tile, time):
+    """Records the statistics of a rendered tile, in the statistics
+    collected while rendering it.
+
+    :param stats: the render statistics collected for the tile alone
+    :param tile: the tile, as created by view_create_tiles
+    :param time: the wall time in seconds spent rendering the tile
+    :return: the render statistics
+    """
+    stats['tiles'] += 1
+    stats['time'] += time
+    stats['tile_stats'].append({'tile': list(tile[1:5]),
+                                'time': time,
+                                'rays': sum(stats['rays'].values())})
+    return stats
+
+
+def render_stats_tile_value(tile_stats, value='time'):
+    """Returns a statistic of a rendered tile per pixel of the tile, so
+    tiles of different sizes, such as those at the edges of an image, can be
+    compared.
+
+    :param tile_stats: the statistics of the tile, from the 'tile_stats' of
+                       render statistics
+    :param value: the statistic, one of RENDER_STATS_TILE_VALUES
+    :return: the statistic divided by the number of pixels in the tile
+    """
+    if value not in RENDER_STATS_TILE_VALUES:
+        raise ValueError("unknown tile statistic '%s', expected one of %s"
+                         % (value, ', '.join(RENDER_STATS_TILE_VALUES)))
+
+    left, top, right, bottom = tile_stats['tile']
+    return tile_stats[value] / float((right - left) * (bottom - top))
+
+
+def render_stats_tile_map(stats, value='time'):
+    """Creates a tile map from render statistics: an array aligned with the
+    rendered image, holding for each pixel a statistic per pixel of the tile
+    the pixel is in. Requires numpy.
+
+    :param stats: the render statistics of a render
+    :param value: the statistic to map, one of RENDER_STATS_TILE_VALUES
+    :return: a float64 array with a row for each row of pixels
+    """
+    width = 0
+    height = 0
+    for tile_stats in stats['tile_stats']:
+        width = max(width, tile_stats['tile'][2])
+        height = max(height, tile_stats['tile'][3])
+
+    tile_map = numpy.zeros((height, width))
+    for tile_stats in stats['tile_stats']:
+        left, top, right, bottom = tile_stats['tile']
+        tile_map[top:bottom, left:right] = render_stats_tile_value(
+            tile_stats, value)
+
+    return tile_map
+
+
+def render_stats_heat_colour(fraction):
+    """Returns the false colour used for a value in a tile map, running
+    from black through red and yellow to white.
+
+    :param fraction: the value, as a fraction of the way from the lowest to
+                     the highest value in the map
+    :return: a colour tuple
+    """
+    fraction = min(1.0, max(0.0, fraction)) * 3
+    return ('colour', min(1.0, fraction), min(1.0, max(0.0, fraction - 1)),
+            max(0.0, fraction - 2))
+
+
+def render_stats_save(stats, filename):
+    """Writes render statistics to a JSON file.
+
+    :param stats: the render statistics
+    :param filename: the name of the file to write
+    """
+    with open(filename, 'w') as stats_file:
+        json.dump(stats, stats_file, indent=2, sort_keys=True)
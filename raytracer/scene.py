@@ -1,8 +1,4 @@
-try:
-    from gmpy2 import *
-except ImportError:
-    from math import *
-    from raytracer.mpfr_dummy import *
+from raytracer.precision import *
 from raytracer.cartesian import *
 from raytracer.colour import *
 from raytracer.matrix import *
@@ -12,15 +8,49 @@ from raytracer.shape import *
 import raytracer.view
 from raytracer.view import *
 from raytracer.oct_tree import *
+from raytracer.bvh import *
+from raytracer.flat_tree import *
 
 """A scene class is a container for shapes, lights and views. It also
 contains a key piece of raytracer code, the loop for testing a ray
-against each shape in the scene
+against each shape in the scene.
+
+When a scene has enough shapes, an acceleration structure is built before
+rendering to limit the shapes tested against each ray. The accelerator can be
+'octree' (the default) or 'bvh', a bounding volume hierarchy. Once built, the
+structure is compiled into a flat tree (see flat_tree.py), which is what rays
+are traversed against and what is sent to worker processes.
+
+Scenes are rendered from a compiled snapshot, returned by Scene.compile. The
+snapshot is a CompiledScene, which holds copies of the shapes and the lights
+in tuples, shapes grouped by how they are intersected, with their world
+bounding boxes and transforms resolved and the acceleration structure built.
+It is reused by every render until the scene changes, and is what render pools
+load into their workers.
 """
 
+SCENE_ACCELERATORS = ('octree', 'bvh')
+
+# when more than this fraction of a scene's shapes have been added or moved
+# since its octree was built, the octree is built again rather than updated
+SCENE_REBUILD_FRACTION = .25
+
 
 class Scene(object):
-    def __init__(self, use_octtree = True, oct_tree_threshold = 10):
+    def __init__(self, use_octtree = True, oct_tree_threshold = 10,
+                 accelerator = 'octree'):
+        """Class constructor.
+
+        :param use_octtree: if False, no acceleration structure is used
+        :param oct_tree_threshold: the number of shapes needed before an
+                                   acceleration structure is used
+        :param accelerator: the acceleration structure to use, 'octree' or
+                            'bvh'
+        """
+        if accelerator not in SCENE_ACCELERATORS:
+            raise ValueError("unknown accelerator '%s', expected one of %s"
+                             % (accelerator, ', '.join(SCENE_ACCELERATORS)))
+
         self.__lights__ = {}
         self.__shapes__ = {}
         self.__views__ = {}
@@ -31,10 +61,83 @@ class Scene(object):
         
         self.__use_octtree__ = use_octtree
         self.__oct_tree_threshold__ = oct_tree_threshold
+        self.__accelerator__ = accelerator
+        self.__octtree_top__ = None
+        self.__bvh__ = None
+        self.__flat_tree__ = None
+        self.__accelerator_boxes__ = None
+        self.__added_shapes__ = []
+
+        self.__version__ = 0
+        self.__render_pool__ = None
+        self.__compiled__ = None
+        self.__render_stats__ = None
+
+    def __getstate__(self):
+        """Returns the state of the scene for pickling, as done when the
+        scene is sent to worker processes. Outputs and the render pool stay
+        in the current process."""
+        state = self.__dict__.copy()
+        state['__render_pool__'] = None
+        state['__compiled__'] = None
+        state['__render_stats__'] = None
+        state['__accelerator_boxes__'] = None
+        state['__added_shapes__'] = []
+
+        # workers only traverse the flat tree compiled from the accelerator
+        state['__octtree_top__'] = None
+        state['__bvh__'] = None
+
+        views = {}
+        for name in self.__views__:
+            view_copy = list(self.__views__[name])
+            view_copy[raytracer.view.VIEW_OUTPUT] = None
+            view_copy[raytracer.view.VIEW_MULTIPROCESS_POOL] = None
+            view_copy[raytracer.view.VIEW_RENDER_STATS] = None
+            views[name] = view_copy
+        state['__views__'] = views
+
+        return state
         
     def get_max_reflections(self):
         return self.__max_relfections__
 
+    def get_version(self):
+        """Returns a number that changes every time the scene is changed.
+        Used by render pools to know when to reload the scene.
+
+        :return: an integer"""
+        return self.__version__
+
+    def set_changed(self):
+        """Marks the scene as changed. This is done automatically when
+        shapes, lights or views are added, and when shapes in the scene are
+        moved with shape_set_transform; call it after changing a shape or
+        light that is already in the scene in any other way."""
+        self.__version__ += 1
+
+    def set_render_pool(self, render_pool):
+        """Attaches a render pool to the scene. Multiprocessing renders of
+        any view in the scene use the pool's workers, which keep the scene
+        loaded between renders.
+
+        :param render_pool: a RenderPool, or None to use a new pool of
+                            workers for each render"""
+        self.__render_pool__ = render_pool
+        # the compiled snapshot holds the pool too, so it is made again
+        self.__compiled__ = None
+
+    def get_render_pool(self):
+        """Returns the render pool attached to the scene, or None."""
+        return self.__render_pool__
+
+    def get_render_stats(self):
+        """Returns the render statistics of the last render, if they were
+        collected for the view rendered, see view_set_render_stats.
+
+        :return: a render statistics dictionary, or None"""
+        return self.__render_stats__
+
     def add_shape(self, shape, name=None):
         """Add a shape to the scene
         :param shape: the shape to add
@@ -47,6 +150,8 @@ class Scene(object):
 
 
         self.__shapes__[name] = shape
+        self.__added_shapes__.append(shape)
+        self.set_changed()
 
     def add_light(self, light, name=None):
         """Add a light to the scene
@@ -61,6 +166,7 @@ class Scene(object):
             self.light_count = self.light_count + 1
 
         self.__lights__[name] = light
+        self.set_changed()
 
     def get_lights(self):
         """Returns the array of lights in the scene.
@@ -68,6 +174,29 @@ class Scene(object):
         """
         return self.__lights__
 
+    def get_light_list(self):
+        """Returns the lights in the scene, in the order they were added.
+
+        :return: a sequence of lights
+        """
+        return list(self.__lights__.values())
+
+    def get_shape_groups(self):
+        """Returns the shapes in the scene, split into those with a batch
+        intersection function and the others, in the order they were added.
+
+        :return: a tuple of two sequences of shapes
+        """
+        batch_shapes = []
+        other_shapes = []
+        for sh in self.__shapes__.values():
+            if sh[SHAPE_INTERSECT_BATCH_FUNC] is None:
+                other_shapes.append(sh)
+            else:
+                batch_shapes.append(sh)
+
+        return batch_shapes, other_shapes
+
     def add_view(self, view_obj, name=None):
         """Adds a view to the scene.
         :return: an array of lights
@@ -82,10 +211,185 @@ class Scene(object):
         # Assign a handle to the view if none give
         while name in self.__views__ or name is None:
             name = "View%d" % (self.__view_count__)
-            self.__view_count__ = view_count + 1
+            self.__view_count__ = self.__view_count__ + 1
 
         self.__views__[name] = view_obj
+        self.set_changed()
+
+    def get_view(self, name):
+        """Returns the view with the given handle.
+
+        :param name: the handle of the view
+        :return: a view"""
+        return self.__views__[name]
+
+    def get_view_name(self, view_obj):
+        """Returns the handle of a view in the scene.
+
+        :param view_obj: the view to find
+        :return: the view's handle, or None if the view is not in the
+                 scene"""
+        for name in self.__views__:
+            if self.__views__[name] is view_obj:
+                return name
+        return None
+
+
+    def get_shape_list(self):
+        """Returns the shapes in the scene, in the order they were added.
+
+        :return: a sequence of shapes
+        """
+        return list(self.__shapes__.values())
+
+    def setup_accelerator(self):
+        """Builds the scene's acceleration structure, if the scene has
+        enough shapes to use one."""
+        self.__octtree_top__ = None
+        self.__bvh__ = None
+        self.__flat_tree__ = None
+
+        self.__accelerator_boxes__ = {}
+        for sh in self.__shapes__.values():
+            self.__accelerator_boxes__[id(sh)] = (sh, shape_bounding_box(sh))
+        self.__added_shapes__ = []
+
+        if not self.__use_octtree__ or \
+                len(self.__shapes__) < self.__oct_tree_threshold__:
+            return
+
+        if self.__accelerator__ == 'bvh':
+            self.__bvh__ = BVH(
+                [self.__shapes__[name] for name in sorted(self.__shapes__)])
+            self.__flat_tree__ = flat_tree_from_bvh(self.__bvh__)
+        else:
+            self.setup_octtree()
+            if self.__octtree_top__ is not None:
+                self.__flat_tree__ = flat_tree_from_octree(
+                    self.__octtree_top__)
+
+    def update_accelerator(self):
+        """Brings the scene's acceleration structure up to date with its
+        shapes. Nothing is done if no shapes have been added or moved since
+        the structure was built. A BVH is refitted when shapes have only
+        moved, unless refitting has made it too costly to traverse (see
+        BVH.refit). An octree has the shapes removed and added again when
+        only a few have changed. Otherwise the structure is built again.
+        A shape has moved if its world space bounding box is no longer the
+        one the structure was built with, as shape_set_transform clears it.
+        Moving shapes marks the scene as changed.
+
+        :return: True if any shapes had been added or moved, otherwise False
+        """
+        if self.__accelerator_boxes__ is None:
+            self.setup_accelerator()
+            return True
+
+        moved = []
+        for sh, box in self.__accelerator_boxes__.values():
+            if shape_bounding_box(sh) is not box:
+                moved.append(sh)
+        changed = moved + self.__added_shapes__
+
+        if len(changed) == 0:
+            return False
+
+        if len(moved) > 0:
+            self.set_changed()
+
+        if self.__bvh__ is not None:
+            if len(self.__added_shapes__) > 0:
+                self.setup_accelerator()
+                return True
+
+            cost_ratio = self.__bvh__.refit()
+            if cost_ratio is None or cost_ratio > BVH_REFIT_MAX_COST_RATIO:
+                self.setup_accelerator()
+                return True
+
+            for sh in moved:
+                self.__accelerator_boxes__[id(sh)] = (sh,
+                                                      shape_bounding_box(sh))
+            self.__flat_tree__ = flat_tree_from_bvh(self.__bvh__)
+            return True
+
+        if self.__octtree_top__ is None or \
+                len(changed) > len(self.__shapes__) * SCENE_REBUILD_FRACTION:
+            self.setup_accelerator()
+            return True
+
+        # shapes outside the root node would be missed by rays, so growing
+        # the scene needs a new octree
+        top_box = self.__octtree_top__.bounding_box
+        for sh in changed:
+            box = shape_bounding_box(sh)
+            if box is not None and not top_box.contains_box(box):
+                self.setup_accelerator()
+                return True
+
+        for sh in moved:
+            self.__octtree_top__.remove_shape(sh)
+        for sh in changed:
+            # the top node is replaced when it splits
+            self.__octtree_top__.add_shape(sh)
+            self.__accelerator_boxes__[id(sh)] = (sh, shape_bounding_box(sh))
+
+        self.__added_shapes__ = []
+        self.__flat_tree__ = flat_tree_from_octree(self.__octtree_top__)
+
+        return True
+
+    def get_shapes_by_ray(self, ray):
+        """Returns the shapes that a ray may intersect, using the
+        acceleration structure if one has been built.
+
+        :param ray: the ray
+        :return: a list of shapes
+        """
+        if self.__flat_tree__ is not None:
+            return flat_tree_get_shapes_by_ray(self.__flat_tree__, ray)
 
+        return self.get_shape_list()
+
+    def get_nearest_hit(self, ray, intersect_func=shape_test_intersect,
+                        stop_t=None, max_t=None):
+        """Finds the nearest intersection of a ray with the shapes in the
+        scene. If an acceleration structure has been built, it is traversed
+        front to back, and traversal stops once the nearest hit found is
+        nearer than the next node the ray enters; see
+        flat_tree_get_nearest_hit. Otherwise every shape is tested.
+
+        :param ray: the ray
+        :param intersect_func: a function taking a shape and a ray, and
+                               returning a dictionary of intersection
+                               results or False
+        :param stop_t: if given, the first intersection found with t no
+                       greater than stop_t is returned, even if it is at
+                       max_t
+        :param max_t: if given, only intersections nearer than max_t are
+                      returned
+        :return: a tuple of the nearest intersection result and the shape
+                 it is with, or (False, None) if there is no intersection
+        """
+        if self.__flat_tree__ is not None:
+            return flat_tree_get_nearest_hit(self.__flat_tree__, ray,
+                                             intersect_func, stop_t, max_t)
+
+        nearest_result = False
+        nearest_shape = None
+        nearest_t = BVH_INFINITY if max_t is None else max_t
+        for sh in self.get_shape_list():
+            result = intersect_func(sh, ray)
+            if result is False or result['t'] <= 0:
+                continue
+            if stop_t is not None and result['t'] <= stop_t:
+                return result, sh
+            if result['t'] < nearest_t:
+                nearest_result = result
+                nearest_shape = sh
+                nearest_t = result['t']
+
+        return nearest_result, nearest_shape
 
     def setup_octtree(self):
         
@@ -143,45 +447,258 @@ class Scene(object):
 
 
 
+    def compile(self):
+        """Returns a compiled, render-ready snapshot of the scene. The
+        snapshot is kept and returned again until the scene changes (see
+        set_changed). The acceleration structure is only updated when
+        shapes have been added or moved, so rendering other views or
+        changing lights reuses it.
+
+        :return: a CompiledScene
+        """
+        self.update_accelerator()
+
+        if self.__compiled__ is None or \
+                self.__compiled__.get_version() != self.__version__:
+            self.__compiled__ = CompiledScene(self)
+
+        return self.__compiled__
+
     def render(self, view_name):
         """
         Renders the scene using the specified view. The output type must be
-        set prior to calling this method.
+        set prior to calling this method. If render statistics are collected
+        for the view, they are kept until the next render, see
+        get_render_stats.
         :param view_name: the handle of the view to use
         :return: the rendered output
         """
-        
-        if self.__use_octtree__ and \
-            len (self.__shapes__) >= self.__oct_tree_threshold__:  
-            self.setup_octtree()
-                    
-        raytracer.view.view_render(
-            self.__views__[view_name])
-            
+        compiled = self.compile()
+        compiled.set_view(view_name, self.__views__[view_name])
+
+        self.__render_stats__ = raytracer.view.view_render(
+            compiled.get_view(view_name))
+
         return (self.__views__[view_name]
                 [raytracer.view.VIEW_OUTPUT].get_output())
 
+    def render_frames(self, view_name, frames, set_frame):
+        """Renders a sequence of frames, such as those of an animation. Before
+        each frame is rendered, a function is called to change the scene,
+        usually by moving shapes with shape_set_transform. The acceleration
+        structure is updated rather than built again where it can be; a
+        scene using the 'bvh' accelerator has it refitted to the moved
+        shapes.
+
+        :param view_name: the handle of the view to render
+        :param frames: an iterable of frames, e.g., range(0, 100)
+        :param set_frame: a function taking the scene and a frame, which
+                          sets the scene up for the frame
+        :return: an iterator of (frame, rendered output) tuples
+        """
+        for frame in frames:
+            set_frame(self, frame)
+            yield frame, self.render(view_name)
+
     def replace_node(self, old_node, new_node):
          self.__octtree_top__ = new_node
           
                 
     def test_intersect(self, ray, exclude_shapes=[]):
-        
-        if self.__use_octtree__ and \
-            len (self.__shapes__) >= self.__oct_tree_threshold__ and \
-            self.__octtree_top__ is not None:
-            shapes = self.__octtree_top__.get_shapes_by_ray(ray)
-            
-        else:
-            shapes =  list(self.__shapes__.values())
-        
-        return self.test_intersect_list_all_results (
-            ray, shapes, exclude_shapes)
+        """Tests intersection of a ray with the shapes in the scene. Only the
+        nearest hit is kept, unless it is on a shape that may be transparent;
+        then every hit along the ray is collected, as the lighting model
+        needs them to colour what lies behind the transparent surface.
+
+        :param ray: the ray to test against the shapes
+        :param exclude_shapes: a list of shapes to exclude from the
+                               intersection test
+        :return: False if there is no intersection, otherwise the result of
+                 the nearest intersection
+        """
+        intersect_func = shape_test_intersect
+        if len(exclude_shapes) > 0:
+            intersect_func = lambda sh, ray: \
+                False if sh in exclude_shapes else shape_test_intersect(sh,
+                                                                        ray)
+
+        result = self.test_intersect_nearest(
+            ray, intersect_func, 1 if ray[RAY_ISSHADOW] else None)
+
+        if result is not False and shape_may_be_transparent(result['shape']):
+            return self.test_intersect_list_all_results(
+                ray, self.get_shapes_by_ray(ray), exclude_shapes)
+
+        return result
+
+    def test_intersect_nearest(self, ray, intersect_func=shape_test_intersect,
+                               stop_t=None, max_t=None):
+        """Tests intersection of a ray with the shapes in the scene, keeping
+        only the nearest hit, as found by get_nearest_hit.
+
+        :param ray: the ray to test against the shapes
+        :param intersect_func: the intersection function, see
+                               get_nearest_hit
+        :param stop_t: if given, the first hit found with t no greater than
+                       stop_t is returned
+        :param max_t: if given, only hits nearer than max_t are returned
+        :return: False if there is no intersection, otherwise the result of
+                 the nearest intersection
+        """
+        result, sh = self.get_nearest_hit(ray, intersect_func, stop_t, max_t)
+        if result is False:
+            return False
+
+        # hits further along the ray are only needed for transparency, and
+        # are collected by test_intersect_list_all_results
+        if 'all_results' in result:
+            del(result['all_results'])
+        result['shape'] = sh
+        result['ray'] = ray
+
+        return result
         
         
+    def test_occlusion(self, ray):
+        """Tests whether anything lies on the segment of a ray between its
+        start point and the end of its direction vector (0 < t <= 1), as is
+        done for shadow rays. The acceleration structure is traversed front
+        to back, only as far as the end of the segment, and the test stops
+        at the first opaque shape found on the segment; hits are only
+        collected and sorted when the shapes on the segment are
+        transparent.
+
+        :param ray: the ray, usually a shadow ray
+        :return: None if nothing lies on the segment, otherwise the product
+                 of the transparency colours of the shapes on it, which is
+                 black when any of them is opaque
+        """
+        transparent_results = {}
+        opaque = []
+
+        def occlusion_intersect(sh, ray):
+            # returns an opaque hit on the segment, which ends the traversal;
+            # transparent hits are collected, and the traversal goes on
+            intersect_result = shape_test_intersect(sh, ray)
+            if type(intersect_result) is not dict:
+                return False
+
+            hits = [intersect_result]
+            if 'all_results' in intersect_result:
+                hits += list(intersect_result['all_results'].values())
+                del(intersect_result['all_results'])
+
+            for hit in hits:
+                if not 0 < hit['t'] <= 1:
+                    continue
+
+                hit['shape'] = sh
+                hit['ray'] = ray
+                transparency = shape_get_colour(hit, SHAPE_TRANSPARENTCOLOUR)
+                if transparency[1] <= 0 and transparency[2] <= 0 and \
+                        transparency[3] <= 0:
+                    opaque.append(hit)
+                    return hit
+
+                transparent_results[hit['t']] = transparency
+
+            return False
+
+        self.get_nearest_hit(ray, occlusion_intersect, 1, 1)
+        if len(opaque) > 0:
+            return ('colour', 0, 0, 0)
+
+        if len(transparent_results) == 0:
+            return None
+
+        shadow_factor = ('colour', 1, 1, 1)
+        for t in sorted(transparent_results):
+            shadow_factor = colour_mul(shadow_factor, transparent_results[t])
+
+        return shadow_factor
+
+    def test_intersect_batch(self, rays):
+        """Tests intersection of a batch of rays with all the shapes in the
+        scene. Shapes with a batch intersection function are tested against
+        all the rays at once, keeping only the nearest hit for each ray;
+        other shapes are tested one ray at a time. Rays whose nearest hit is
+        on a shape that may be transparent are tested again with
+        test_intersect, to collect the hits behind it. Requires numpy.
+
+        :param rays: a list of rays
+        :return: a list with the result of test_intersect for each ray
+        """
+        starts = numpy.array([ray[RAY_START][1:4] for ray in rays],
+                             dtype=numpy.float64)
+        directions = numpy.array([ray[RAY_DIR][1:4] for ray in rays],
+                                 dtype=numpy.float64)
+        nearest_t = numpy.full(len(rays), numpy.inf)
+        nearest_index = numpy.full(len(rays), -1, dtype=numpy.intp)
+        nearest_points = numpy.zeros((len(rays), 3))
+        nearest_normals = numpy.zeros((len(rays), 3))
+        batch_shapes, other_shapes = self.get_shape_groups()
+        batch_other_results = []
+
+        for index, sh in enumerate(batch_shapes):
+            t, hit, points, normals, other_results = \
+                sh[SHAPE_INTERSECT_BATCH_FUNC](sh, starts, directions)
+            render_stats_add_tests(sh[SHAPE_SHAPE], len(rays),
+                                   int(numpy.count_nonzero(hit)))
+            nearer = hit & (t > 0) & (t < nearest_t)
+
+            nearest_t[nearer] = t[nearer]
+            nearest_index[nearer] = index
+            nearest_points[nearer] = points[nearer]
+            nearest_normals[nearer] = normals[nearer]
+            batch_other_results.append(other_results)
+
+        results = [False] * len(rays)
+        indexes = numpy.flatnonzero(nearest_index >= 0)
+
+        for i, index, t, point, normal in zip(
+                indexes.tolist(), nearest_index[indexes].tolist(),
+                nearest_t[indexes].tolist(),
+                nearest_points[indexes].tolist(),
+                nearest_normals[indexes].tolist()):
+            result = {
+                't': t,
+                'raw_point': ('cartesian', point[0], point[1], point[2]),
+                'normal': ('cartesian', normal[0], normal[1], normal[2]),
+                'shape': batch_shapes[index],
+                'ray': rays[i]}
+
+            other_results = batch_other_results[index]
+            if other_results is not None:
+                for key in other_results:
+                    result[key] = other_results[key][i]
+
+            results[i] = result
+
+        # the other shapes are only tested nearer than the batch hit
+        other_intersect = lambda sh, ray: \
+            False if sh[SHAPE_INTERSECT_BATCH_FUNC] is not None else \
+            shape_test_intersect(sh, ray)
+
+        for i, ray in enumerate(rays):
+            if len(other_shapes) > 0:
+                result = self.test_intersect_nearest(
+                    ray, other_intersect, None,
+                    None if results[i] is False else results[i]['t'])
+                if result is not False:
+                    results[i] = result
+
+            if results[i] is not False and \
+                    shape_may_be_transparent(results[i]['shape']):
+                results[i] = self.test_intersect_list_all_results(
+                    ray, self.get_shapes_by_ray(ray))
+
+        return results
+
     def test_intersect_list(self, ray, list, exclude_shapes=[]):
-        """Tests intersection of a ray with all the shapes in the scene.
+        """Tests intersection of a ray with a list of shapes, keeping only
+        the nearest hit.
         :param ray: the ray to test against the shapes
+        :param list: the shapes to test
         :param exclude_shapes: a list of shapes to exclude from the
         intersection test
         """
@@ -204,6 +721,13 @@ class Scene(object):
 
         if curr_intersect_result is None:
             return False
+
+        # hits further along the ray are only needed for transparency, and
+        # are collected by test_intersect_list_all_results
+        if 'all_results' in curr_intersect_result:
+            del(curr_intersect_result['all_results'])
+        curr_intersect_result['ray'] = ray
+
         return curr_intersect_result
 
     def test_intersect_list_all_results (self, ray, list, exclude_shapes=[]):
@@ -242,4 +766,105 @@ class Scene(object):
         del(all_results[curr_t])
         result['all_results'] = all_results
         
-        return result
\ No newline at end of file
+        return result
+
+
+class CompiledScene(Scene):
+    """A frozen snapshot of a scene, ready for rendering. Shapes and lights
+    are held in tuples, with shapes grouped by how they are intersected, so
+    no dictionaries are searched while rendering. Each shape's world bounding
+    box and batch transformation arrays are resolved when the snapshot is
+    made.
+
+    The snapshot holds copies of the scene's shapes, made with shape_copy,
+    and a copy of the scene's flat tree pointing at them, so shapes moved
+    in the scene after it is compiled stay where they were in the snapshot.
+    Shape data, such as polymesh arrays, is shared with the scene and must
+    not be changed while the snapshot is in use. Lights are tuples, and so
+    are shared as they are.
+
+    Compiled scenes are made by Scene.compile, and cannot be changed."""
+
+    def __init__(self, scene):
+        """Class constructor.
+
+        :param scene: the Scene to take a snapshot of. Its acceleration
+                      structure must already be set up.
+        """
+        self.__dict__.update(scene.__dict__)
+        self.__compiled__ = None
+        self.__octtree_top__ = None
+        self.__bvh__ = None
+        self.__accelerator_boxes__ = None
+        self.__added_shapes__ = []
+
+        copies = {}
+        self.__shapes__ = {}
+        for name, sh in scene.__shapes__.items():
+            # resolved before copying, so the copy has the bounding box too
+            shape_bounding_box(sh)
+            copies[id(sh)] = shape_copy(sh)
+            self.__shapes__[name] = copies[id(sh)]
+        if self.__flat_tree__ is not None:
+            self.__flat_tree__ = flat_tree_replace_shapes(
+                self.__flat_tree__, lambda sh: copies[id(sh)])
+
+        self.__lights__ = dict(scene.__lights__)
+        self.__shape_list__ = tuple(self.__shapes__.values())
+        self.__light_list__ = tuple(self.__lights__.values())
+        self.__batch_shapes__ = tuple(
+            sh for sh in self.__shape_list__
+            if sh[SHAPE_INTERSECT_BATCH_FUNC] is not None)
+        self.__other_shapes__ = tuple(
+            sh for sh in self.__shape_list__
+            if sh[SHAPE_INTERSECT_BATCH_FUNC] is None)
+
+        for sh in self.__shape_list__:
+            if has_numpy and isinstance(sh[SHAPE_TRANSFORM], Transform):
+                sh[SHAPE_TRANSFORM].batch_matrices()
+
+        self.__views__ = {}
+        for name in scene.__views__:
+            self.set_view(name, scene.__views__[name])
+
+    def set_view(self, name, view_obj):
+        """Copies a view of the source scene into the snapshot, pointing the
+        copy at the snapshot. Done again before each render, so changes to
+        the view's output and options are picked up.
+
+        :param name: the handle of the view
+        :param view_obj: the view in the source scene
+        """
+        view_copy = list(view_obj)
+        view_copy[raytracer.view.VIEW_SCENE] = self
+        self.__views__[name] = view_copy
+
+    def get_shape_list(self):
+        return self.__shape_list__
+
+    def get_shape_groups(self):
+        return self.__batch_shapes__, self.__other_shapes__
+
+    def get_light_list(self):
+        return self.__light_list__
+
+    def compile(self):
+        return self
+
+    def setup_accelerator(self):
+        pass
+
+    def update_accelerator(self):
+        return False
+
+    def set_changed(self):
+        raise TypeError('a compiled scene cannot be changed')
+
+    def add_shape(self, shape, name=None):
+        raise TypeError('a compiled scene cannot be changed')
+
+    def add_light(self, light, name=None):
+        raise TypeError('a compiled scene cannot be changed')
+
+    def add_view(self, view_obj, name=None):
+        raise TypeError('a compiled scene cannot be changed')
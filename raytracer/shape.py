@@ -3,6 +3,7 @@ from raytracer.colour import *
 from raytracer.matrix import *
 from raytracer.transformation import *
 from raytracer.oct_tree import *
+from raytracer.render_stats import *
 
 """Functions for dealing with shapes. A shape is a list with the following
 elements:
@@ -21,6 +22,18 @@ elements:
   point on the object
 * a Transformation for the shape
 * a dictionary of other shape data, as needed by particular shapes
+* bounding boxes for the shape in shape space and in world space
+* a colour tuple and a function for the transparency colour of the shape
+* a function to test the intersection of a batch of rays with the shape, or
+  None where the shape only supports testing one ray at a time. It returns
+  arrays of t, a hit mask, shape-space points and world-space normals, and a
+  dictionary of other per-ray results (or None).
+* a function to complete the results of an intersection, or None where the
+  shape's intersection function returns complete results. Intersection
+  functions for such shapes return little more than t, and this function
+  adds the point, normal and other results from the shape-space ray. It is
+  only called, by shape_finalize_hit, for the hits that are used, as most
+  hits found while tracing a ray are further away than another.
 """
 
 SHAPE_SHAPE = 1
@@ -36,6 +49,8 @@ SHAPE_BOUNDING_BOX_SHAPESPACE = 10
 SHAPE_BOUNDING_BOX_WORLDSPACE = 11
 SHAPE_TRANSPARENTCOLOUR = 12
 SHAPE_TRANSPARENTCOLOUR_FUNC = 13
+SHAPE_INTERSECT_BATCH_FUNC = 14
+SHAPE_FINALIZE_FUNC = 15
 
 def shape_diffuse_colour(intersect_result):
     """Returns the diffuse colour for a shape that is stored in the shape
@@ -82,7 +97,8 @@ def shape_get_colour(intersect_result, colour_type):
         
     shape = intersect_result['shape']
     if shape[function_index] is not None:
-        tuple = shape[function_index](shape, intersect_result)
+        tuple = shape[function_index](
+            shape, shape_finalize_hit(intersect_result))
     else:
         tuple = shape[colour_type]
     
@@ -92,11 +108,30 @@ def shape_get_colour(intersect_result, colour_type):
     if 'colour' in tuple:
         return tuple
     elif 'colour_mapping' in tuple:
-        uv_pair = tuple[1](intersect_result)
+        uv_pair = tuple[1](shape_finalize_hit(intersect_result))
         return tuple[2].colour(uv_pair)
 
     return None
 
+def shape_may_be_transparent(shape):
+    """Returns False if a shape is opaque everywhere: it has no transparency
+    colour function, and its transparency colour is unset or black. Hits on
+    opaque shapes need no record of the hits behind them.
+
+    :param shape: the shape
+    :return: a boolean
+    """
+    if shape[SHAPE_TRANSPARENTCOLOUR_FUNC] is not None:
+        return True
+
+    colour = shape[SHAPE_TRANSPARENTCOLOUR]
+    if colour is None:
+        return False
+    if 'colour' in colour:
+        return colour[1] > 0 or colour[2] > 0 or colour[3] > 0
+
+    return True
+
 def shape_bounding_box(shape):
     if shape[SHAPE_BOUNDING_BOX_SHAPESPACE] is None:
       return None
@@ -108,35 +143,25 @@ def shape_bounding_box(shape):
       return shape[SHAPE_BOUNDING_BOX_WORLDSPACE]
     
     
-    # print ("shape[SHAPE_TRANSFORM].__options__")
-    # print (shape[SHAPE_TRANSFORM].__options__)
-        
-    
-    transformed_points = []
-    for point in shape[SHAPE_BOUNDING_BOX_SHAPESPACE].coordinates:
-      ws_point = shape[SHAPE_TRANSFORM].inverse_transform (point, True)
-      transformed_points.append(ws_point)
-    
-      # print ("point %s"%point.__str__());
-      # print ("ws-point %s"%ws_point.__str__());
-      # print ();
- 
-    
-    min_x = None
-    max_x = None
-    min_y = None
-    max_y = None 
-    min_z = None
-    max_z = None
-    
-    for point in transformed_points:
-      if min_x is None or point[1] < min_x : min_x = point[1]
-      if max_x is None or point[1] > max_x : max_x = point[1]
-      if min_y is None or point[2] < min_y : min_y = point[2]
-      if max_y is None or point[2] > max_y : max_y = point[2]
-      if min_z is None or point[3] < min_z : min_z = point[3]
-      if max_z is None or point[3] > max_z : max_z = point[3]
-    
+    corners = shape[SHAPE_BOUNDING_BOX_SHAPESPACE].coordinates
+    if has_numpy:
+      # transform all the corners into world space at once
+      points = shape[SHAPE_TRANSFORM].transform_points_batch(
+          numpy.array([point[1:4] for point in corners],
+                      dtype=numpy.float64), True)
+      min_x, min_y, min_z = points.min(axis=0).tolist()
+      max_x, max_y, max_z = points.max(axis=0).tolist()
+    else:
+      transformed_points = [
+          shape[SHAPE_TRANSFORM].inverse_transform(point, True)
+          for point in corners]
+      min_x = min(point[1] for point in transformed_points)
+      max_x = max(point[1] for point in transformed_points)
+      min_y = min(point[2] for point in transformed_points)
+      max_y = max(point[2] for point in transformed_points)
+      min_z = min(point[3] for point in transformed_points)
+      max_z = max(point[3] for point in transformed_points)
+
     # import pdb; pdb.set_trace();    
     
     shape[SHAPE_BOUNDING_BOX_WORLDSPACE] = BoundingBox (
@@ -145,10 +170,13 @@ def shape_bounding_box(shape):
     return shape[SHAPE_BOUNDING_BOX_WORLDSPACE]
      
 def shape_set_transform(shape, transform):
-    """Sets the transformation for a shape.
+    """Sets the transformation for a shape. The shape's cached world space
+    bounding box is cleared, so scenes holding the shape see it has moved
+    and update their acceleration structures before the next render.
     :param shape: a shape
     :param transform: a Transformation object
     """
+    shape[SHAPE_BOUNDING_BOX_WORLDSPACE] = None
 
     if isinstance(transform, Transform):
         shape[SHAPE_TRANSFORM] = transform
@@ -157,14 +185,26 @@ def shape_set_transform(shape, transform):
     else:
         shape[SHAPE_TRANSFORM] = None
 
+def shape_copy(shape):
+    """Returns a copy of a shape, with its own transformation, so the shape
+    can be changed without changing the copy. The shape's data, such as the
+    arrays of a polymesh, is shared with the copy.
+    :param shape: a shape
+    :return: a copy of the shape
+    """
+    copied = list(shape)
+    if isinstance(shape[SHAPE_TRANSFORM], Transform):
+        copied[SHAPE_TRANSFORM] = copy(shape[SHAPE_TRANSFORM])
+    return copied
+
 def shape_empty_shape():
     """"Returns a list with some starting elements necessary for a shape.
 
-    :return: ['shape', None, None, None, None, None, shape_diffuse_colour,
-             shape_specular_colour, None, {}, None, None]"""
+    :return: ['shape', None, None, None, None, None, None, None, None, {},
+             None, None, None, None, None, None]"""
 
     return ['shape', None, None, None, None, None, None,
-            None, None, {}, None, None, None, None]
+            None, None, {}, None, None, None, None, None, None]
 
 
 def shape_point_inside(shape, cartesian):
@@ -185,16 +225,31 @@ def shape_test_intersect(shape, ray):
              False if the ray does not intersect."""
 
     if shape[SHAPE_TRANSFORM] is not None:
-        result = shape[SHAPE_INTERSECT_FUNC](
-            shape, shape[SHAPE_TRANSFORM].transform(ray))
-    else:
-        result = shape[SHAPE_INTERSECT_FUNC](shape, ray)
-    
-    if type(result) is list:     
-        result['ray'] = ray
+        ray = shape[SHAPE_TRANSFORM].transform(ray)
+    result = shape[SHAPE_INTERSECT_FUNC](shape, ray)
+    render_stats_add_tests(shape[SHAPE_SHAPE], 1, result is not False)
+
+    # kept for shape_finalize_hit, if the hit is used
+    if result is not False and shape[SHAPE_FINALIZE_FUNC] is not None:
+        result['raw_ray'] = ray
     return result
 
 
+def shape_finalize_hit(intersect_result):
+    """Completes the results of an intersection with a shape that has a
+    function to do so, if that has not already been done. The results must
+    come from shape_test_intersect, with the shape added as 'shape'.
+
+    :param intersect_result: a dictionary of intersection results
+    :return: the dictionary of intersection results
+    """
+    if 'raw_ray' in intersect_result:
+        shape = intersect_result['shape']
+        shape[SHAPE_FINALIZE_FUNC](shape, intersect_result,
+                                   intersect_result.pop('raw_ray'))
+    return intersect_result
+
+
 def shape_reverse_transform(intersect_result):
     """Transforms the normal from an intersection with a shape into
     scene-space, if there is a Transformation set for the shape
@@ -204,6 +259,13 @@ def shape_reverse_transform(intersect_result):
              'normal' added."""
 
     shape = intersect_result['shape']
+    shape_finalize_hit(intersect_result)
+    # shadow rays never use the normal
+    needs_normal = 'raw_normal' in intersect_result and \
+        'normal' not in intersect_result and \
+        not ('ray' in intersect_result and
+             intersect_result['ray'][RAY_ISSHADOW])
+
     if shape[SHAPE_TRANSFORM] is not None:
         if 'raw_point' in intersect_result:
             intersect_result['raw_intersect_point'] = \
@@ -212,14 +274,13 @@ def shape_reverse_transform(intersect_result):
             #       shape[SHAPE_TRANSFORM].inverseTransform
             # (intersect_result['raw_point'], True)
 
-        if 'raw_normal' in intersect_result:
-            if not intersect_result['ray'][RAY_ISSHADOW]:
-                intersect_result['normal'] = cartesian_normalise(
-                    shape[SHAPE_TRANSFORM].inverse_transform(
-                        intersect_result['raw_normal']))
+        if needs_normal:
+            intersect_result['normal'] = \
+                shape[SHAPE_TRANSFORM].transform_normal(
+                    intersect_result['raw_normal'])
 
     else:
-        if 'raw_normal' in intersect_result:
+        if needs_normal:
             intersect_result['normal'] = intersect_result['raw_normal']
         if 'raw_point' in intersect_result:
             intersect_result['point'] = intersect_result['raw_point']
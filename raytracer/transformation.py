@@ -1,14 +1,79 @@
-try:
-    from gmpy2 import *
-except ImportError:
-    from math import *
-    from raytracer.mpfr_dummy import *
+from raytracer.precision import *
 
 from raytracer.matrix import *
 from raytracer.cartesian import *
 from copy import *
 
-"""Support for transformations of points, vectors and rays"""
+try:
+    import numpy
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
+"""Support for transformations of points, vectors and rays. Batches of
+points or vectors can be transformed at once as N x 3 NumPy arrays, if numpy
+is installed.
+
+A Transform keeps its forward (world space to shape space) and inverse
+(shape space to world space) transformations as 3x4 affine matrices: a 3x3
+matrix, with the translation as a fourth column. These are flat tuples of 12
+numbers, row by row, for transforming single cartesians, and 3x4 NumPy arrays
+for batches.
+
+Normals are transformed from shape space to world space by the normal matrix,
+the inverse transpose of the inverse transformation, which is the transpose
+of the forward 3x3 matrix. Unlike the inverse matrix, this keeps normals
+perpendicular to surfaces that are scaled by different amounts in each
+dimension."""
+
+
+def transform_affine_create(matrix, translate=None):
+    """Creates a 3x4 affine matrix, as a flat tuple of 12 numbers row by row,
+    from the top left 3x3 of a 4x4 matrix and a translation.
+
+    :param matrix: a 4x4 matrix, as a list of rows
+    :param translate: a tuple of the x, y and z to add after the matrix is
+                      applied, or None
+    :return: a tuple of 12 numbers
+    """
+    affine = []
+    for i in range(0, 3):
+        affine.extend(matrix[i][0:3])
+        affine.append(mpfr(0) if translate is None else translate[i])
+    return tuple(affine)
+
+
+def transform_affine_point(affine, cartesian):
+    """Applies a 3x4 affine matrix to a point.
+
+    :param affine: a tuple of 12 numbers, as from transform_affine_create
+    :param cartesian: a cartesian tuple
+    :return: the transformed cartesian
+    """
+    x = cartesian[1]
+    y = cartesian[2]
+    z = cartesian[3]
+    return ('cartesian',
+            (affine[0] * x) + (affine[1] * y) + (affine[2] * z) + affine[3],
+            (affine[4] * x) + (affine[5] * y) + (affine[6] * z) + affine[7],
+            (affine[8] * x) + (affine[9] * y) + (affine[10] * z) + affine[11])
+
+
+def transform_affine_vector(affine, cartesian):
+    """Applies the 3x3 matrix of a 3x4 affine matrix to a vector, so that no
+    translation is applied.
+
+    :param affine: a tuple of 12 numbers, as from transform_affine_create
+    :param cartesian: a cartesian tuple
+    :return: the transformed cartesian
+    """
+    x = cartesian[1]
+    y = cartesian[2]
+    z = cartesian[3]
+    return ('cartesian',
+            (affine[0] * x) + (affine[1] * y) + (affine[2] * z),
+            (affine[4] * x) + (affine[5] * y) + (affine[6] * z),
+            (affine[8] * x) + (affine[9] * y) + (affine[10] * z))
 
 
 class Transform:
@@ -20,10 +85,10 @@ class Transform:
 
         :return: String representation of a Transformation."""
 
-        return ("{no_transform: %s options: %s " +
-                "matrix: %s inverse_matrix: %s}" %
-                (self.__no_transform__, self.__options__, self.__matrix__,
-                 self.__inverse_matrix__))
+        return (("{no_transform: %s options: %s " +
+                 "matrix: %s inverse_matrix: %s}") %
+                (self.__no_transform__, self.__options__, self.__forward__,
+                 self.__inverse__))
 
     def __init__(self, options):
         """Class constructor. Calls self.set_options.
@@ -45,10 +110,13 @@ class Transform:
             o 'angle': the angle to rotate about the vector, in degrees
         """
         self.__options__ = {}
-        self.__inverse_matrix__ = None
         self.__matrix__ = None
         self.__inverse_matrix__ = None
+        self.__forward__ = None
+        self.__inverse__ = None
+        self.__normal__ = None
         self.__no_transform__ = True
+        self.__batch_matrices__ = None
         self.set_options(options)
 
     def no_transform(self):
@@ -74,10 +142,66 @@ class Transform:
         return self.__options__
     
     def set_matrix (self, matrix):
-        
+        """Sets the matrix of the transformation, keeping any translation
+        from its options.
+
+        :param matrix: a Matrix object
+        """
         self.__matrix__ = matrix
-        self.__inverse_matrix__ = matrix.inverse
-        
+        self.__inverse_matrix__ = matrix.inversed()
+        self.set_affine()
+
+    def set_affine(self):
+        """Calculates the 3x4 affine matrices of the transformation from its
+        matrices and translation. The forward matrix applies the translation
+        before its 3x3 matrix, so that its translation column is the negated
+        translation transformed by the matrix.
+        """
+        self.__batch_matrices__ = None
+        self.__normal__ = None
+        if self.__matrix__ is None:
+            self.__forward__ = None
+            self.__inverse__ = None
+            return
+
+        matrix = self.__matrix__.matrix
+        inverse = self.__inverse_matrix__.matrix
+
+        translate = None
+        forward_translate = None
+        if 'translate' in self.__options__:
+            translate = self.__options__['translate'][1:4]
+            forward_translate = tuple(
+                mpfr(0) - value for value in
+                transform_matrix_mul_cartesian(
+                    matrix, self.__options__['translate'])[1:4])
+
+        self.__forward__ = transform_affine_create(matrix, forward_translate)
+        self.__inverse__ = transform_affine_create(inverse, translate)
+        self.set_normal_matrix()
+
+    def set_normal_matrix(self):
+        """Calculates the normal matrix from the forward matrix. No normal
+        matrix is kept if the forward matrix is the identity, as for a
+        transform that only translates.
+        """
+        rows = [self.__forward__[0:3], self.__forward__[4:7],
+                self.__forward__[8:11]]
+        if all(rows[i][j] == (1 if i == j else 0)
+               for i in range(0, 3) for j in range(0, 3)):
+            return
+
+        self.__normal__ = transform_affine_create(list(zip(*rows)))
+
+    def affine_matrices(self):
+        """Returns the forward and inverse transformations as 3x4 affine
+        matrices, or None for each if the transform makes no change.
+
+        :return: a tuple of two tuples of 12 numbers, as from
+                 transform_affine_create
+        """
+        return self.__forward__, self.__inverse__
+
     def set_options(self, options):
         """Sets transformation options.
 
@@ -102,6 +226,7 @@ class Transform:
         rotatematrix = None
         translatematrix = None
         __inverse_matrix__ = None
+        self.__batch_matrices__ = None
         if ('translate' in options):
             if 'cartesian' not in options['translate']:
                 options['translate'] = cartesian_create(
@@ -115,7 +240,10 @@ class Transform:
         if ('scale' not in options and
                 'translate' not in options and 'rotate' not in options):
             self.__matrix__ = Matrix()
+            self.__inverse_matrix__ = Matrix()
             self.__no_transform__ = True
+            self.__forward__ = None
+            self.__inverse__ = None
             return
         else:
             self.__no_transform__ = False
@@ -145,6 +273,8 @@ class Transform:
             self.__matrix__ = Matrix()
             self.__inverse_matrix__ = Matrix()
 
+        self.set_affine()
+
     def transform(self, ray):
         """Transforms a given ray.
 
@@ -152,39 +282,26 @@ class Transform:
 
         :return: the ray, transformed
         """
+        forward = self.__forward__
+        if forward is None:
+            return ray
 
-        ray_dir = ray[RAY_VECTOR]
-        ray_point = ray[RAY_START]
-
-        if 'translate' in self.__options__:
-            ray_point = cartesian_sub(
-                ray_point, self.__options__['translate'])
-
-        if isinstance(self.__matrix__, Matrix):
-            ray_dir = transform_matrix_mul_cartesian(
-                self.__matrix__.matrix, ray_dir)
-            ray_point = transform_matrix_mul_cartesian(
-               self.__matrix__.matrix, ray_point)
-
-
-
-        return ray_create(ray_point, ray_dir, ray[RAY_ISSHADOW])
-        
+        return ('ray', transform_affine_point(forward, ray[RAY_START]),
+                transform_affine_vector(forward, ray[RAY_VECTOR]),
+                ray[RAY_ISSHADOW])
 
     def transform_cartesian(self, cartesian, no_translate = False):
         if self.__no_transform__:
-            return cartesian        
-        
-        if isinstance(self.__matrix__, Matrix):
-            new_cartesian = transform_matrix_mul_cartesian(
-                self.__matrix__.matrix, cartesian)
-  
+            return cartesian
+
+        new_cartesian = transform_affine_vector(self.__forward__, cartesian)
+
         if not no_translate:
             if 'translate' in self.__options__:
                 new_cartesian = cartesian_sub(
-                    new_cartesian, self.__options__['translate']) 
-        return new_cartesian              
-                
+                    new_cartesian, self.__options__['translate'])
+        return new_cartesian
+
     def transform_point(self, point, inverse=False):
         """Transforms a point. (A point can only be transformed by
         translation.)
@@ -203,20 +320,123 @@ class Transform:
             else:
                 return cartesian_sub(point, self.__options__['translate'])
 
+    def transform_normal(self, normal):
+        """Transforms a normal from shape space to world space, by the
+        normal matrix. The normal is normalised, as not every shape gives
+        normals of unit length.
+
+        :param normal: a cartesian normal
+        :return: the transformed normal, of unit length
+        """
+        if self.__normal__ is not None:
+            normal = transform_affine_vector(self.__normal__, normal)
+
+        return cartesian_normalise(normal)
+
     def inverse_transform(self, normal, translate=False):
-        """Applies inverse transformation to a vector. (Used for normals.)
+        """Applies inverse transformation to a vector or point, from shape
+        space to world space. Normals are transformed by transform_normal.
 
         :param normal: a cartesian to transform
+        :param translate: if True, the cartesian is a point, and the
+                          translation is also applied
         :return: the transformed vector
         """
 
         if self.__no_transform__:
             return normal
 
-        if self.__inverse_matrix__ is not None:
-            normal = (self.__inverse_matrix__ * (normal))
+        if translate:
+            return transform_affine_point(self.__inverse__, normal)
+
+        return transform_affine_vector(self.__inverse__, normal)
+
+    def batch_matrices(self):
+        """Returns the forward and inverse transformations and the normal
+        matrix as 3x4 NumPy arrays, for transforming batches of points and
+        vectors. The arrays are created on first use.
+
+        :return: a tuple of the forward, inverse and normal 3x4 arrays, the
+                 last being None if there is no normal matrix, or None if
+                 the transform makes no change
+        """
+        if self.__batch_matrices__ is None and self.__forward__ is not None:
+            self.__batch_matrices__ = tuple(
+                None if affine is None else
+                numpy.array(affine, dtype=numpy.float64).reshape(3, 4)
+                for affine in (self.__forward__, self.__inverse__,
+                               self.__normal__))
+
+        return self.__batch_matrices__
+
+    def transform_points_batch(self, points, inverse=False):
+        """Transforms a batch of points, with a single matrix product.
+
+        :param points: an N x 3 array of points
+        :param inverse: if True, the points are transformed from shape space
+                        to world space, else from world space to shape space
+        :return: an N x 3 array of the transformed points
+        """
+        matrices = self.batch_matrices()
+        if matrices is None:
+            return points
+
+        affine = matrices[1 if inverse else 0]
+        return (points @ affine[:, 0:3].T) + affine[:, 3]
+
+    def transform_directions_batch(self, directions, inverse=False):
+        """Transforms a batch of vectors, with a single matrix product. No
+        translation is applied.
+
+        :param directions: an N x 3 array of vectors
+        :param inverse: if True, the vectors are transformed from shape space
+                        to world space, else from world space to shape space
+        :return: an N x 3 array of the transformed vectors
+        """
+        matrices = self.batch_matrices()
+        if matrices is None:
+            return directions
+
+        return directions @ matrices[1 if inverse else 0][:, 0:3].T
+
+    def transform_batch(self, starts, directions):
+        """Transforms a batch of rays, as done by transform for single rays.
+
+        :param starts: an N x 3 array of ray start points
+        :param directions: an N x 3 array of ray directions
+
+        :return: a tuple of the transformed start points and directions
+        """
+        return (self.transform_points_batch(starts),
+                self.transform_directions_batch(directions))
+
+    def transform_normals_batch(self, normals):
+        """Transforms a batch of unit normals from shape space to world
+        space, as done by transform_normal for single normals.
+
+        :param normals: an N x 3 array of normals
+        :return: an N x 3 array of the transformed normals, of unit length
+        """
+        matrices = self.batch_matrices()
+        if matrices is not None and matrices[2] is not None:
+            normals = normals @ matrices[2][:, 0:3].T
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return normals / numpy.linalg.norm(
+                normals, axis=1)[:, numpy.newaxis]
+
+    def inverse_transform_batch(self, normals, translate=False):
+        """Applies inverse transformation to a batch of vectors, as done by
+        inverse_transform for single vectors.
+
+        :param normals: an N x 3 array of vectors to transform
+        :param translate: if True, the translation is also applied
+        :return: an N x 3 array of transformed vectors
+        """
+        if self.__no_transform__:
+            return normals
 
-        if translate and 'translate' in self.__options__:
-            return cartesian_add(normal, self.__options__['translate'])
+        if translate:
+            return self.transform_points_batch(normals, True)
 
-        return normal
+        return self.transform_directions_batch(normals, True)
@@ -0,0 +1,98 @@
+import raytracer.bvh as bvh
+import raytracer.shape as shape
+import raytracer.quadraticshapes as quadraticshapes
+import raytracer.transformation as transformation
+import raytracer.cartesian as cartesian
+import raytracer.colour as colour
+import random
+import unittest
+
+
+class TestBVHProcedures(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(7)
+        self.shapes = []
+        for i in range(60):
+            self.shapes.append(quadraticshapes.shape_sphere_create(
+                colour.colour_create(1, 1, 1), None,
+                transformation.Transform({
+                    'scale': {'x': .3, 'y': .3, 'z': .3},
+                    'translate': {'x': random.uniform(-5, 5),
+                                  'y': random.uniform(-5, 5),
+                                  'z': random.uniform(-5, 5)}})))
+
+        self.bvh = bvh.BVH(self.shapes, 2)
+
+        self.rays = []
+        for i in range(100):
+            self.rays.append(cartesian.ray_create(
+                cartesian.cartesian_create(random.uniform(-5, 5),
+                                           random.uniform(-5, 5), -20),
+                cartesian.cartesian_create(random.uniform(-.1, .1),
+                                           random.uniform(-.1, .1), 1)))
+
+    def test_func_bvh_slab_test(self):
+        bounds = (-1, -1, -1, 1, 1, 1)
+        ray = cartesian.ray_create(cartesian.cartesian_create(0, 0, -5),
+                                   cartesian.cartesian_create(0, 0, 1))
+        inverse = bvh.bvh_ray_inverse_direction(ray)
+        self.assertEqual(bvh.bvh_slab_test(bounds, ray[1], inverse), 4)
+
+        ray = cartesian.ray_create(cartesian.cartesian_create(2, 0, -5),
+                                   cartesian.cartesian_create(0, 0, 1))
+        inverse = bvh.bvh_ray_inverse_direction(ray)
+        self.assertIsNone(bvh.bvh_slab_test(bounds, ray[1], inverse))
+
+    def check_nearest_hits(self):
+        hits = 0
+        for ray in self.rays:
+            nearest = None
+            for sh in self.shapes:
+                result = shape.shape_test_intersect(sh, ray)
+                if result is not False and \
+                        (nearest is None or result['t'] < nearest[0]):
+                    nearest = (result['t'], sh)
+
+            result, hit_shape = self.bvh.get_nearest_hit(
+                ray, shape.shape_test_intersect)
+            candidates = self.bvh.get_shapes_by_ray(ray)
+
+            if nearest is None:
+                self.assertIs(result, False)
+                continue
+
+            hits += 1
+            self.assertAlmostEqual(result['t'], nearest[0])
+            self.assertIs(hit_shape, nearest[1])
+            self.assertIn(nearest[1], candidates)
+            self.assertLess(len(candidates), len(self.shapes))
+
+        self.assertGreater(hits, 0)
+
+    def move_shapes(self, offset):
+        for sh in self.shapes:
+            box = shape.shape_bounding_box(sh)
+            x = box.mid_x + random.uniform(-offset, offset)
+            y = box.mid_y + random.uniform(-offset, offset)
+            shape.shape_set_transform(sh, transformation.Transform({
+                'scale': {'x': .3, 'y': .3, 'z': .3},
+                'translate': {'x': x, 'y': y, 'z': box.mid_z}}))
+
+    def test_func_bvh_get_nearest_hit(self):
+        self.check_nearest_hits()
+
+    def test_func_bvh_refit(self):
+        self.move_shapes(.2)
+        cost_ratio = self.bvh.refit()
+        self.assertLess(cost_ratio, bvh.BVH_REFIT_MAX_COST_RATIO)
+        self.check_nearest_hits()
+
+        self.move_shapes(5)
+        self.assertGreater(self.bvh.refit(),
+                           bvh.BVH_REFIT_MAX_COST_RATIO)
+        self.check_nearest_hits()
+
+
+if __name__ == '__main__':
+    unittest.main()
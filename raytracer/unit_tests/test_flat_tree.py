@@ -0,0 +1,102 @@
+import raytracer.flat_tree as flat_tree
+import raytracer.bvh as bvh
+import raytracer.oct_tree as oct_tree
+import raytracer.shape as shape
+import raytracer.quadraticshapes as quadraticshapes
+import raytracer.transformation as transformation
+import raytracer.cartesian as cartesian
+import raytracer.colour as colour
+import pickle
+import random
+import unittest
+
+
+class OctTreeTop(object):
+    """Holds the top node of an octree, which is replaced when it splits."""
+
+    def replace_node(self, old_node, new_node):
+        self.node = new_node
+
+
+class TestFlatTreeProcedures(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(3)
+        self.shapes = []
+        for i in range(60):
+            self.shapes.append(quadraticshapes.shape_sphere_create(
+                colour.colour_create(1, 1, 1), None,
+                transformation.Transform({
+                    'scale': {'x': .3, 'y': .3, 'z': .3},
+                    'translate': {'x': random.uniform(-5, 5),
+                                  'y': random.uniform(-5, 5),
+                                  'z': random.uniform(-5, 5)}})))
+
+        self.octree = OctTreeTop()
+        self.octree.node = oct_tree.OctTreeLeaf(
+            self.octree, 4, -6, 6, -6, 6, -6, 6)
+        for sh in self.shapes:
+            self.octree.node.add_shape(sh)
+
+        self.rays = []
+        for i in range(100):
+            self.rays.append(cartesian.ray_create(
+                cartesian.cartesian_create(random.uniform(-5, 5),
+                                           random.uniform(-5, 5), -20),
+                cartesian.cartesian_create(random.uniform(-.1, .1),
+                                           random.uniform(-.1, .1), 1)))
+
+    def nearest(self, ray):
+        nearest = None
+        for sh in self.shapes:
+            result = shape.shape_test_intersect(sh, ray)
+            if result is not False and \
+                    (nearest is None or result['t'] < nearest[0]):
+                nearest = (result['t'], sh)
+        return nearest
+
+    def test_func_flat_tree_from_bvh(self):
+        tree = flat_tree.flat_tree_from_bvh(bvh.BVH(self.shapes, 2))
+        tree = pickle.loads(pickle.dumps(tree))
+        self.assertEqual(len(tree[flat_tree.FLAT_TREE_PRIMITIVES]),
+                         len(self.shapes))
+
+        hits = 0
+        for ray in self.rays:
+            nearest = self.nearest(ray)
+            result, hit_shape = flat_tree.flat_tree_get_nearest_hit(
+                tree, ray, shape.shape_test_intersect)
+
+            if nearest is None:
+                self.assertIs(result, False)
+                continue
+
+            hits += 1
+            self.assertAlmostEqual(result['t'], nearest[0])
+            self.assertIsNotNone(hit_shape)
+
+        self.assertGreater(hits, 0)
+
+    def test_func_flat_tree_from_octree(self):
+        tree = flat_tree.flat_tree_from_octree(self.octree.node)
+        self.assertGreater(len(tree[flat_tree.FLAT_TREE_CHILD_COUNT]), 1)
+
+        for ray in self.rays:
+            nearest = self.nearest(ray)
+            candidates = flat_tree.flat_tree_get_shapes_by_ray(tree, ray)
+            self.assertEqual(len(candidates),
+                             len(set(id(sh) for sh in candidates)))
+            self.assertLess(len(candidates), len(self.shapes))
+            if nearest is not None:
+                self.assertIn(nearest[1], candidates)
+
+    def test_func_flat_tree_empty(self):
+        tree = flat_tree.flat_tree_create()
+        ray = self.rays[0]
+        self.assertEqual(flat_tree.flat_tree_get_shapes_by_ray(tree, ray), [])
+        self.assertEqual(flat_tree.flat_tree_get_nearest_hit(
+            tree, ray, shape.shape_test_intersect), (False, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import raytracer.mesh_file as mesh_file
+import raytracer.planarshapes as planarshapes
+import raytracer.shape as shape
+import raytracer.cartesian as cartesian
+import raytracer.colour as colour
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import unittest
+
+
+class TestMeshFileProdcedures(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(5)
+        points = []
+        indices = []
+        for i in range(30):
+            centre = [random.uniform(-2, 2), random.uniform(-2, 2),
+                      random.uniform(-2, 2)]
+            width = random.uniform(.2, 1)
+            height = random.uniform(.2, 1)
+            for x, y in ((-1, -1), (1, -1), (1, 1), (-1, 1)):
+                points.append(cartesian.cartesian_create(
+                    centre[0] + x * width, centre[1] + y * height,
+                    centre[2]))
+            # a quad, split into two triangles when saved
+            indices.append([i * 4, i * 4 + 1, i * 4 + 2, i * 4 + 3])
+        self.data = {'points': points, 'polygon_point_indices': indices}
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.rays = []
+        for i in range(60):
+            self.rays.append(cartesian.ray_create(
+                cartesian.cartesian_create(random.uniform(-2, 2),
+                                           random.uniform(-2, 2), -8),
+                cartesian.cartesian_create(random.uniform(-.1, .1),
+                                           random.uniform(-.1, .1), 1)))
+
+    def check_intersections(self, mesh, expected_mesh):
+        hits = 0
+        for ray in self.rays:
+            result = planarshapes.shape_polymesh_intersect(mesh, ray)
+            expected = planarshapes.shape_polymesh_intersect(expected_mesh,
+                                                             ray)
+            self.assertEqual(result is False, expected is False)
+            if result is not False:
+                hits += 1
+                self.assertAlmostEqual(result['t'], expected['t'], 5)
+                self.assertEqual(result['hit_face'], expected['hit_face'])
+        self.assertGreater(hits, 0)
+
+    def test_func_mesh_file_load(self):
+        expected_mesh = planarshapes.shape_polymesh_create(self.data, False)
+
+        for prebuilt in (True, False):
+            filename = os.path.join(self.directory, 'mesh.rtmesh')
+            mesh_file.mesh_file_save(filename, self.data, prebuilt)
+            mesh = mesh_file.mesh_file_load(filename,
+                                            colour.colour_create(1, 0, 0))
+
+            data = mesh[shape.SHAPE_DATA]
+            self.assertEqual(data['face_count'], 60)
+            self.assertEqual('bvh' in data, True)
+            self.assertIsInstance(data['vertices'], memoryview)
+            self.assertEqual(isinstance(data['face_data'], memoryview),
+                             prebuilt)
+            self.check_intersections(mesh, expected_mesh)
+
+    def test_func_mesh_file_pickle(self):
+        filename = os.path.join(self.directory, 'mesh.rtmesh')
+        mesh_file.mesh_file_save(filename, self.data)
+        mesh = mesh_file.mesh_file_load(filename,
+                                        colour.colour_create(1, 0, 0))
+
+        copy = pickle.loads(pickle.dumps(mesh))
+        self.assertIsInstance(copy[shape.SHAPE_DATA], mesh_file.MeshFileData)
+        self.assertEqual(copy[shape.SHAPE_DATA]['colour'],
+                         ('colour', 1, 0, 0))
+        self.check_intersections(copy, mesh)
+
+    def test_func_mesh_file_map_invalid(self):
+        filename = os.path.join(self.directory, 'mesh.rtmesh')
+        with open(filename, 'wb') as invalid_file:
+            invalid_file.write(b'not a mesh file, but long enough to map')
+
+        self.assertRaises(ValueError, mesh_file.mesh_file_map, filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
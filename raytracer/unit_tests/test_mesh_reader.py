@@ -0,0 +1,92 @@
+import raytracer.mesh_reader as mesh_reader
+import raytracer.planarshapes as planarshapes
+import raytracer.shape as shape
+import raytracer.cartesian as cartesian
+import raytracer.transformation as transformation
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+
+@unittest.skipUnless(transformation.has_numpy, 'numpy is not installed')
+class TestMeshReaderProdcedures(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.vertices = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0),
+                         (2, 0, 1), (2, 1, 1)]
+        # a quad, a triangle, and a quad split into two triangles
+        self.triangles = [[0, 1, 2], [0, 2, 3], [1, 4, 5], [1, 4, 5],
+                          [1, 5, 2]]
+
+    def test_func_mesh_reader_read_obj(self):
+        filename = os.path.join(self.directory, 'mesh.obj')
+        with open(filename, 'w') as obj_file:
+            obj_file.write('# a test mesh\no mesh\n')
+            for vertex in self.vertices[:4]:
+                obj_file.write('v %g %g %g\n' % vertex)
+            obj_file.write('vn 0 0 1\nf 1//1 2//1 3//1 4//1\n')
+            # a w, and faces with indices relative to the last vertex
+            obj_file.write('v 2 0 1 1\nv 2 1 1 1\n')
+            obj_file.write('f 2/1 -2/1 -1/1\nf -5 -2 -1 3\n')
+
+        vertices, faces = mesh_reader.mesh_reader_read(filename)
+        self.assertEqual([tuple(vertex) for vertex in vertices.tolist()],
+                         self.vertices)
+        self.assertEqual(faces.tolist(), self.triangles)
+
+    def test_func_mesh_reader_read_ply(self):
+        filename = os.path.join(self.directory, 'mesh.ply')
+        with open(filename, 'wb') as ply_file:
+            ply_file.write(b'ply\nformat binary_big_endian 1.0\n'
+                           b'comment a test mesh\n'
+                           b'element vertex 6\nproperty double x\n'
+                           b'property double y\nproperty double z\n'
+                           b'property uchar red\n'
+                           b'element face 3\n'
+                           b'property list uchar int vertex_indices\n'
+                           b'end_header\n')
+            for vertex in self.vertices:
+                ply_file.write(struct.pack('>dddB', *(vertex + (255,))))
+            for polygon in ([0, 1, 2, 3], [1, 4, 5], [1, 4, 5, 2]):
+                ply_file.write(struct.pack('>B%di' % len(polygon),
+                                           len(polygon), *polygon))
+
+        vertices, faces = mesh_reader.mesh_reader_read(filename)
+        self.assertEqual([tuple(vertex) for vertex in vertices.tolist()],
+                         self.vertices)
+        self.assertEqual(faces.tolist(), self.triangles)
+
+        mesh = mesh_reader.mesh_reader_load(filename)
+        self.assertEqual(mesh[shape.SHAPE_DATA]['face_count'], 5)
+        result = planarshapes.shape_polymesh_intersect(
+            mesh, cartesian.ray_create(cartesian.cartesian_create(.5, .5, -5),
+                                       cartesian.cartesian_create(0, 0, 1)))
+        self.assertAlmostEqual(result['t'], 5)
+
+    def test_func_mesh_reader_read_concave_quad(self):
+        filename = os.path.join(self.directory, 'mesh.obj')
+        with open(filename, 'w') as obj_file:
+            # a dart, with its reflex point second
+            obj_file.write('v 0 0 0\nv 1 1 0\nv 0 2 0\nv 3 1 0\n'
+                           'f 1 2 3 4\n')
+
+        vertices, faces = mesh_reader.mesh_reader_read(filename)
+        self.assertEqual(faces.tolist(), [[1, 2, 3], [1, 3, 0]])
+
+    def test_func_mesh_reader_read_invalid(self):
+        filename = os.path.join(self.directory, 'mesh.obj')
+        with open(filename, 'w') as obj_file:
+            obj_file.write('v 0 0 0\nv 1 0 0\nf 1 2 3\n')
+
+        self.assertRaises(ValueError, mesh_reader.mesh_reader_read, filename)
+        self.assertRaises(ValueError, mesh_reader.mesh_reader_read,
+                          os.path.join(self.directory, 'mesh.stl'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import raytracer.shape as shape
+import raytracer.oct_tree as oct_tree
+import raytracer.quadraticshapes as quadraticshapes
+import raytracer.transformation as transformation
+import raytracer.cartesian as cartesian
+import random
+import unittest
+
+
+class OctTreeTop(object):
+    """Holds the top node of an octree, which is replaced when it splits."""
+
+    def replace_node(self, old_node, new_node):
+        self.node = new_node
+
+
+class TestOctTreeProcedures(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(5)
+        self.shapes = []
+        for i in range(80):
+            self.shapes.append(quadraticshapes.shape_sphere_create(
+                None, None, transformation.Transform({
+                    'scale': {'x': .3, 'y': .3, 'z': .3},
+                    'translate': {'x': random.uniform(-5, 5),
+                                  'y': random.uniform(-5, 5),
+                                  'z': random.uniform(-5, 5)}})))
+
+        self.octree = OctTreeTop()
+        self.octree.node = oct_tree.OctTreeLeaf(
+            self.octree, 4, -6, 6, -6, 6, -6, 6)
+        for sh in self.shapes:
+            self.octree.node.add_shape(sh)
+
+    def test_func_ray_box_entry(self):
+        bounds = (-1, -1, -1, 1, 1, 1)
+        start = cartesian.cartesian_create(-5, 0, 0)
+        for direction, expected in (((1, 0, 0), 4), ((-1, 0, 0), None),
+                                    ((0, 1, 0), None), ((1, .1, 0), 4)):
+            ray = cartesian.ray_create(
+                start, cartesian.cartesian_create(*direction))
+            inverse_direction, signs = cartesian.ray_inverse_direction(ray)
+            t = cartesian.ray_box_entry(bounds, 0, start, inverse_direction,
+                                        signs)
+            if expected is None:
+                self.assertIsNone(t)
+            else:
+                self.assertAlmostEqual(t, expected)
+
+    def test_func_octree_get_leaves_by_ray(self):
+        self.assertIsInstance(self.octree.node, oct_tree.OctTreeBranch)
+
+        for i in range(50):
+            ray = cartesian.ray_create(
+                cartesian.cartesian_create(random.uniform(-5, 5),
+                                           random.uniform(-5, 5), -20),
+                cartesian.cartesian_create(random.uniform(-.2, .2),
+                                           random.uniform(-.2, .2), 1))
+            start = ray[cartesian.RAY_START]
+            inverse_direction, signs = cartesian.ray_inverse_direction(ray)
+
+            leaves = self.octree.node.get_leaves_by_ray(ray)
+            entries = [leaf.get_ray_entry(start, inverse_direction, signs)
+                       for leaf in leaves]
+            self.assertNotIn(None, entries)
+            self.assertLess(len(leaves), 64)
+
+            candidates = self.octree.node.get_shapes_by_ray(ray)
+            for sh in self.shapes:
+                if shape.shape_test_intersect(sh, ray) is not False:
+                    self.assertIn(sh, candidates)
+
+
+if __name__ == '__main__':
+    unittest.main()
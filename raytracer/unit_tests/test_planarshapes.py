@@ -5,6 +5,7 @@ import math
 import raytracer.colour as colour
 import raytracer.transformation as transformation
 import raytracer.cartesian as cartesian
+import random
 
 
 class TestPlanarShapeProdcedures(unittest.TestCase):
@@ -42,5 +43,236 @@ class TestPlanarShapeProdcedures(unittest.TestCase):
 
         pass
 
+
+class TestPolygonProdcedures(unittest.TestCase):
+
+    def setUp(self):
+        # an L shape, whose fifth point is reflex
+        self.l_points = [cartesian.cartesian_create(x, y, 2)
+                         for x, y in ((0, 0), (2, 0), (2, 1), (1, 1),
+                                      (1, 2), (0, 2))]
+        self.square_points = [cartesian.cartesian_create(x, y, 2)
+                              for x, y in ((0, 0), (2, 0), (2, 2), (0, 2))]
+
+    def test_func_shape_polygon_triangulate(self):
+        self.assertTrue(planarshapes.shape_polygon_is_convex(
+            self.square_points))
+        self.assertEqual(planarshapes.shape_polygon_triangulate(
+            self.square_points), [(0, 1, 2), (0, 2, 3)])
+
+        self.assertFalse(planarshapes.shape_polygon_is_convex(self.l_points))
+        triangles = planarshapes.shape_polygon_triangulate(self.l_points)
+        self.assertEqual(len(triangles), 4)
+        # the triangles cover the L's area of 3, so none cross the notch
+        area = 0
+        for triangle in triangles:
+            area += planarshapes.shape_polygon_normal(
+                [self.l_points[index] for index in triangle])[2] / 2
+        self.assertAlmostEqual(area, 3)
+
+    def test_func_shape_polygon_intersect(self):
+        for points in (self.square_points, self.l_points):
+            polygon = planarshapes.shape_polygon_create(
+                {'points': points, 'colour': colour.colour_create(1, 1, 1)})
+            for x, y, expected in ((.5, .5, True), (1.5, .5, True),
+                                   (.5, 1.5, True), (1.5, 1.5,
+                                                     points is
+                                                     self.square_points),
+                                   (2.5, .5, False)):
+                ray = cartesian.ray_create(
+                    cartesian.cartesian_create(x, y, -3),
+                    cartesian.cartesian_create(0, 0, 1))
+                result = planarshapes.shape_polygon_intersect(polygon, ray)
+                self.assertEqual(result is not False, expected)
+                if expected:
+                    self.assertAlmostEqual(result['t'], 5)
+                    self.assertAlmostEqual(abs(result['raw_normal'][3]), 1)
+                    # texture mapping needs the point hit on either shape
+                    for value, expected_value in zip(
+                            result['raw_point'][1:], (x, y, 2)):
+                        self.assertAlmostEqual(value, expected_value)
+
+    def test_func_shape_polymesh_create_concave(self):
+        mesh = planarshapes.shape_polymesh_create(
+            {'points': self.l_points,
+             'polygon_point_indices': [list(range(6))]}, False)
+        for x, y, expected in ((.5, 1.5, True), (1.5, 1.5, False)):
+            ray = cartesian.ray_create(cartesian.cartesian_create(x, y, -3),
+                                       cartesian.cartesian_create(0, 0, 1))
+            result = planarshapes.shape_polymesh_intersect(mesh, ray)
+            self.assertEqual(result is not False, expected)
+
+@unittest.skipUnless(transformation.has_numpy, 'numpy is not installed')
+class TestPolymeshBatchProdcedures(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(3)
+        points = []
+        indices = []
+        for i in range(40):
+            centre = [random.uniform(-2, 2), random.uniform(-2, 2),
+                      random.uniform(-2, 2)]
+            for j in range(3):
+                points.append(cartesian.cartesian_create(
+                    centre[0] + random.uniform(-1, 1),
+                    centre[1] + random.uniform(-1, 1),
+                    centre[2] + random.uniform(-1, 1)))
+            indices.append([i * 3, i * 3 + 1, i * 3 + 2])
+
+        self.data = {'points': points, 'polygon_point_indices': indices,
+                     'colour': colour.colour_create(1, 1, 1)}
+        self.mesh = planarshapes.shape_polymesh_create(self.data, False)
+        self.triangles = [planarshapes.shape_triangle_create(
+            [points[index] for index in polygon],
+            [colour.colour_create(1, 1, 1)] * 3) for polygon in indices]
+
+        self.rays = []
+        for i in range(60):
+            self.rays.append(cartesian.ray_create(
+                cartesian.cartesian_create(random.uniform(-2, 2),
+                                           random.uniform(-2, 2), -8),
+                cartesian.cartesian_create(random.uniform(-.1, .1),
+                                           random.uniform(-.1, .1), 1)))
+
+    def scalar_intersect(self, ray):
+        nearest = False
+        for face, triangle in enumerate(self.triangles):
+            result = planarshapes.shape_triangle_intersect(triangle, ray)
+            if result is not False and \
+                    (nearest is False or result['t'] < nearest['t']):
+                nearest = result
+                nearest['hit_face'] = face
+        return nearest
+
+    def test_func_shape_polymesh_intersect(self):
+        # test the vectorized path for any number of candidate triangles
+        threshold = planarshapes.POLYMESH_VECTORIZE_THRESHOLD
+        planarshapes.POLYMESH_VECTORIZE_THRESHOLD = 0
+        self.addCleanup(setattr, planarshapes,
+                        'POLYMESH_VECTORIZE_THRESHOLD', threshold)
+
+        hits = 0
+        for ray in self.rays:
+            expected = self.scalar_intersect(ray)
+            result = planarshapes.shape_polymesh_intersect(
+                self.mesh, ray, False)
+            self.assertEqual(result is False, expected is False)
+            if result is not False:
+                hits += 1
+                self.assertAlmostEqual(result['t'], expected['t'])
+                self.assertEqual(result['hit_face'], expected['hit_face'])
+        self.assertGreater(hits, 0)
+
+    def test_func_shape_polymesh_intersect_accelerated(self):
+        for accelerator in ('octree', 'bvh'):
+            mesh = planarshapes.shape_polymesh_create(self.data, True,
+                                                      accelerator)
+            # batches of rays traverse the acceleration structure too
+            self.assertIsNone(mesh[shape.SHAPE_INTERSECT_BATCH_FUNC])
+            self.assertIsNone(planarshapes.shape_polymesh_instance_create(
+                mesh)[shape.SHAPE_INTERSECT_BATCH_FUNC])
+            for ray in self.rays:
+                expected = self.scalar_intersect(ray)
+                result = planarshapes.shape_polymesh_intersect(mesh, ray)
+                self.assertEqual(result is False, expected is False)
+                if result is not False:
+                    self.assertAlmostEqual(result['t'], expected['t'])
+                    self.assertEqual(result['hit_face'],
+                                     expected['hit_face'])
+
+    def test_func_shape_polymesh_intersect_batch(self):
+        self.assertIs(self.mesh[shape.SHAPE_INTERSECT_BATCH_FUNC],
+                      planarshapes.shape_polymesh_intersect_batch)
+        starts = planarshapes.numpy.array([ray[1][1:] for ray in self.rays])
+        directions = planarshapes.numpy.array(
+            [ray[2][1:] for ray in self.rays])
+
+        t, hit, points, normals, other_results = \
+            planarshapes.shape_polymesh_intersect_batch(
+                self.mesh, starts, directions)
+
+        for i, ray in enumerate(self.rays):
+            expected = self.scalar_intersect(ray)
+            self.assertEqual(bool(hit[i]), expected is not False)
+            if expected is not False:
+                self.assertAlmostEqual(t[i], expected['t'])
+                self.assertEqual(other_results['hit_face'][i],
+                                 expected['hit_face'])
+
+
+class TestPolymeshStorageProdcedures(unittest.TestCase):
+
+    def setUp(self):
+        points = [cartesian.cartesian_create(x, y, 0)
+                  for x, y in ((-1, -1), (1, -1), (1, 1), (-1, 1))]
+        self.mesh = planarshapes.shape_polymesh_create(
+            {'points': points, 'polygon_point_indices': [[0, 1, 2, 3]],
+             'colour': colour.colour_create(1, 1, 1),
+             'face_diffuse_colours': [[colour.colour_create(1, 0, 0),
+                                       colour.colour_create(1, 0, 0),
+                                       colour.colour_create(0, 0, 1),
+                                       colour.colour_create(0, 0, 1)]]})
+
+    def test_func_shape_polymesh_create(self):
+        data = self.mesh[shape.SHAPE_DATA]
+        self.assertEqual(data['face_count'], 2)
+        self.assertEqual(list(data['faces']), [0, 1, 2, 0, 2, 3])
+        self.assertEqual(len(data['vertices']), 12)
+        self.assertEqual(len(data['face_data']),
+                         2 * planarshapes.POLYMESH_FACE_DATA_SIZE)
+
+    def test_func_shape_polymesh_diffuse_colour(self):
+        for y, expected_colour in ((-1, (1, 0, 0)), (0, (.5, 0, .5)),
+                                   (1, (0, 0, 1))):
+            ray = cartesian.ray_create(
+                cartesian.cartesian_create(.5, y * .999, -5),
+                cartesian.cartesian_create(0, 0, 1))
+            result = shape.shape_test_intersect(self.mesh, ray)
+            result['shape'] = self.mesh
+            result_colour = shape.shape_get_colour(
+                result, shape.SHAPE_DIFFUSECOLOUR)
+            for value, expected in zip(result_colour[1:4], expected_colour):
+                self.assertAlmostEqual(value, expected, 2)
+
+
+class TestPolymeshInstanceProdcedures(unittest.TestCase):
+
+    def setUp(self):
+        points = [cartesian.cartesian_create(x, y, 0)
+                  for x, y in ((-1, -1), (1, -1), (1, 1), (-1, 1))]
+        self.mesh = planarshapes.shape_polymesh_create(
+            {'points': points, 'polygon_point_indices': [[0, 1, 2], [0, 2, 3]],
+             'colour': colour.colour_create(1, 1, 1)}, True, 'bvh')
+
+        self.instances = []
+        for x in (-5, 5):
+            self.instances.append(planarshapes.shape_polymesh_instance_create(
+                self.mesh, {'translate': {'x': x, 'y': 0, 'z': 0}},
+                colour.colour_create(0, 0, 1) if x > 0 else None))
+
+    def test_func_shape_polymesh_instance_create(self):
+        for instance in self.instances:
+            self.assertIs(instance[shape.SHAPE_DATA],
+                          self.mesh[shape.SHAPE_DATA])
+
+        for x, expected_colour in ((-5, ('colour', 1, 1, 1)),
+                                   (5, ('colour', 0, 0, 1))):
+            ray = cartesian.ray_create(cartesian.cartesian_create(x, .5, -5),
+                                       cartesian.cartesian_create(0, 0, 1))
+            hits = [shape.shape_test_intersect(instance, ray)
+                    for instance in self.instances]
+            self.assertEqual([hit is not False for hit in hits],
+                             [x < 0, x > 0])
+
+            result = hits[0] if x < 0 else hits[1]
+            result['shape'] = self.instances[0 if x < 0 else 1]
+            self.assertAlmostEqual(result['t'], 5)
+            self.assertEqual(shape.shape_get_colour(
+                result, shape.SHAPE_DIFFUSECOLOUR), expected_colour)
+
+        box = shape.shape_bounding_box(self.instances[1])
+        self.assertEqual((box.min_x, box.max_x), (4, 6))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,45 @@
+import raytracer.precision as precision
+import raytracer.quadraticshapes as quadraticshapes
+import raytracer.cartesian as cartesian
+import unittest
+
+
+class TestPrecisionBackends(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = precision.precision_get_backend()
+
+    def tearDown(self):
+        precision.precision_set_backend(self.backend)
+
+    def test_func_precision_set_backend(self):
+        precision.precision_set_backend('float')
+        self.assertEqual(precision.precision_get_backend(), 'float')
+        self.assertIs(quadraticshapes.mpfr, float)
+        self.assertIs(cartesian.sqrt, precision.sqrt)
+
+    def test_func_precision_set_backend_unknown(self):
+        with self.assertRaises(ValueError):
+            precision.precision_set_backend('decimal')
+        self.assertEqual(precision.precision_get_backend(), self.backend)
+
+    def test_func_precision_backends_agree(self):
+        ray = cartesian.ray_create(cartesian.cartesian_create(0, 0, -5),
+                                   cartesian.cartesian_create(0, 0, 1))
+        sphere = quadraticshapes.shape_sphere_create(None, None)
+
+        distances = []
+        for backend in precision.PRECISION_BACKENDS:
+            try:
+                precision.precision_set_backend(backend)
+            except ImportError:
+                continue
+            result = quadraticshapes.shape_sphere_intersect(sphere, ray)
+            distances.append(float(result['t']))
+
+        for t in distances:
+            self.assertAlmostEqual(t, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -148,5 +148,106 @@ class TestConeProdcedures(unittest.TestCase):
                     ray_x_dir, ray_z_dir))
 
 
+class TestConeNormalProdcedures(unittest.TestCase):
+
+    def test_func_shape_cone_normal(self):
+        # the cone's radius at y = 2.5 is 2.5, the length of its raw normal
+        cone = quadraticshapes.shape_cone_create(
+            colour.colour_create(.5, .5, .5),
+            colour.colour_create(.5, .5, .5), 0, 5,
+            transformation.Transform(
+                {'translate': {'x': 0, 'y': 0, 'z': 5}}))
+        ray = cartesian.ray_create(cartesian.cartesian_create(-10, 2.5, 5),
+                                   cartesian.cartesian_create(1, 0, 0))
+
+        result = shape.shape_test_intersect(cone, ray)
+        self.assertAlmostEqual(result['t'], 7.5, 3)
+        result['shape'] = cone
+        result['ray'] = ray
+        normal = shape.shape_reverse_transform(result)['normal']
+        for value, expected in zip(normal[1:4], (-1, 0, 0)):
+            self.assertAlmostEqual(value, expected)
+
+
+class TestSphereProdcedures(unittest.TestCase):
+
+    def setUp(self):
+        self.sphere = quadraticshapes.shape_sphere_create(
+            colour.colour_create(.5, .5, .5), None,
+            transformation.Transform({'translate': {'x': 1, 'y': 0,
+                                                    'z': 0}}))
+
+    def test_func_shape_sphere_finalize(self):
+        ray = cartesian.ray_create(cartesian.cartesian_create(1, 0, -5),
+                                   cartesian.cartesian_create(0, 0, 1))
+        result = shape.shape_test_intersect(self.sphere, ray)
+        self.assertAlmostEqual(result['t'], 4)
+        # the point and normal are left until the hit is used
+        self.assertNotIn('raw_point', result)
+
+        result['shape'] = self.sphere
+        result['ray'] = ray
+        result = shape.shape_reverse_transform(result)
+        self.assertNotIn('raw_ray', result)
+        for value, expected in zip(result['raw_point'][1:], (0, 0, -1)):
+            self.assertAlmostEqual(value, expected)
+        for value, expected in zip(result['normal'][1:], (0, 0, -1)):
+            self.assertAlmostEqual(value, expected)
+
+
+@unittest.skipUnless(transformation.has_numpy, 'numpy is not installed')
+class TestSphereBatchProdcedures(unittest.TestCase):
+
+    def setUp(self):
+        self.sphere = quadraticshapes.shape_sphere_create(
+            colour.colour_create(.5, .5, .5),
+            colour.colour_create(.5, .5, .5),
+            transformation.Transform({
+                'scale': {'x': 2.0, 'y': 1.0, 'z': 1.5},
+                'rotate': {'vector': cartesian.cartesian_create(0, 1, 1),
+                           'angle': 30},
+                'translate': {'x': 1, 'y': -1, 'z': 4}}))
+
+        random.seed(5)
+        self.rays = []
+        for i in range(50):
+            self.rays.append(cartesian.ray_create(
+                cartesian.cartesian_create(random.uniform(-1, 1),
+                                           random.uniform(-1, 1), -5),
+                cartesian.cartesian_create(random.uniform(-.5, .5),
+                                           random.uniform(-.5, .5), 1)))
+
+    def test_func_shape_sphere_intersect_batch(self):
+        starts = quadraticshapes.numpy.array(
+            [ray[1][1:] for ray in self.rays])
+        directions = quadraticshapes.numpy.array(
+            [ray[2][1:] for ray in self.rays])
+
+        t, hit, points, normals, other_results = \
+            quadraticshapes.shape_sphere_intersect_batch(
+                self.sphere, starts, directions)
+
+        hits = 0
+        for i, ray in enumerate(self.rays):
+            result = shape.shape_test_intersect(self.sphere, ray)
+            self.assertEqual(bool(hit[i]), result is not False)
+            if result is False:
+                continue
+
+            hits += 1
+            result['shape'] = self.sphere
+            result['ray'] = ray
+            result = shape.shape_reverse_transform(result)
+            self.assertAlmostEqual(t[i], result['t'])
+            for axis in range(3):
+                self.assertAlmostEqual(points[i][axis],
+                                       result['raw_point'][axis + 1])
+                self.assertAlmostEqual(normals[i][axis],
+                                       result['normal'][axis + 1])
+
+        self.assertGreater(hits, 0)
+        self.assertLess(hits, len(self.rays))
+
+
 if __name__ == '__main__':
     unittest.main()
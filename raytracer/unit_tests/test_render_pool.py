@@ -0,0 +1,81 @@
+import raytracer.render_pool as render_pool
+import raytracer.view as view
+import raytracer.scene as scene
+import raytracer.output as output
+import raytracer.quadraticshapes as quadraticshapes
+import raytracer.light as light
+import raytracer.colour as colour
+import raytracer.cartesian as cartesian
+import unittest
+import unittest.mock
+
+
+class TestRenderPoolProcedures(unittest.TestCase):
+
+    def setUp(self):
+        self.scene = scene.Scene()
+        self.scene.add_shape(quadraticshapes.shape_sphere_create(
+            colour.colour_create(1, 0, 0),
+            colour.colour_create(0, 0, 0)), 'sphere')
+        self.scene.add_light(light.light_point_light_create(
+            cartesian.cartesian_create(0, 0, -10),
+            colour.colour_create(1, 1, 1)), 'light')
+
+        for name in ['view1', 'view2']:
+            view_obj = view.view_create(self.scene, -15,
+                                        {'left': 0, 'right': 12,
+                                         'top': 0, 'bottom': 10},
+                                        {'left': -2, 'right': 2,
+                                         'top': -2, 'bottom': 2})
+            view.view_set_output(view_obj, output.PIL_Output())
+            view.view_set_tile_size(view_obj, 5)
+            self.scene.add_view(view_obj, name)
+
+    def test_class_render_pool(self):
+        expected = {}
+        for name in ['view1', 'view2']:
+            view.view_set_multiprocessing(self.scene.get_view(name), False)
+            expected[name] = self.scene.render(name).tobytes()
+            view.view_set_multiprocessing(self.scene.get_view(name), True)
+
+        with render_pool.RenderPool(2) as pool:
+            self.scene.set_render_pool(pool)
+            # every render uses the attached pool, whose workers are
+            # started once and keep the compiled scene loaded
+            with unittest.mock.patch.object(render_pool, 'RenderPool',
+                                            side_effect=AssertionError(
+                                                'temporary pool started')):
+                workers = None
+                for name in ['view1', 'view2', 'view1']:
+                    self.assertEqual(self.scene.render(name).tobytes(),
+                                     expected[name])
+                    self.assertIsNotNone(pool.__pool__)
+                    if workers is not None:
+                        self.assertIs(pool.__pool__, workers)
+                    workers = pool.__pool__
+
+            compiled = self.scene.compile()
+            self.assertEqual(pool.__scene_key__,
+                             (id(compiled), compiled.get_version()))
+
+    @unittest.skipUnless(output.has_shared_memory, 'requires numpy')
+    def test_class_shared_memory_output(self):
+        view_obj = self.scene.get_view('view1')
+        view.view_set_multiprocessing(view_obj, False)
+        expected = self.scene.render('view1').tobytes()
+
+        shared_output = output.SharedMemoryOutput()
+        view.view_set_output(view_obj, shared_output)
+        self.assertEqual(self.scene.render('view1').tobytes(), expected)
+
+        view.view_set_multiprocessing(view_obj, True)
+        with render_pool.RenderPool(2) as pool:
+            self.scene.set_render_pool(pool)
+            self.assertEqual(self.scene.render('view1').tobytes(), expected)
+
+        self.assertEqual(shared_output.get_array().shape, (10, 12, 3))
+        shared_output.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
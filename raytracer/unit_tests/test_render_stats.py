@@ -0,0 +1,139 @@
+import raytracer.render_stats as render_stats
+import raytracer.render_pool as render_pool
+import raytracer.view as view
+import raytracer.scene as scene
+import raytracer.output as output
+import raytracer.quadraticshapes as quadraticshapes
+import raytracer.planarshapes as planarshapes
+import raytracer.light as light
+import raytracer.colour as colour
+import raytracer.cartesian as cartesian
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestRenderStatsProcedures(unittest.TestCase):
+
+    def setUp(self):
+        self.scene = scene.Scene(True, 1, 'bvh')
+        self.scene.add_shape(quadraticshapes.shape_sphere_create(
+            colour.colour_create(1, 0, 0),
+            colour.colour_create(.5, .5, .5)), 'sphere')
+        self.scene.add_shape(planarshapes.shape_triangle_create(
+            [cartesian.cartesian_create(-4, -4, 3),
+             cartesian.cartesian_create(4, -4, 3),
+             cartesian.cartesian_create(0, 4, 3)],
+            [colour.colour_create(0, 1, 0)] * 3), 'triangle')
+        self.scene.add_light(light.light_point_light_create(
+            cartesian.cartesian_create(0, 0, -10),
+            colour.colour_create(1, 1, 1)), 'light')
+
+        self.view = view.view_create(self.scene, -15,
+                                     {'left': 0, 'right': 12,
+                                      'top': 0, 'bottom': 10},
+                                     {'left': -2, 'right': 2,
+                                      'top': -2, 'bottom': 2})
+        view.view_set_output(self.view, output.PIL_Output())
+        view.view_set_tile_size(self.view, 5)
+        view.view_set_multiprocessing(self.view, False)
+        self.scene.add_view(self.view, 'view')
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_func_render_stats_render(self):
+        self.scene.render('view')
+        self.assertIsNone(self.scene.get_render_stats())
+
+        filename = os.path.join(self.directory, 'stats.json')
+        view.view_set_render_stats(self.view, True, filename)
+        self.scene.render('view')
+        stats = self.scene.get_render_stats()
+
+        self.assertEqual(stats['rays']['primary'], 12 * 10)
+        self.assertEqual(stats['tiles'], 6)
+        self.assertGreater(stats['rays']['shadow'], 0)
+        self.assertGreater(stats['rays']['reflection'], 0)
+        self.assertGreater(stats['nodes_visited'], 0)
+        for shape_type in ('sphere', 'triangle'):
+            self.assertGreater(stats['hits'][shape_type], 0)
+            self.assertGreaterEqual(
+                stats['intersection_tests'][shape_type],
+                stats['hits'][shape_type])
+
+        with open(filename) as stats_file:
+            self.assertEqual(json.load(stats_file), stats)
+
+        # statistics are collected per tile by workers, and added up
+        view.view_set_multiprocessing(self.view, True)
+        with render_pool.RenderPool(2) as pool:
+            self.scene.set_render_pool(pool)
+            self.scene.render('view')
+        self.scene.set_render_pool(None)
+        pool_stats = self.scene.get_render_stats()
+        for key in ('rays', 'intersection_tests', 'hits', 'nodes_visited',
+                    'tiles'):
+            self.assertEqual(pool_stats[key], stats[key])
+        self.assertEqual(sorted(tile_stats['tile'] for tile_stats in
+                                pool_stats['tile_stats']),
+                         sorted(tile_stats['tile'] for tile_stats in
+                                stats['tile_stats']))
+
+        view.view_set_render_stats(self.view, False)
+        self.scene.render('view')
+        self.assertIsNone(self.scene.get_render_stats())
+
+    def test_func_render_stats_tile_map(self):
+        tile_map_output = output.PIL_Output()
+        view.view_set_render_stats(self.view, True, None, tile_map_output,
+                                   'rays')
+        image = self.scene.render('view')
+        stats = self.scene.get_render_stats()
+
+        tile_map = tile_map_output.get_output()
+        self.assertEqual(tile_map.size, image.size)
+        # the tile with the most rays per pixel is drawn white
+        busiest = max(stats['tile_stats'],
+                      key=lambda tile_stats:
+                      render_stats.render_stats_tile_value(tile_stats,
+                                                           'rays'))
+        self.assertEqual(tile_map.getpixel(tuple(busiest['tile'][0:2])),
+                         (255, 255, 255))
+        self.assertEqual(sum(tile_stats['rays'] for tile_stats in
+                             stats['tile_stats']),
+                         sum(stats['rays'].values()))
+
+        if render_stats.has_numpy:
+            rays = render_stats.render_stats_tile_map(stats, 'rays')
+            self.assertEqual(rays.shape, (10, 12))
+            self.assertAlmostEqual(rays.sum(), sum(stats['rays'].values()))
+
+        self.assertRaises(ValueError, view.view_set_render_stats, self.view,
+                          True, None, tile_map_output, 'hits')
+
+    def test_func_render_stats_merge(self):
+        total = render_stats.render_stats_create()
+        render_stats.render_stats_start()
+        render_stats.render_stats_add_rays('primary', 4)
+        render_stats.render_stats_add_tests('sphere', 4, 1)
+        render_stats.render_stats_add_nodes(3)
+        stats = render_stats.render_stats_stop()
+        self.assertIsNone(render_stats.render_stats_stop())
+
+        # nothing is counted once collection has stopped
+        render_stats.render_stats_add_rays('primary')
+        render_stats.render_stats_merge(total, stats)
+        render_stats.render_stats_merge(total, stats)
+        render_stats.render_stats_merge(total, None)
+
+        self.assertEqual(total['rays']['primary'], 8)
+        self.assertEqual(total['intersection_tests'], {'sphere': 8})
+        self.assertEqual(total['hits'], {'sphere': 2})
+        self.assertEqual(total['nodes_visited'], 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,269 @@
+import raytracer.scene as scene
+import raytracer.shape as shape
+import raytracer.quadraticshapes as quadraticshapes
+import raytracer.transformation as transformation
+import raytracer.cartesian as cartesian
+import raytracer.colour as colour
+import raytracer.light as light
+import raytracer.render_stats as render_stats
+import unittest
+
+
+def scene_two_spheres():
+    """Returns a scene with unit spheres centred at z=2 and z=5, and a list
+    of the spheres."""
+    scene_obj = scene.Scene()
+    spheres = []
+    for z in (2, 5):
+        sphere = quadraticshapes.shape_sphere_create(
+            colour.colour_create(1, 1, 1), None,
+            transformation.Transform({'translate':
+                                      {'x': 0, 'y': 0, 'z': z}}))
+        scene_obj.add_shape(sphere)
+        spheres.append(sphere)
+
+    return scene_obj, spheres
+
+
+class TestSceneOcclusion(unittest.TestCase):
+
+    def setUp(self):
+        self.scene, self.spheres = scene_two_spheres()
+
+    def shadow_ray(self, length):
+        return cartesian.ray_create(cartesian.cartesian_create(0, 0, -2),
+                                    cartesian.cartesian_create(0, 0, length),
+                                    True)
+
+    def test_func_scene_test_occlusion_opaque(self):
+        self.assertEqual(self.scene.test_occlusion(self.shadow_ray(10)),
+                         ('colour', 0, 0, 0))
+
+    def test_func_scene_test_occlusion_segment(self):
+        # the nearest sphere starts at z=1, beyond the end of the segment
+        self.assertIsNone(self.scene.test_occlusion(self.shadow_ray(2.5)))
+
+    def test_func_scene_test_occlusion_segment_end(self):
+        # the nearest sphere starts at z=1, at the end of the segment, which
+        # is included, so the test stops there without trying the other
+        ray = self.shadow_ray(3)
+        render_stats.render_stats_start()
+        try:
+            shadow_factor = self.scene.test_occlusion(ray)
+        finally:
+            stats = render_stats.render_stats_stop()
+        self.assertEqual(shadow_factor, ('colour', 0, 0, 0))
+        self.assertEqual(stats['intersection_tests']['sphere'], 1)
+
+        for accelerator in scene.SCENE_ACCELERATORS:
+            scene_obj = scene.Scene(True, 1, accelerator)
+            for sphere in self.spheres:
+                scene_obj.add_shape(sphere)
+            self.assertEqual(scene_obj.compile().test_occlusion(ray),
+                             ('colour', 0, 0, 0))
+
+    def test_func_scene_test_occlusion_transparent(self):
+        for sphere in self.spheres:
+            shape.shape_set_transparency(sphere,
+                                         colour.colour_create(.5, .5, .5))
+
+        shadow_factor = self.scene.test_occlusion(self.shadow_ray(10))
+        for component in shadow_factor[1:4]:
+            self.assertAlmostEqual(component, .25)
+
+
+class TestSceneIntersect(unittest.TestCase):
+
+    def setUp(self):
+        self.scene, self.spheres = scene_two_spheres()
+
+    def primary_ray(self):
+        return cartesian.ray_create(cartesian.cartesian_create(0, 0, -5),
+                                    cartesian.cartesian_create(0, 0, 1))
+
+    def test_func_scene_test_intersect_opaque(self):
+        self.assertFalse(shape.shape_may_be_transparent(self.spheres[0]))
+
+        result = self.scene.test_intersect(self.primary_ray())
+        self.assertAlmostEqual(result['t'], 6)
+        self.assertIs(result['shape'], self.spheres[0])
+        self.assertNotIn('all_results', result)
+
+    def test_func_scene_test_intersect_transparent(self):
+        shape.shape_set_transparency(self.spheres[0],
+                                     colour.colour_create(.5, .5, .5))
+        self.assertTrue(shape.shape_may_be_transparent(self.spheres[0]))
+
+        result = self.scene.test_intersect(self.primary_ray())
+        self.assertAlmostEqual(result['t'], 6)
+        self.assertEqual(len(result['all_results']), 1)
+        for t in result['all_results']:
+            self.assertAlmostEqual(t, 9)
+
+
+class TestSceneCompile(unittest.TestCase):
+
+    def setUp(self):
+        self.scene, self.spheres = scene_two_spheres()
+
+    def test_func_scene_compile(self):
+        compiled = self.scene.compile()
+        self.assertIsInstance(compiled, scene.CompiledScene)
+        self.assertIs(self.scene.compile(), compiled)
+        self.assertEqual(len(compiled.get_shape_list()), 2)
+        for sh, sphere in zip(compiled.get_shape_list(), self.spheres):
+            self.assertIsNot(sh, sphere)
+            self.assertEqual(sh[:8], sphere[:8])
+        self.assertRaises(TypeError, compiled.add_shape, self.spheres[0])
+
+        ray = cartesian.ray_create(cartesian.cartesian_create(0, 0, -5),
+                                   cartesian.cartesian_create(0, 0, 1))
+        self.assertAlmostEqual(compiled.test_intersect(ray)['t'], 6)
+
+        self.scene.add_shape(quadraticshapes.shape_sphere_create(
+            colour.colour_create(1, 1, 1), None))
+        recompiled = self.scene.compile()
+        self.assertIsNot(recompiled, compiled)
+        self.assertEqual(len(recompiled.get_shape_list()), 3)
+        self.assertEqual(len(compiled.get_shape_list()), 2)
+
+    def test_func_scene_compile_snapshot(self):
+        ray = cartesian.ray_create(cartesian.cartesian_create(0, 0, -5),
+                                   cartesian.cartesian_create(0, 0, 1))
+        for accelerator in scene.SCENE_ACCELERATORS:
+            scene_obj = scene.Scene(True, 1, accelerator)
+            for sphere in self.spheres:
+                scene_obj.add_shape(list(sphere))
+            compiled = scene_obj.compile()
+
+            # moving a shape in the scene leaves the snapshot as it was
+            shape.shape_set_transform(scene_obj.get_shape_list()[0],
+                                      transformation.Transform(
+                {'translate': {'x': 0, 'y': 0, 'z': 10}}))
+            self.assertAlmostEqual(compiled.test_intersect(ray)['t'], 6)
+            self.assertAlmostEqual(scene_obj.compile().test_intersect(
+                ray)['t'], 9)
+
+
+class TestSceneUpdate(unittest.TestCase):
+
+    def setUp(self):
+        self.create_scene('octree')
+
+    def create_scene(self, accelerator):
+        self.scene = scene.Scene(True, 4, accelerator)
+        self.spheres = []
+        for x in range(-4, 5):
+            for y in range(-4, 5):
+                sphere = quadraticshapes.shape_sphere_create(
+                    colour.colour_create(1, 1, 1), None,
+                    transformation.Transform({
+                        'scale': {'x': .4, 'y': .4, 'z': .4},
+                        'translate': {'x': x, 'y': y, 'z': 0}}))
+                self.scene.add_shape(sphere)
+                self.spheres.append(sphere)
+
+    def nearest_shape(self, x, y):
+        ray = cartesian.ray_create(cartesian.cartesian_create(x, y, -10),
+                                   cartesian.cartesian_create(0, 0, 1))
+        compiled = self.scene.compile()
+        result = compiled.test_intersect(ray)
+        if result is False:
+            return None
+        # the compiled scene holds copies of the shapes, in the same order
+        return self.scene.get_shape_list()[
+            compiled.get_shape_list().index(result['shape'])]
+
+    def test_func_scene_update_accelerator(self):
+        compiled = self.scene.compile()
+        self.assertFalse(self.scene.update_accelerator())
+        self.scene.add_light(light.light_point_light_create(
+            cartesian.cartesian_create(0, 0, -10),
+            colour.colour_create(1, 1, 1)))
+        self.assertFalse(self.scene.update_accelerator())
+        self.assertIsNot(self.scene.compile(), compiled)
+
+        sphere = self.spheres[0]
+        self.assertIs(self.nearest_shape(-4, -4), sphere)
+        shape.shape_set_transform(sphere, transformation.Transform({
+            'scale': {'x': .4, 'y': .4, 'z': .4},
+            'translate': {'x': 3.5, 'y': 3.5, 'z': 0}}))
+
+        octree = self.scene.__octtree_top__
+        self.assertTrue(self.scene.update_accelerator())
+        self.assertIs(self.scene.__octtree_top__, octree)
+        self.assertFalse(self.scene.update_accelerator())
+
+        self.assertIsNone(self.nearest_shape(-4, -4))
+        self.assertIs(self.nearest_shape(3.5, 3.5), sphere)
+
+    def test_func_scene_update_accelerator_outside(self):
+        self.scene.compile()
+        octree = self.scene.__octtree_top__
+        shape.shape_set_transform(self.spheres[0], transformation.Transform(
+            {'translate': {'x': 20, 'y': 0, 'z': 0}}))
+
+        self.assertIs(self.nearest_shape(20, 0), self.spheres[0])
+        self.assertIsNot(self.scene.__octtree_top__, octree)
+
+    def test_func_scene_update_accelerator_refit(self):
+        self.create_scene('bvh')
+        self.scene.compile()
+        bvh = self.scene.__bvh__
+
+        for sphere in self.spheres:
+            box = shape.shape_bounding_box(sphere)
+            shape.shape_set_transform(sphere, transformation.Transform({
+                'scale': {'x': .4, 'y': .4, 'z': .4},
+                'translate': {'x': box.mid_x + .3, 'y': box.mid_y,
+                              'z': 0}}))
+
+        self.assertIs(self.nearest_shape(-3.7, -4), self.spheres[0])
+        self.assertIs(self.scene.__bvh__, bvh)
+
+
+class TestSceneTraversal(unittest.TestCase):
+
+    def setUp(self):
+        self.spheres = []
+        for z in range(0, 40, 2):
+            self.spheres.append(quadraticshapes.shape_sphere_create(
+                colour.colour_create(1, 1, 1), None,
+                transformation.Transform({'translate':
+                                          {'x': 0, 'y': 0, 'z': z}})))
+
+    def count_tests(self, query, ray):
+        render_stats.render_stats_start()
+        try:
+            result = query(ray)
+        finally:
+            stats = render_stats.render_stats_stop()
+        return result, stats['intersection_tests'].get('sphere', 0)
+
+    def test_func_scene_nearest_hit_early_exit(self):
+        # a row of spheres along the ray, the first of which hides the rest
+        ray = cartesian.ray_create(cartesian.cartesian_create(0, 0, -5),
+                                   cartesian.cartesian_create(0, 0, 1))
+        shadow_ray = cartesian.ray_create(
+            cartesian.cartesian_create(0, 0, -5),
+            cartesian.cartesian_create(0, 0, 50), True)
+
+        for accelerator in scene.SCENE_ACCELERATORS:
+            scene_obj = scene.Scene(True, 4, accelerator)
+            for sphere in self.spheres:
+                scene_obj.add_shape(sphere)
+            compiled = scene_obj.compile()
+
+            result, tests = self.count_tests(compiled.test_intersect, ray)
+            self.assertIs(result['shape'], compiled.get_shape_list()[0])
+            self.assertAlmostEqual(result['t'], 4)
+            self.assertLess(tests, len(self.spheres) // 2)
+
+            result, tests = self.count_tests(compiled.test_occlusion,
+                                             shadow_ray)
+            self.assertEqual(result, ('colour', 0, 0, 0))
+            self.assertLess(tests, len(self.spheres) // 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import raytracer.transformation as transformation
+import raytracer.matrix as matrix
+import raytracer.cartesian as cartesian
+import unittest
+
+
+class TestTransformationProdcedures(unittest.TestCase):
+
+    def setUp(self):
+        self.transform = transformation.Transform({
+            'scale': {'x': 2.0, 'y': 3.0, 'z': .5},
+            'rotate': {'vector': cartesian.cartesian_create(1, 1, 0),
+                       'angle': 30},
+            'translate': {'x': 1, 'y': -2, 'z': 3}})
+        self.point = cartesian.cartesian_create(.3, -1.2, 4)
+        self.vector = cartesian.cartesian_create(-.5, .25, 1)
+
+    def assertCartesianAlmostEqual(self, first, second):
+        self.assertEqual(first[0], 'cartesian')
+        for a, b in zip(first[1:4], second[1:4]):
+            self.assertAlmostEqual(a, b)
+
+    def test_func_transform(self):
+        ray = self.transform.transform(
+            cartesian.ray_create(self.point, self.vector, True))
+        self.assertEqual(ray[cartesian.RAY_ISSHADOW], True)
+
+        forward = self.transform.matrix()
+        self.assertCartesianAlmostEqual(
+            ray[cartesian.RAY_START],
+            forward * cartesian.cartesian_sub(
+                self.point, self.transform.options()['translate']))
+        self.assertCartesianAlmostEqual(ray[cartesian.RAY_VECTOR],
+                                        forward * self.vector)
+
+        # the inverse transformation takes the ray back to world space
+        self.assertCartesianAlmostEqual(
+            self.transform.inverse_transform(ray[cartesian.RAY_START], True),
+            self.point)
+        self.assertCartesianAlmostEqual(
+            self.transform.inverse_transform(ray[cartesian.RAY_VECTOR]),
+            self.vector)
+
+    def test_func_transform_no_transform(self):
+        transform = transformation.Transform({})
+        ray = cartesian.ray_create(self.point, self.vector)
+        self.assertEqual(transform.transform(ray), ray)
+        self.assertEqual(transform.inverse_transform(self.point, True),
+                         self.point)
+
+    @unittest.skipUnless(transformation.has_numpy, 'numpy is not installed')
+    def test_func_transform_batch(self):
+        numpy = transformation.numpy
+        points = numpy.array([self.point[1:4], self.vector[1:4]])
+
+        starts, directions = self.transform.transform_batch(points, points)
+        for i, value in enumerate((self.point, self.vector)):
+            ray = self.transform.transform(cartesian.ray_create(value, value))
+            self.assertCartesianAlmostEqual(
+                ('cartesian',) + tuple(starts[i]), ray[cartesian.RAY_START])
+            self.assertCartesianAlmostEqual(
+                ('cartesian',) + tuple(directions[i]),
+                ray[cartesian.RAY_VECTOR])
+
+            for translate in (False, True):
+                self.assertCartesianAlmostEqual(
+                    ('cartesian',) + tuple(
+                        self.transform.inverse_transform_batch(
+                            points, translate)[i]),
+                    self.transform.inverse_transform(value, translate))
+
+    def test_func_transform_normal(self):
+        # a sphere stretched to an ellipsoid, x * x / 4 + y * y = 1
+        transform = transformation.Transform(
+            {'scale': {'x': 2.0, 'y': 1.0, 'z': 1.0},
+             'translate': {'x': 5, 'y': 0, 'z': 0}})
+        root_half = .5 ** .5
+        normal = transform.transform_normal(
+            cartesian.cartesian_create(root_half, root_half, 0))
+        # the gradient at the world point (sqrt(2), sqrt(.5), 0)
+        expected = cartesian.cartesian_normalise(
+            cartesian.cartesian_create(1, 2, 0))
+        self.assertCartesianAlmostEqual(normal, expected)
+
+        # rotations and translations keep normals unchanged in length
+        for options in ({'translate': {'x': 1, 'y': 2, 'z': 3}},
+                        {'rotate': {'vector': cartesian.cartesian_create(
+                            0, 0, 1), 'angle': 90}}):
+            normal = transformation.Transform(options).transform_normal(
+                cartesian.cartesian_create(1, 0, 0))
+            self.assertAlmostEqual(cartesian.cartesian_len(normal), 1)
+
+        if transformation.has_numpy:
+            normals = transform.transform_normals_batch(
+                transformation.numpy.array([[root_half, root_half, 0]]))
+            self.assertCartesianAlmostEqual(
+                ('cartesian',) + tuple(normals[0]), expected)
+
+    def test_func_matrix_mul(self):
+        product = matrix.ScaleMatrix(2, 4, 8) * matrix.RotationZMatrix(90)
+        identity = product * product.inversed()
+        for i in range(0, 4):
+            for j in range(0, 4):
+                self.assertAlmostEqual(identity.matrix[i][j],
+                                       1 if i == j else 0)
+                self.assertAlmostEqual(identity.inverse[i][j],
+                                       1 if i == j else 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import raytracer.view as view
+import raytracer.scene as scene
+import raytracer.output as output
+import os
+import subprocess
+import sys
+import unittest
+
+
+class TestViewTileProcedures(unittest.TestCase):
+
+    def setUp(self):
+        self.scene = scene.Scene()
+        self.view = view.view_create(self.scene, -15,
+                                     {'left': 0, 'right': 70,
+                                      'top': 0, 'bottom': 45},
+                                     {'left': -5, 'right': 5,
+                                      'top': -5, 'bottom': 5})
+
+    def test_func_view_create_tiles(self):
+        view.view_set_tile_size(self.view, 32, 16)
+        tiles = view.view_create_tiles(self.view)
+
+        self.assertEqual(len(tiles), 9)
+        self.assertEqual(tiles[0], ('tile', 0, 0, 32, 16))
+        self.assertEqual(tiles[-1], ('tile', 64, 32, 70, 45))
+
+        covered = 0
+        for tile in tiles:
+            covered += ((tile[view.TILE_RIGHT] - tile[view.TILE_LEFT]) *
+                        (tile[view.TILE_BOTTOM] - tile[view.TILE_TOP]))
+        self.assertEqual(covered, 70 * 45)
+
+    def test_func_view_set_tile_size(self):
+        view.view_set_tile_size(self.view, 8)
+        self.assertEqual(self.view[view.VIEW_MULTIPROCESS_OPTIONS]
+                         ['TileHeight'], 8)
+        self.assertRaises(ValueError, view.view_set_tile_size, self.view, 0)
+
+    def test_func_view_render_tile(self):
+        view.view_set_multiprocessing(self.view, False)
+        view.view_set_output(self.view, output.PIL_Output())
+        view.view_render(self.view)
+        buffer = view.view_render_tile(self.view, ('tile', 3, 4, 7, 6))
+        self.assertEqual(len(buffer), 4 * 2 * 3)
+
+
+class TestViewImportProcedures(unittest.TestCase):
+
+    def test_func_view_scene_imported_first(self):
+        # run in a new interpreter, so raytracer.scene is imported before
+        # raytracer.view, as the examples do
+        source = '\n'.join([
+            'from raytracer.scene import *',
+            'from raytracer.view import *',
+            'from raytracer.output import *',
+            'scene = Scene()',
+            "view = view_create(scene, -15, {'left': 0, 'right': 4, "
+            "'top': 0, 'bottom': 4}, {'left': -1, 'right': 1, 'top': -1, "
+            "'bottom': 1})",
+            'version = scene.get_version()',
+            'view_set_antialias(view, False)',
+            'assert scene.get_version() != version',
+            'view_set_multiprocessing(view, False)',
+            'view_set_output(view, PIL_Output())',
+            "scene.add_view(view, 'view')",
+            "assert scene.render('view').size == (4, 4)"])
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        process = subprocess.run([sys.executable, '-c', source], cwd=root,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+        self.assertEqual(process.returncode, 0,
+                         process.stderr.decode('utf-8', 'replace'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,4 @@
-try:
-    from gmpy2 import *
-    from math import degrees
-except ImportError:
-    from math import *
-    from raytracer.mpfr_dummy import *
+from raytracer.precision import *
 
 from raytracer.cartesian import *
 from raytracer.colour import *
@@ -11,10 +6,14 @@ from raytracer.matrix import *
 from raytracer.light import *
 from raytracer.output import *
 from raytracer.shape import *
+import raytracer.scene
 from raytracer.scene import *
 from raytracer.lighting_model import *
+import raytracer.render_pool
 import multiprocessing as mp
 import random
+import time
+from array import array
 
 """Functions for dealing with views. A view is simply a perspective on a
 scene. Crucially, view_render and view_render_pixel are core raytracer
@@ -69,6 +68,34 @@ A view is stored as a list with the following elements:
         'a_view_step_x': The horizontal step distance to use for sub sampling
         'a_view_step_y': The vertical step distance to use for sub sampling
 
+    * The multiprocessing pool used while rendering, if any
+
+    * A dictionary of multiprocessing options:
+        'DoMultiProcessing': Boolean value dictating the use of worker
+            processes
+        'MaxProcesses': The maximum number of worker processes, or 0 for one
+            per CPU
+        'TileWidth': The width in pixels of each rendered tile
+        'TileHeight': The height in pixels of each rendered tile
+
+    * The scene the view belongs to
+
+    * A dictionary of render statistics options, or None if render
+        statistics are not collected. See render_stats.py:
+        'filename': the name of a JSON file to write the statistics of each
+        render to, or None
+        'tile_map_output': an Output to draw a false-colour tile map of
+        each render to, or None
+        'tile_map_value': the per-tile statistic shown by the tile map,
+        'time' or 'rays'
+
+A tile is a rectangular block of pixels on the physical output, rendered as
+one unit of work. A tile is stored as a tuple with the string 'tile' as an
+identifier, followed by the left, top, right and bottom edges of the block
+on the physical output (right and bottom being exclusive).
+
+A rendered tile is returned as a tile buffer: an array of 32-bit floats
+holding the red, green and blue values of each pixel in the tile, row by row.
 """
 
 VIEW_LIGHTINGMODEL = 1
@@ -83,6 +110,14 @@ VIEW_ANTIALIAS_DATA = 9
 VIEW_MULTIPROCESS_POOL = 10
 VIEW_MULTIPROCESS_OPTIONS = 11
 VIEW_SCENE = 12
+VIEW_RENDER_STATS = 13
+
+TILE_LEFT = 1
+TILE_TOP = 2
+TILE_RIGHT = 3
+TILE_BOTTOM = 4
+
+VIEW_DEFAULT_TILE_SIZE = 32
 
 def view_create(
         scene, eye_z,  physical_rectangle,
@@ -134,13 +169,29 @@ def view_create(
                              mpfr(2.0), eye_z),
             {},
             None,
-            {'DoMultiProcessing': True, 'MaxProcesses': 0},
-            scene]
+            {'DoMultiProcessing': True, 'MaxProcesses': 0,
+             'TileWidth': VIEW_DEFAULT_TILE_SIZE,
+             'TileHeight': VIEW_DEFAULT_TILE_SIZE},
+            scene,
+            None]
 
     view_set_antialias(view)
     return view
 
 
+def view_changed(view):
+    """Notifies the view's scene that the view has changed, so that render
+    pools holding a copy of the scene reload it.
+
+     :param view: The view that has changed"""
+
+    # raytracer.scene imports this module, so Scene is looked up when it is
+    # needed rather than star imported, which misses it when raytracer.scene
+    # is imported first
+    if isinstance(view[VIEW_SCENE], raytracer.scene.Scene):
+        view[VIEW_SCENE].set_changed()
+
+
 def view_set_transform(view, transform):
     """Set or change the transformation for a view.
 
@@ -152,6 +203,8 @@ def view_set_transform(view, transform):
     elif type(transform) is dict:
         view[VIEW_TRANSFORM] = Transform(transform)
 
+    view_changed(view)
+
 
 def view_set_output(view, output):
     """Set or change the transformation for a view.
@@ -163,9 +216,70 @@ def view_set_output(view, output):
 
 def view_set_multiprocessing(
         view, do_multiprocessing = True, max_processes = 0):
-        view[VIEW_MULTIPROCESS_OPTIONS] = \
-            {'DoMultiProcessing':  do_multiprocessing,
-            'MaxProcesses': max_processes}
+    """Sets the multiprocessing options for a view.
+
+     :param view: The view to change
+     :param do_multiprocessing: Boolean value dictating the use of worker
+                                processes while rendering
+     :param max_processes: The maximum number of worker processes, or 0 for
+                           one per CPU
+     """
+    view[VIEW_MULTIPROCESS_OPTIONS]['DoMultiProcessing'] = do_multiprocessing
+    view[VIEW_MULTIPROCESS_OPTIONS]['MaxProcesses'] = max_processes
+
+
+def view_set_render_stats(view, collect_stats=True, filename=None,
+                          tile_map_output=None, tile_map_value='time'):
+    """Switches the collection of render statistics on or off for a view.
+    When on, view_render returns the statistics of the render, and
+    Scene.render keeps them, see Scene.get_render_stats.
+
+    A tile map output shows where render time is spent. After each render,
+    every tile is drawn to it in a false colour, from black for the lowest
+    value per pixel to white for the highest, giving an image aligned with
+    the rendered one. The values themselves are kept in the render
+    statistics, and can be made into an array with render_stats_tile_map.
+
+     :param view: The view to change
+     :param collect_stats: Boolean value dictating the collection of render
+                           statistics
+     :param filename: The name of a JSON file to write the statistics of
+                      each render to (optional)
+     :param tile_map_output: An Output to draw a tile map of each render to
+                             (optional)
+     :param tile_map_value: The per-tile statistic the tile map shows,
+                            'time' or 'rays'
+     """
+    if tile_map_value not in RENDER_STATS_TILE_VALUES:
+        raise ValueError("unknown tile statistic '%s', expected one of %s"
+                         % (tile_map_value,
+                            ', '.join(RENDER_STATS_TILE_VALUES)))
+
+    if collect_stats:
+        view[VIEW_RENDER_STATS] = {'filename': filename,
+                                   'tile_map_output': tile_map_output,
+                                   'tile_map_value': tile_map_value}
+    else:
+        view[VIEW_RENDER_STATS] = None
+
+
+def view_set_tile_size(view, tile_width, tile_height=None):
+    """Sets the size of the tiles the physical output is split into while
+    rendering. Each tile is rendered as one unit of work.
+
+     :param view: The view to change
+     :param tile_width: The width of each tile, in pixels
+     :param tile_height: The height of each tile, in pixels. If None, the
+                         tiles are square.
+     """
+    if tile_height is None:
+        tile_height = tile_width
+
+    if tile_width < 1 or tile_height < 1:
+        raise ValueError('tile size must be at least one pixel')
+
+    view[VIEW_MULTIPROCESS_OPTIONS]['TileWidth'] = int(tile_width)
+    view[VIEW_MULTIPROCESS_OPTIONS]['TileHeight'] = int(tile_height)
 
     
 def view_set_antialias(
@@ -233,8 +347,10 @@ def view_set_antialias(
         view[VIEW_ANTIALIAS_DATA]['antialias_function'] = \
             view_render_pixel_no_antialias
 
+    view_changed(view)
+
 
-def view_set_lighting_model(view, lightingmodel, options={}):
+def view_set_lighting_model(view, lightingmodel, options=None):
     """Sets the lighting model for a view
 
      :param view: The view to change
@@ -245,6 +361,8 @@ def view_set_lighting_model(view, lightingmodel, options={}):
     
     lightingmodel_set_options (lightingmodel, options)
 
+    view_changed(view)
+
 def view_transform_ray (view, ray):
     if view[VIEW_TRANSFORM] is not None:
 
@@ -289,9 +407,10 @@ def view_render_pixel_no_antialias(view, view_scan_x, view_scan_y):
                      cartesian_create(
         view_scan_x - view[VIEW_EYE][1],
         view_scan_y - view[VIEW_EYE][2],
-        mpfr(0) - view[VIEW_EYE][3]))
+        0 - view[VIEW_EYE][3]))
 
     ray = view_transform_ray (view, ray)
+    render_stats_add_rays('primary')
     
     result = view[VIEW_SCENE].test_intersect(ray)
 
@@ -455,7 +574,7 @@ def view_render_pixel_antialias_stochastic(view, view_scan_x, view_scan_y):
     :return: a colour tuple
     """
     clr = colour_create(0, 0, 0)
-    zero = mpfr(0)
+    zero = 0
     for i in range(int(view[VIEW_ANTIALIAS_DATA]['count'])):
         a_view_x = random.uniform(
             view_scan_x, view_scan_x +
@@ -470,6 +589,7 @@ def view_render_pixel_antialias_stochastic(view, view_scan_x, view_scan_y):
             zero - view[VIEW_EYE][3]))
             
         ray = view_transform_ray (view, ray)
+        render_stats_add_rays('primary')
         
         result = view[VIEW_SCENE].test_intersect(ray)
         if(result is not False):
@@ -492,7 +612,7 @@ def view_render_pixel_antialias_grid_pattern(view, view_scan_x, view_scan_y):
 
     :return: a colour tuple
     """
-    zero = mpfr(0)
+    zero = 0
     clr = colour_create(0, 0, 0)
     a_view_x = view_scan_x - view[VIEW_ANTIALIAS_DATA]['x_step']
 
@@ -515,6 +635,7 @@ def view_render_pixel_antialias_grid_pattern(view, view_scan_x, view_scan_y):
                 a_view_y - view[VIEW_EYE][2],
                 zero - view[VIEW_EYE][3]))
             ray = view_transform_ray (view, ray)
+            render_stats_add_rays('primary')
             result = view[VIEW_SCENE].test_intersect(ray)
             if(result is not False):
                 result['ray'] = ray
@@ -528,17 +649,148 @@ def view_render_pixel_antialias_grid_pattern(view, view_scan_x, view_scan_y):
     return clr
 
 
-def view_render(view):
-    """Renders a view of a scene.
+def view_create_tiles(view):
+    """Splits the physical output of a view into tiles.
+
+     :param view: The view to split
+     :return: a list of tile tuples, ordered row by row
+     """
+    rectangle = view[VIEW_PHYSICALRECTANGLE]
+    tile_width = view[VIEW_MULTIPROCESS_OPTIONS].get(
+        'TileWidth', VIEW_DEFAULT_TILE_SIZE)
+    tile_height = view[VIEW_MULTIPROCESS_OPTIONS].get(
+        'TileHeight', VIEW_DEFAULT_TILE_SIZE)
+
+    tiles = []
+    for top in range(rectangle['top'], rectangle['bottom'], tile_height):
+        bottom = min(top + tile_height, rectangle['bottom'])
+        for left in range(rectangle['left'], rectangle['right'], tile_width):
+            right = min(left + tile_width, rectangle['right'])
+            tiles.append(('tile', left, top, right, bottom))
+
+    return tiles
+
+
+def view_render_tile(view, tile):
+    """Renders one tile of a view.
+
+     :param view: The view to render
+     :param tile: The tile to render
+     :return: a tile buffer with the colours of the tile's pixels
+     """
+    buffer = array('f')
+    x_step = view[VIEW_ANTIALIAS]['x_step']
+    y_step = view[VIEW_ANTIALIAS]['y_step']
+    view_left = view[VIEW_VIEWRECTANGLE]['left']
+    view_top = view[VIEW_VIEWRECTANGLE]['top']
+    physical_left = view[VIEW_PHYSICALRECTANGLE]['left']
+    physical_top = view[VIEW_PHYSICALRECTANGLE]['top']
+
+    if has_numpy and (view[VIEW_ANTIALIAS_DATA]['antialias_function'] is
+                      view_render_pixel_no_antialias):
+        return view_render_tile_batch(view, tile)
+
+    for physical_y in range(tile[TILE_TOP], tile[TILE_BOTTOM]):
+        view_scan_y = view_top + ((physical_y - physical_top) * y_step)
+
+        for physical_x in range(tile[TILE_LEFT], tile[TILE_RIGHT]):
+            view_scan_x = view_left + ((physical_x - physical_left) * x_step)
+
+            clr = view_render_pixel(view, view_scan_x, view_scan_y)
+            buffer.append(clr[1])
+            buffer.append(clr[2])
+            buffer.append(clr[3])
+
+    return buffer
+
+
+def view_render_tile_with_stats(view, tile, collect_stats):
+    """Renders one tile of a view, collecting render statistics for it if
+    asked to.
+
+     :param view: The view to render
+     :param tile: The tile to render
+     :param collect_stats: Boolean value dictating the collection of render
+                           statistics
+     :return: a tuple of the tile buffer, and the render statistics of the
+              tile or None
+     """
+    if not collect_stats:
+        return view_render_tile(view, tile), None
+
+    stats = render_stats_start()
+    start_time = time.perf_counter()
+    try:
+        buffer = view_render_tile(view, tile)
+    finally:
+        render_stats_stop()
+
+    render_stats_add_tile(stats, tile, time.perf_counter() - start_time)
+    return buffer, stats
+
+
+def view_render_tile_batch(view, tile):
+    """Renders one tile of a view without antialiasing, testing all the
+    primary rays of the tile for intersection with the scene at once.
 
      :param view: The view to render
+     :param tile: The tile to render
+     :return: a tile buffer with the colours of the tile's pixels
+     """
+    buffer = array('f')
+    x_step = view[VIEW_ANTIALIAS]['x_step']
+    y_step = view[VIEW_ANTIALIAS]['y_step']
+    view_left = view[VIEW_VIEWRECTANGLE]['left']
+    view_top = view[VIEW_VIEWRECTANGLE]['top']
+    physical_left = view[VIEW_PHYSICALRECTANGLE]['left']
+    physical_top = view[VIEW_PHYSICALRECTANGLE]['top']
+    eye = view[VIEW_EYE]
+
+    rays = []
+    for physical_y in range(tile[TILE_TOP], tile[TILE_BOTTOM]):
+        view_scan_y = view_top + ((physical_y - physical_top) * y_step)
+
+        for physical_x in range(tile[TILE_LEFT], tile[TILE_RIGHT]):
+            view_scan_x = view_left + ((physical_x - physical_left) * x_step)
+
+            rays.append(view_transform_ray(view, ray_create(
+                eye, cartesian_create(view_scan_x - eye[1],
+                                      view_scan_y - eye[2],
+                                      0 - eye[3]))))
+
+    render_stats_add_rays('primary', len(rays))
+    for result in view[VIEW_SCENE].test_intersect_batch(rays):
+        if result is not False:
+            clr = view[VIEW_LIGHTINGMODEL][LIGHTINGMODEL_CALCFUNC](
+                view[VIEW_LIGHTINGMODEL], view[VIEW_SCENE], result)
+        else:
+            clr = ('colour', 0, 0, 0)
+
+        buffer.append(clr[1])
+        buffer.append(clr[2])
+        buffer.append(clr[3])
+
+    return buffer
+
+
+def view_render_setup(view):
+    """Calculates the scan steps needed to render a view. The physical
+    rectangle is moved so its top-left corner is at 0, 0, as done by
+    Output.set_rectangle.
+
+     :param view: The view to set up
     """
+    physical_rectangle = view[VIEW_PHYSICALRECTANGLE]
+    if physical_rectangle['left'] != 0:
+        physical_rectangle['right'] = \
+            physical_rectangle['right'] - physical_rectangle['left']
+        physical_rectangle['left'] = 0
+
+    if physical_rectangle['top'] != 0:
+        physical_rectangle['bottom'] = \
+            physical_rectangle['bottom'] - physical_rectangle['top']
+        physical_rectangle['top'] = 0
 
-    view[VIEW_OUTPUT].set_rectangle(view[VIEW_PHYSICALRECTANGLE])
-    if not isinstance(view[VIEW_SCENE], Scene):
-        return None
-    view_scan_y = view[VIEW_VIEWRECTANGLE]['top']
-    view_scan_x = view[VIEW_VIEWRECTANGLE]['left']
     x_step = (view[VIEW_VIEWRECTANGLE]['right'] -
               view[VIEW_VIEWRECTANGLE]['left']) / \
         (view[VIEW_PHYSICALRECTANGLE]['right'] -
@@ -552,82 +804,189 @@ def view_render(view):
 
     view[VIEW_ANTIALIAS]['y_step'] = y_step
 
+
+def view_render(view):
+    """Renders a view of a scene.
+
+     :param view: The view to render
+     :return: the render statistics of the render if they are collected for
+              the view, otherwise None
+    """
+
+    view[VIEW_OUTPUT].set_rectangle(view[VIEW_PHYSICALRECTANGLE])
+    if not isinstance(view[VIEW_SCENE], raytracer.scene.Scene):
+        return None
+
+    view_render_setup(view)
+    tiles = view_create_tiles(view)
+
+    stats = None
+    if view[VIEW_RENDER_STATS] is not None:
+        stats = render_stats_create()
+
     if ('DoMultiProcessing' in view[VIEW_MULTIPROCESS_OPTIONS] and
         view[VIEW_MULTIPROCESS_OPTIONS]['DoMultiProcessing']):
-        queue_func = view_process_queue_multiprocess
-        
-        if 'MaxProcesses' in view[VIEW_MULTIPROCESS_OPTIONS]:
-            max_processes = view[VIEW_MULTIPROCESS_OPTIONS]['MaxProcesses']
-        else:
-            max_processes = 0
-        
-        if max_processes <= 0:
-            view[VIEW_MULTIPROCESS_POOL]= mp.Pool(mp.cpu_count())
-        else:
-            view[VIEW_MULTIPROCESS_POOL]= mp.Pool(max_processes)
-    
+        view_process_tiles_multiprocess(view, tiles, stats)
     else:
-        queue_func = view_process_queue
-    
-    queue = []
-    
-    for physical_x in range(view[VIEW_PHYSICALRECTANGLE]['left'],
-                            view[VIEW_PHYSICALRECTANGLE]['right']):
+        view_process_tiles(view, tiles, stats)
+
+    if stats is not None:
+        if view[VIEW_RENDER_STATS]['tile_map_output'] is not None:
+            view_render_tile_map(view, stats)
+        if view[VIEW_RENDER_STATS]['filename'] is not None:
+            render_stats_save(stats, view[VIEW_RENDER_STATS]['filename'])
+
+    return stats
 
-        view_scan_y = mpfr(view[VIEW_VIEWRECTANGLE]['top'])
-        for physical_y in range(view[VIEW_PHYSICALRECTANGLE]['top'],
-                                view[VIEW_PHYSICALRECTANGLE]['bottom']):
-            
-            if type(queue) == list:
-                # print ((view_scan_x, view_scan_y))
-                queue.append([view, view_scan_x, view_scan_y,
-                    physical_x, physical_y, False])
-                
-            else:
-                clr = view_render_pixel(view, view_scan_x, view_scan_y) 
-                view[VIEW_OUTPUT].set_pixel(physical_x, physical_y, clr)
-                
-            view_scan_y = view_scan_y + y_step
-
-        view_scan_x = view_scan_x + x_step
-
-    queue_func(view, queue)
-        
-def view_process_queue(view, queue):
-    while len(queue)>0:
-        item = queue.pop(0)
-        #if (item[3] == 121 and  item[4] == 40):
-        #    import pdb; pdb.set_trace();
-        clr = view_render_pixel(item[0], item[1], item[2])
-        #clr = view_pp_render_pixel (item)
-        view[VIEW_OUTPUT].set_pixel(item[3], item[4], clr)
 
-def view_process_queue_multiprocess(view, queue):
+def view_render_tile_map(view, stats):
+    """Draws a false-colour tile map of a render to the view's tile map
+    output, see view_set_render_stats.
 
-    #import pdb; pdb.set_trace();
+     :param view: The view rendered
+     :param stats: The render statistics of the render
+    """
+    output = view[VIEW_RENDER_STATS]['tile_map_output']
+    value = view[VIEW_RENDER_STATS]['tile_map_value']
+    output.set_rectangle(dict(view[VIEW_PHYSICALRECTANGLE]))
+
+    values = [render_stats_tile_value(tile_stats, value)
+              for tile_stats in stats['tile_stats']]
+    if len(values) == 0:
+        return
+    minimum = min(values)
+    value_range = max(values) - minimum
+
+    for tile_stats, tile_value in zip(stats['tile_stats'], values):
+        tile = ('tile',) + tuple(tile_stats['tile'])
+        clr = render_stats_heat_colour(
+            (tile_value - minimum) / value_range if value_range > 0 else 0)
+        buffer = array('f', clr[1:4]) * (
+            (tile[TILE_RIGHT] - tile[TILE_LEFT]) *
+            (tile[TILE_BOTTOM] - tile[TILE_TOP]))
+        output.set_tile(tile, buffer)
+
+
+def view_process_tiles(view, tiles, stats=None):
+    """Renders a list of tiles in the current process, writing each to the
+    view's output.
+
+     :param view: The view to render
+     :param tiles: a list of tiles
+     :param stats: render statistics to add the statistics of the tiles to,
+                   or None if they are not collected
+     """
+    for tile in tiles:
+        buffer, tile_stats = view_render_tile_with_stats(
+            view, tile, stats is not None)
+        view[VIEW_OUTPUT].set_tile(tile, buffer)
+        render_stats_merge(stats, tile_stats)
+
+
+def view_process_tiles_multiprocess(view, tiles, stats=None):
+    """Renders a list of tiles using a pool of worker processes, writing
+    each to the view's output as it is completed. The render pool attached
+    to the view's scene is used if there is one, otherwise a pool is started
+    for this render only.
+
+     :param view: The view to render
+     :param tiles: a list of tiles
+     :param stats: render statistics to add the statistics of the tiles to,
+                   or None if they are not collected
+     """
+
+    if 'MaxProcesses' in view[VIEW_MULTIPROCESS_OPTIONS]:
+        max_processes = view[VIEW_MULTIPROCESS_OPTIONS]['MaxProcesses']
+    else:
+        max_processes = 0
+
+    scene_obj = view[VIEW_SCENE]
+    view_name = scene_obj.get_view_name(view)
+
+    if view_name is None:
+        view_process_tiles_multiprocess_unregistered(
+            view, tiles, max_processes, stats)
+        return
+
+    pool = scene_obj.get_render_pool()
+    temporary_pool = pool is None
+    if temporary_pool:
+        pool = raytracer.render_pool.RenderPool(max_processes)
 
-    # Seems to unable to pass PIL object 
+    output_handle = view[VIEW_OUTPUT].get_worker_handle()
+
+    try:
+        pool.load_scene(scene_obj)
+        for tile, buffer, tile_stats in pool.render_tiles(
+                view_name, tiles, output_handle, stats is not None):
+            if buffer is not None:
+                view[VIEW_OUTPUT].set_tile(tile, buffer)
+            render_stats_merge(stats, tile_stats)
+    finally:
+        if temporary_pool:
+            pool.close()
+
+
+def view_process_tiles_multiprocess_unregistered(view, tiles, max_processes,
+                                                 stats=None):
+    """Renders a list of tiles for a view that has not been added to its
+    scene, using a pool of worker processes started for this render only. The
+    view, and the scene with it, is sent with each tile.
+
+     :param view: The view to render
+     :param tiles: a list of tiles
+     :param max_processes: the number of worker processes, or 0 for one per
+                           CPU
+     :param stats: render statistics to add the statistics of the tiles to,
+                   or None if they are not collected
+     """
+
+    if max_processes <= 0:
+        max_processes = mp.cpu_count()
+
+    # Seems to unable to pass PIL object
     output = view[VIEW_OUTPUT]
-    pool = view[VIEW_MULTIPROCESS_POOL]
+    output_handle = output.get_worker_handle()
     view[VIEW_OUTPUT] = None
-    view[VIEW_MULTIPROCESS_POOL] = None
-    colours = pool.map(view_pp_render_pixel, queue)
-   
-    view[VIEW_OUTPUT] = output
-    view[VIEW_MULTIPROCESS_POOL] = pool
-    
-    for clr, queue_item in zip (colours, queue):
-        view[VIEW_OUTPUT].set_pixel(queue_item[3], queue_item[4], clr)
-    
-    del queue[:] #empty the list
+    render_stats_options = view[VIEW_RENDER_STATS]
+    view[VIEW_RENDER_STATS] = None
+
+    pool = mp.Pool(max_processes, precision_set_backend,
+                   (precision_get_backend(),))
+
+    try:
+        for tile, buffer, tile_stats in pool.imap_unordered(
+                view_pp_render_tile,
+                [(view, tile, output_handle, stats is not None)
+                 for tile in tiles]):
+            if buffer is not None:
+                output.set_tile(tile, buffer)
+            render_stats_merge(stats, tile_stats)
+    finally:
+        pool.close()
+        pool.join()
+        view[VIEW_OUTPUT] = output
+        view[VIEW_RENDER_STATS] = render_stats_options
+
+
+def view_pp_render_tile(queue_item):
+    """Renders a tile in a worker process.
+
+     :param queue_item: a tuple of the view, the tile to render, the
+                        output's worker handle or None, and whether to
+                        collect render statistics
+     :return: a tuple of the tile, its tile buffer or None if the tile was
+              written to the output by the worker, and the render
+              statistics of the tile or None
+     """
+    view, tile, output_handle, collect_stats = queue_item
 
-def view_pp_render_pixel(queue_item):
-    view, view_scan_x, view_scan_y, physical_x, physical_y, force_aa = \
-        queue_item
-    
-    clr = view_render_pixel(view, view_scan_x, view_scan_y)
+    buffer, stats = view_render_tile_with_stats(view, tile, collect_stats)
+    if output_handle is not None:
+        output_write_tile(output_handle, tile, buffer)
+        return (tile, None, stats)
 
-    return clr
+    return (tile, buffer, stats)
 
 
 def view_create_look_at (